@@ -0,0 +1,181 @@
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from processing import load_recipe
+from processing.chain import ProcessingChain
+from video.ffmpeg_writer import FFmpegWriter, CODECS, DEFAULT_CODEC, DEFAULT_CRF, DEFAULT_PRESET, DEFAULT_THREADS
+from video.memo import FrameMemo
+from processing.tiling import (open_image_source, image_pixels, process_tiled, DEFAULT_MEMORY_BUDGET,
+                               TILED_THRESHOLD_PIXELS, TILED_OUTPUT_EXTENSIONS)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".ppm")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov")
+
+logger = logging.getLogger(__name__)
+
+# ワーカープロセスごとに一度だけ読み込むレシピ
+_processor = None
+_tile_memory_budget = DEFAULT_MEMORY_BUDGET
+_encoder_options = {}
+_memo_threshold = None
+
+
+def _init_worker(recipe_path, tile_memory_budget=DEFAULT_MEMORY_BUDGET, encoder_options=None, memo_threshold=None):
+    global _processor, _tile_memory_budget, _encoder_options, _memo_threshold
+    # cv2 で読むBGRの画像をそのまま処理する
+    _processor = ProcessingChain([load_recipe(recipe_path)], channel_order="BGR")
+    _tile_memory_budget = tile_memory_budget
+    _encoder_options = encoder_options or {}
+    _memo_threshold = memo_threshold
+
+
+def process_image(processor, input_path, output_path, tile_memory_budget=DEFAULT_MEMORY_BUDGET):
+    pixels = image_pixels(input_path)
+    if pixels > TILED_THRESHOLD_PIXELS and output_path.lower().endswith(TILED_OUTPUT_EXTENSIONS):
+        # 巨大な画像は帯ごとに処理してメモリ使用量を予算内に抑える
+        process_tiled(open_image_source(input_path), output_path, processor, tile_memory_budget)
+        return 1, pixels
+
+    image = cv2.imread(input_path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise IOError(f"Cannot read image: {input_path}")
+    processed = processor.apply(image)
+    if not cv2.imwrite(output_path, processed):
+        raise IOError(f"Cannot write image: {output_path}")
+    return 1, image.shape[0] * image.shape[1]
+
+
+def process_video(processor, input_path, output_path, encoder_options=None, memo_threshold=None):
+    # 処理済みフレームを ffmpeg へ流し込み、元の音声はそのままコピーする。
+    # memo_threshold を渡すと重複フレームの処理結果を使い回し、使い回した割合も返す
+    capture = cv2.VideoCapture(input_path)
+    if not capture.isOpened():
+        raise IOError(f"Cannot open video: {input_path}")
+    width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    out = FFmpegWriter(output_path, width, height, fps, audio_source=input_path, **(encoder_options or {}))
+
+    memo = FrameMemo(processor, memo_threshold) if memo_threshold is not None else None
+    apply = memo.apply if memo is not None else processor.apply
+    frames = 0
+    try:
+        while True:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            out.write(apply(frame))
+            frames += 1
+        out.release()
+    except BaseException:
+        # release() の例外で元の例外が隠れないよう、ffmpeg を止めて書きかけのファイルを消すだけにする
+        out.abort()
+        raise
+    finally:
+        capture.release()
+    return frames, frames * width * height, memo.hit_rate if memo is not None else None
+
+
+def _process_file(input_path, output_path):
+    start = time.perf_counter()
+    hit_rate = None
+    if input_path.lower().endswith(VIDEO_EXTENSIONS):
+        frames, pixels, hit_rate = process_video(_processor, input_path, output_path, _encoder_options,
+                                                 _memo_threshold)
+    else:
+        frames, pixels = process_image(_processor, input_path, output_path, _tile_memory_budget)
+    return frames, pixels, time.perf_counter() - start, hit_rate
+
+
+def collect_files(input_dir, output_dir, suffix, recursive):
+    jobs = []
+    for dir_path, dir_names, file_names in os.walk(input_dir):
+        if not recursive:
+            dir_names.clear()
+        for file_name in sorted(file_names):
+            if not file_name.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS):
+                continue
+            input_path = os.path.join(dir_path, file_name)
+            relative_dir = os.path.relpath(dir_path, input_dir)
+            base, ext = os.path.splitext(file_name)
+            output_path = os.path.join(output_dir, relative_dir, f"{base}{suffix}{ext}")
+            jobs.append((input_path, os.path.normpath(output_path)))
+    return jobs
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Apply a saved processing recipe to folders of images and videos.")
+    parser.add_argument("recipe", help="recipe file saved from the GUI (save recipe), a tone curve preset or a .cube 3D LUT")
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of files processed concurrently")
+    parser.add_argument("-r", "--recursive", action="store_true", help="also process subdirectories")
+    parser.add_argument("--suffix", default="_processed", help="suffix added to output file names")
+    parser.add_argument("--overwrite", action="store_true", help="overwrite existing output files")
+    parser.add_argument("--codec", choices=CODECS, default=DEFAULT_CODEC, help="video codec")
+    parser.add_argument("--crf", type=int, default=DEFAULT_CRF, help="video quality (libx264/libx265)")
+    parser.add_argument("--preset", default=DEFAULT_PRESET, help="encoder preset (libx264/libx265)")
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS, help="encoder threads (0: auto)")
+    parser.add_argument("--tile-budget", type=int, default=DEFAULT_MEMORY_BUDGET // 1024 ** 2,
+                        help="memory budget in MB for very large stills (processed in strips)")
+    parser.add_argument("--memo-threshold", type=float, default=None,
+                        help="reuse the previous result for repeated video frames whose mean absolute difference "
+                             "is at most this value (0: identical frames only, output unchanged)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # レシピが読めるかを先に確認する
+    load_recipe(args.recipe)
+
+    jobs = collect_files(args.input_dir, args.output_dir, args.suffix, args.recursive)
+    if not args.overwrite:
+        jobs = [(src, dst) for src, dst in jobs if not os.path.exists(dst)]
+    if not jobs:
+        logger.info("No files to process.")
+        return 0
+    for _, output_path in jobs:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    encoder_options = {"codec": args.codec, "crf": args.crf, "preset": args.preset, "threads": args.threads}
+    failures = 0
+    total_frames = 0
+    total_pixels = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs), initializer=_init_worker,
+                             initargs=(args.recipe, args.tile_budget * 1024 ** 2, encoder_options,
+                                       args.memo_threshold)) as executor:
+        futures = {executor.submit(_process_file, src, dst): src for src, dst in jobs}
+        for done, future in enumerate(as_completed(futures), start=1):
+            input_path = futures[future]
+            name = os.path.relpath(input_path, args.input_dir)
+            try:
+                frames, pixels, seconds, hit_rate = future.result()
+            except Exception as e:
+                failures += 1
+                logger.error(f"[{done}/{len(jobs)}] {name}: FAILED ({e})")
+                continue
+            total_frames += frames
+            total_pixels += pixels
+            seconds = max(seconds, 1e-9)
+            reused = "" if hit_rate is None else f", {hit_rate * 100:.0f}% reused"
+            logger.info(f"[{done}/{len(jobs)}] {name}: {frames} frame(s) in {seconds:.2f}s "
+                        f"({frames / seconds:.1f} fps, {pixels / seconds / 1e6:.1f} MP/s{reused})")
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    logger.info(f"Processed {len(jobs) - failures}/{len(jobs)} file(s), {total_frames} frame(s) in {elapsed:.2f}s "
+                f"({total_frames / elapsed:.1f} fps, {total_pixels / elapsed / 1e6:.1f} MP/s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
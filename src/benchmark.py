@@ -0,0 +1,364 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import cv2
+import numpy as np
+
+from display import DisplayEngine, make_proxy, proxy_size, FAST, QUALITY
+from processing.chain import ProcessingChain
+from processing.lut3d import Lut3DProcessor, bake_lut3d
+from processing.sharpening import SharpeningProcessor
+from processing.tonecurve import TonecurveProcessor, CHANNELS
+from video.ffmpeg_writer import FFmpegWriter
+from video.pipeline import ParallelFramePipeline, DEFAULT_WORKERS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 測り方や case の中身を変えたら上げる（版の違う結果とは比べない）
+BENCHMARK_VERSION = 3
+# 標準の入力サイズ（幅, 高さ）
+SIZES = {
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+    "24mp": (6000, 4000),
+}
+IMAGE_CASES = ("tonecurve", "sharpening", "chain", "lut3d", "preview", "display_fast", "display")
+EXPORT_CASES = ("export_serial", "export_parallel")
+CASES = IMAGE_CASES + EXPORT_CASES
+# 動画の書き出しは静止画サイズでは測らない
+VIDEO_SIZES = ("1080p", "4k")
+DISPLAY_CANVAS = (1280, 720)
+DEFAULT_REPEAT = 20
+DEFAULT_WARMUP = 3
+DEFAULT_VIDEO_FRAMES = 60
+# 書き出しの case で tracemalloc を付けて測り直すフレーム数
+MEMORY_PASS_FRAMES = 15
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+# トーンカーブ画面と同じキャンバス座標（y は上下反転）の S 字カーブ
+S_CURVE = [(0, 255), (64, 207), (192, 47), (255, 0)]
+
+
+def synthetic_image(width, height, seed=0):
+    # なめらかなグラデーションにノイズを重ねた RGB 画像。seed が同じなら毎回同じ画像になる
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.empty((height, width, 3), dtype=np.float32)
+    image[..., 0] = x
+    image[..., 1] = y
+    image[..., 2] = (x + y) / 2
+    image += rng.normal(0, 12, image.shape).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def synthetic_video(path, width, height, frames, fps=30):
+    # 1枚の画像を少しずつずらしたフレームで動画を作る（音声なし）
+    base = synthetic_image(width, height)
+    writer = FFmpegWriter(path, width, height, fps, preset="ultrafast")
+    try:
+        for i in range(frames):
+            writer.write(np.roll(base, i * 4, axis=1))
+    finally:
+        writer.release()
+
+
+def make_processors():
+    tonecurve = TonecurveProcessor.from_curve_points({channel: S_CURVE for channel in CHANNELS})
+    sharpening = SharpeningProcessor.from_k(2)
+    return tonecurve, sharpening
+
+
+def percentile_summary(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "mean": float(latencies.mean()),
+        "p50": float(np.percentile(latencies, 50)),
+        "p90": float(np.percentile(latencies, 90)),
+        "p99": float(np.percentile(latencies, 99)),
+        "min": float(latencies.min()),
+        "max": float(latencies.max()),
+    }
+
+
+def reset_peak_rss():
+    # Linux では入力の準備で増えた分を除けるように、ピーク（VmHWM）を今の使用量まで戻す
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    # Linux は reset_peak_rss() からのピーク（VmHWM）。それ以外はプロセスが始まってからのピークで、
+    # case ごとに別プロセスで測るので、その case（と入力の準備）のピークになる
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def measure(func, repeat, warmup):
+    # 時間は tracemalloc なしで測り（確保のたびの負担が時間に入らないように）、
+    # その後に1回だけ tracemalloc を付けて numpy の確保のピークを測る。
+    # OpenCV 内部の確保は追えないので RSS のピークも記録する
+    reset_peak_rss()
+    for _ in range(warmup):
+        func()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return latencies, traced_peak(func)
+
+
+def traced_peak(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_image_case(case, size_name, repeat, warmup):
+    width, height = SIZES[size_name]
+    image = synthetic_image(width, height)
+    tonecurve, sharpening = make_processors()
+
+    if case == "tonecurve":
+        out = np.empty_like(image)
+        func = lambda: tonecurve.apply(image, out=out)
+    elif case == "sharpening":
+        out = np.empty_like(image)
+        func = lambda: sharpening.apply(image, out=out)
+    elif case == "chain":
+        chain = ProcessingChain([tonecurve, sharpening])
+        func = lambda: chain.apply(image)
+    elif case == "lut3d":
+        # 3D LUTを挟んだ色の変換。何段あっても1枚の3D LUTにまとまる（表の作成はウォームアップに含まれる）
+        chain = ProcessingChain([tonecurve, Lut3DProcessor(bake_lut3d(tonecurve)), tonecurve])
+        out = np.empty_like(image)
+        func = lambda: chain.apply(image, out=out)
+    elif case == "preview":
+        # 表示用プロキシへの縮小だけを測る（縮小が要らないサイズは run() で飛ばす）
+        func = lambda: make_proxy(image, *DISPLAY_CANVAS)
+    elif case in ("display_fast", "display"):
+        # 表示エンジンの合成部分（PhotoImage への書き込みは Tk が必要なので含めない）。
+        # display_fast は操作中、display は操作が止まった後の描画
+        engine = DisplayEngine()
+        engine.set_image(image)
+        quality = FAST if case == "display_fast" else QUALITY
+        func = lambda: engine.compose(*DISPLAY_CANVAS, quality=quality)
+    else:
+        raise ValueError(f"Unknown case: {case}")
+
+    latencies, traced_peak = measure(func, repeat, warmup)
+    summary = percentile_summary(latencies)
+    return {
+        "latency_ms": summary,
+        "throughput_fps": 1000 / summary["mean"],
+        "throughput_mps": width * height / 1e6 * 1000 / summary["mean"],
+        "traced_peak_mb": traced_peak / 1024 ** 2,
+    }
+
+
+def export_video(case, chain, source_path, output_path, workers, frame_limit=None):
+    # source_path を chain で処理して書き出し、(フレーム数, 秒, フレームごとの秒) を返す
+    capture = cv2.VideoCapture(source_path)
+    total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    if frame_limit is not None:
+        total_frames = min(total_frames, frame_limit)
+    width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    writer = FFmpegWriter(output_path, width, height, capture.get(cv2.CAP_PROP_FPS), preset="ultrafast")
+    latencies = []
+    start = time.perf_counter()
+    try:
+        if case == "export_parallel":
+            ParallelFramePipeline(chain, workers=workers).run(capture, writer, total_frames)
+        else:
+            # _process_on_frames の直列パスと同じ、デコード → 処理 → エンコードを1フレームずつ
+            for _ in range(total_frames):
+                frame_start = time.perf_counter()
+                ret, frame = capture.read()
+                if not ret:
+                    break
+                writer.write(chain(frame))
+                latencies.append(time.perf_counter() - frame_start)
+    finally:
+        capture.release()
+        writer.release()
+    return total_frames, time.perf_counter() - start, latencies
+
+
+def bench_export_case(case, size_name, frames, work_dir, workers):
+    width, height = SIZES[size_name]
+    source_path = os.path.join(work_dir, f"source_{size_name}.mp4")
+    if not os.path.exists(source_path):
+        synthetic_video(source_path, width, height, frames)
+    output_path = os.path.join(work_dir, f"{case}_{size_name}.mp4")
+    tonecurve, sharpening = make_processors()
+    chain = ProcessingChain([tonecurve, sharpening], channel_order="BGR")
+
+    reset_peak_rss()
+    total_frames, elapsed, latencies = export_video(case, chain, source_path, output_path, workers)
+    # メモリは別に短く書き出して測る（時間には tracemalloc の負担を入れない）
+    traced = traced_peak(lambda: export_video(case, chain, source_path, output_path, workers,
+                                              MEMORY_PASS_FRAMES))
+
+    result = {
+        "frames": total_frames,
+        "elapsed_s": elapsed,
+        "throughput_fps": total_frames / elapsed,
+        "throughput_mps": total_frames * width * height / 1e6 / elapsed,
+        "traced_peak_mb": traced / 1024 ** 2,
+    }
+    if latencies:
+        result["latency_ms"] = percentile_summary(latencies)
+    if case == "export_parallel":
+        result["workers"] = workers
+    return result
+
+
+def environment_info():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "opencv_threads": cv2.getNumThreads(),
+    }
+
+
+def run_case(case, size_name, repeat, warmup, frames, work_dir, workers):
+    # 子プロセスで1つの case を測る
+    if case in EXPORT_CASES:
+        result = bench_export_case(case, size_name, frames, work_dir, workers)
+    else:
+        result = bench_image_case(case, size_name, repeat, warmup)
+    result.update({"case": case, "size": size_name, "peak_rss_mb": peak_rss_mb()})
+    return result
+
+
+def run(cases, sizes, repeat=DEFAULT_REPEAT, warmup=DEFAULT_WARMUP, frames=DEFAULT_VIDEO_FRAMES,
+        workers=DEFAULT_WORKERS, log=print):
+    # ru_maxrss はプロセスの一生でのピークで戻らないので、case ごとに新しいプロセスで測る
+    # （同じプロセスで続けて測ると、後の case が前の case のピークを引き継ぐ）
+    results = []
+    work_dir = tempfile.mkdtemp(prefix="benchmark_")
+    context = multiprocessing.get_context("spawn")
+    try:
+        for case in cases:
+            for size_name in sizes:
+                if case in EXPORT_CASES and size_name not in VIDEO_SIZES:
+                    continue
+                if case == "preview" and proxy_size(*SIZES[size_name], *DISPLAY_CANVAS) is None:
+                    # 1080p は 1280x720 のキャンバスでは縮小されない（プロキシを作らない）ので測るものがない
+                    continue
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(run_case, case, size_name, repeat, warmup, frames, work_dir,
+                                             workers).result()
+                results.append(result)
+                log(format_result(result))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "version": BENCHMARK_VERSION,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "environment": environment_info(),
+        "settings": {"repeat": repeat, "warmup": warmup, "frames": frames, "workers": workers},
+        "results": results,
+    }
+
+
+def format_result(result):
+    text = f"{result['case']:<16} {result['size']:<6} {result['throughput_fps']:8.1f} fps " \
+           f"{result['throughput_mps']:8.1f} MP/s"
+    if "latency_ms" in result:
+        latency = result["latency_ms"]
+        text += f"  p50 {latency['p50']:7.2f}ms  p90 {latency['p90']:7.2f}ms  p99 {latency['p99']:7.2f}ms"
+    return text
+
+
+def compare(baseline, current, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    # 同じ case/size のスループットを比べ、threshold を超えて遅くなったものを返す
+    if baseline.get("version") != current.get("version"):
+        raise ValueError(f"Baseline is benchmark version {baseline.get('version')}, "
+                         f"current is {current.get('version')}; re-run the baseline")
+    baseline_results = {(r["case"], r["size"]): r for r in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        base = baseline_results.get((result["case"], result["size"]))
+        if base is None:
+            continue
+        ratio = result["throughput_fps"] / base["throughput_fps"]
+        rows.append({"case": result["case"], "size": result["size"], "baseline_fps": base["throughput_fps"],
+                     "current_fps": result["throughput_fps"], "ratio": ratio,
+                     "regression": ratio < 1 - threshold})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark processors, preview and video export (headless).")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timed iterations per image case")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP, help="untimed iterations per image case")
+    parser.add_argument("--frames", type=int, default=DEFAULT_VIDEO_FRAMES, help="frames per synthetic video")
+    parser.add_argument("-j", "--workers", type=int, default=DEFAULT_WORKERS, help="workers for export_parallel")
+    parser.add_argument("-o", "--output", help="write results as JSON")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    report = run(args.cases, args.sizes, args.repeat, args.warmup, args.frames, args.workers)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        try:
+            rows = compare(baseline, report, args.threshold)
+        except ValueError as e:
+            print(f"Cannot compare with {args.compare}: {e}")
+            return 2
+        for row in rows:
+            mark = "REGRESSION" if row["regression"] else ""
+            print(f"{row['case']:<16} {row['size']:<6} {row['baseline_fps']:8.1f} -> {row['current_fps']:8.1f} fps "
+                  f"({row['ratio']:.2f}x) {mark}")
+        if any(row["regression"] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+import math
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# 操作中は速い補間で描き、操作が止まってから高品質で描き直すまでの待ち時間
+REFINE_DELAY_MS = 150
+FAST = "fast"
+QUALITY = "quality"
+INTERPOLATION = {FAST: cv2.INTER_LINEAR, QUALITY: cv2.INTER_LANCZOS4}
+
+
+def fit_to_canvas(image_width, image_height, canvas_width, canvas_height, zoom_level=1.0):
+    # アスペクト比を維持してキャンバスに収まるサイズと、中心に置くためのオフセットを返す
+    scale = min(canvas_width / image_width, canvas_height / image_height)
+    new_width = max(1, int(image_width * scale * zoom_level))
+    new_height = max(1, int(image_height * scale * zoom_level))
+    x_offset = (canvas_width - new_width) // 2
+    y_offset = (canvas_height - new_height) // 2
+    return new_width, new_height, x_offset, y_offset
+
+
+def proxy_size(image_width, image_height, canvas_width, canvas_height, zoom_level=1.0):
+    # 表示に必要な倍率を2のべき乗に切り上げたプロキシのサイズ。縮小が不要なら None。
+    # ズームやキャンバスサイズを少し変えただけではプロキシを作り直さずに済む
+    scale = min(canvas_width / image_width, canvas_height / image_height) * zoom_level
+    if scale <= 0:
+        return None
+    scale = 2.0 ** math.ceil(math.log2(scale))
+    if scale >= 1:
+        return None
+    return max(1, int(image_width * scale)), max(1, int(image_height * scale))
+
+
+def make_proxy(image, canvas_width, canvas_height, zoom_level=1.0):
+    # 表示サイズより大きい配列をプロキシの解像度に縮小する。縮小が不要なら None
+    image_height, image_width = image.shape[:2]
+    size = proxy_size(image_width, image_height, canvas_width, canvas_height, zoom_level)
+    if size is None:
+        return None
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def to_rgb(image):
+    # 表示用のバッファは3チャンネルなので、RGBA（アルファは捨てる）とグレースケールをそろえる
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_RGBA2RGB)
+    return image
+
+
+class DisplayEngine:
+    # キャンバスへの表示を受け持つ。
+    #   - 元画像の 1/2, 1/4, ... の縮小版（ピラミッド）を必要になった段だけ作って使い回す
+    #   - キャンバスと同じ大きさのバッファへ、見えている範囲だけを cv2.warpAffine で描く（ズーム時も出力はキャンバス分）
+    #   - PhotoImage とキャンバス上の画像アイテムは1つだけで、中身を書き換える
+    #   - render() は速い補間で描き、操作が止まったら LANCZOS で描き直す
+    def __init__(self, canvas=None, refine_delay_ms=REFINE_DELAY_MS):
+        self.canvas = canvas
+        self.refine_delay_ms = refine_delay_ms
+        self.source = None
+        self.pyramid = []
+        self.buffer = None
+        self.photo = None
+        self.image_item = None
+        self.zoom_level = 1.0
+        self.last_quality = None
+        self._refine_id = None
+
+    def set_image(self, image):
+        # uint8 の配列（RGB。RGBA とグレースケールは表示用に RGB へ直す）。同じ配列なら作ったピラミッドをそのまま使う
+        if image is not self.source:
+            self.source = image
+            self.pyramid = [to_rgb(image)]
+            self.last_quality = None
+
+    def get_level(self, scale):
+        # 表示倍率 scale に対して、表示サイズを下回らない一番小さい段を返す（縮小は最大でも1/2に収まる）
+        level = 0
+        while scale * 2 ** (level + 1) <= 1 and min(self.pyramid[level].shape[:2]) > 1:
+            level += 1
+            if level == len(self.pyramid):
+                previous = self.pyramid[-1]
+                size = (max(1, previous.shape[1] // 2), max(1, previous.shape[0] // 2))
+                self.pyramid.append(cv2.resize(previous, size, interpolation=cv2.INTER_AREA))
+        return self.pyramid[level]
+
+    def compose(self, canvas_width, canvas_height, zoom_level=1.0, quality=FAST):
+        # キャンバス1枚分の RGB 配列を返す（Tk には触らないのでベンチマークからも使える）
+        if self.buffer is None or self.buffer.shape[:2] != (canvas_height, canvas_width):
+            self.buffer = np.zeros((canvas_height, canvas_width, 3), dtype=np.uint8)
+        image_height, image_width = self.source.shape[:2]
+        new_width, new_height, x_offset, y_offset = fit_to_canvas(image_width, image_height, canvas_width,
+                                                                  canvas_height, zoom_level)
+        level = self.get_level(new_width / image_width)
+        scale_x = new_width / level.shape[1]
+        scale_y = new_height / level.shape[0]
+        if quality == FAST:
+            matrix = np.array([[scale_x, 0, x_offset], [0, scale_y, y_offset]], dtype=np.float64)
+            # 画像の外側は黒で埋まるので、前回の描画を消す必要はない
+            cv2.warpAffine(level, matrix, (canvas_width, canvas_height), dst=self.buffer,
+                           flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+        else:
+            self._compose_quality(level, scale_x, scale_y, x_offset, y_offset)
+        return self.buffer
+
+    def _compose_quality(self, level, scale_x, scale_y, x_offset, y_offset):
+        # 見えている範囲を整数画素で切り出して cv2.resize する（warpAffine の LANCZOS より数倍速い）。
+        # 切り出しの端数のぶん、速い描画との位置のずれは 0.5 画素未満
+        canvas_height, canvas_width = self.buffer.shape[:2]
+        level_height, level_width = level.shape[:2]
+        x0 = max(0, int(math.floor(-x_offset / scale_x)))
+        y0 = max(0, int(math.floor(-y_offset / scale_y)))
+        x1 = min(level_width, int(math.ceil((canvas_width - x_offset) / scale_x)))
+        y1 = min(level_height, int(math.ceil((canvas_height - y_offset) / scale_y)))
+        left = int(round(x0 * scale_x + x_offset))
+        top = int(round(y0 * scale_y + y_offset))
+        width = max(1, int(round(x1 * scale_x + x_offset)) - left)
+        height = max(1, int(round(y1 * scale_y + y_offset)) - top)
+        interpolation = cv2.INTER_AREA if scale_x < 1 and scale_y < 1 else INTERPOLATION[QUALITY]
+        resized = cv2.resize(level[y0:y1, x0:x1], (width, height), interpolation=interpolation)
+
+        self.buffer.fill(0)
+        dst_x0, dst_y0 = max(0, left), max(0, top)
+        dst_x1, dst_y1 = min(canvas_width, left + width), min(canvas_height, top + height)
+        self.buffer[dst_y0:dst_y1, dst_x0:dst_x1] = resized[dst_y0 - top:dst_y1 - top, dst_x0 - left:dst_x1 - left]
+
+    def render(self, image=None, zoom_level=None, quality=FAST):
+        if image is not None:
+            self.set_image(image)
+        if zoom_level is not None:
+            self.zoom_level = zoom_level
+        if self.source is None or self.canvas is None:
+            return
+        canvas_width = max(1, self.canvas.winfo_width())
+        canvas_height = max(1, self.canvas.winfo_height())
+        buffer = self.compose(canvas_width, canvas_height, self.zoom_level, quality)
+        self._blit(buffer)
+        self.last_quality = quality
+        if quality == FAST:
+            self._schedule_refine()
+        else:
+            self._cancel_refine()
+
+    def _blit(self, buffer):
+        from PIL import ImageTk
+
+        height, width = buffer.shape[:2]
+        if self.photo is None or (self.photo.width(), self.photo.height()) != (width, height):
+            # キャンバスの大きさが変わったときだけ作り直す
+            self.photo = ImageTk.PhotoImage("RGB", (width, height))
+            if self.image_item is None:
+                self.image_item = self.canvas.create_image(0, 0, anchor="nw", image=self.photo)
+            else:
+                self.canvas.itemconfig(self.image_item, image=self.photo)
+        self.photo.paste(Image.fromarray(buffer))
+
+    def _schedule_refine(self):
+        self._cancel_refine()
+        self._refine_id = self.canvas.after(self.refine_delay_ms, self._refine)
+
+    def _cancel_refine(self):
+        if self._refine_id is not None:
+            self.canvas.after_cancel(self._refine_id)
+            self._refine_id = None
+
+    def _refine(self):
+        self._refine_id = None
+        self.render(quality=QUALITY)
+
+    def clear(self):
+        self._cancel_refine()
+        self.source = None
+        self.pyramid = []
+        if self.image_item is not None:
+            self.canvas.delete(self.image_item)
+            self.image_item = None
+            self.photo = None
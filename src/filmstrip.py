@@ -0,0 +1,86 @@
+import cv2
+import numpy as np
+from PIL import Image
+
+FILMSTRIP_HEIGHT = 48
+MARKER_COLOR = "#ffcc00"
+
+
+def compose_filmstrip(index, width, height=FILMSTRIP_HEIGHT):
+    # 索引の縮小画像をキャンバスの幅に並べた RGB 配列を返す。
+    # 各コマはその位置（時間軸で等間隔）以前で最も近い縮小画像（Tk には触らない）
+    strip = np.zeros((height, width, 3), dtype=np.uint8)
+    if index is None or len(index.thumbnails) == 0 or index.frame_count <= 0:
+        return strip
+    thumb_height, thumb_width = index.thumbnails.shape[1:3]
+    cell_width = max(1, round(thumb_width * height / thumb_height))
+    cells = max(1, -(-width // cell_width))
+    resized = {}
+    for cell in range(cells):
+        frame_index = int((cell + 0.5) / cells * index.frame_count)
+        thumbnail = index.thumbnail_at(frame_index)
+        if thumbnail not in resized:
+            resized[thumbnail] = cv2.resize(index.thumbnails[thumbnail], (cell_width, height),
+                                            interpolation=cv2.INTER_AREA)
+        x0 = cell * cell_width
+        x1 = min(width, x0 + cell_width)
+        strip[:, x0:x1] = resized[thumbnail][:, :x1 - x0]
+    return strip
+
+
+class Filmstrip:
+    # スライダーの上に並べる縮小画像の帯。クリック・ドラッグした位置のフレームを on_seek(frame) で知らせる
+    def __init__(self, canvas, on_seek):
+        self.canvas = canvas
+        self.on_seek = on_seek
+        self.index = None
+        self.frame_count = 0
+        self.current_frame = 0
+        self.photo = None
+        self.image_item = None
+        self.marker_item = None
+        self.canvas.bind("<Configure>", lambda event: self.redraw())
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<B1-Motion>", self._on_click)
+
+    def set_index(self, index):
+        self.index = index
+        self.frame_count = index.frame_count if index is not None else 0
+        self.redraw()
+
+    def set_frame(self, frame_index):
+        self.current_frame = frame_index
+        self._draw_marker()
+
+    def redraw(self):
+        from PIL import ImageTk
+
+        width = max(1, self.canvas.winfo_width())
+        height = max(1, self.canvas.winfo_height())
+        strip = compose_filmstrip(self.index, width, height)
+        if self.photo is None or (self.photo.width(), self.photo.height()) != (width, height):
+            self.photo = ImageTk.PhotoImage("RGB", (width, height))
+            if self.image_item is None:
+                self.image_item = self.canvas.create_image(0, 0, anchor="nw", image=self.photo)
+            else:
+                self.canvas.itemconfig(self.image_item, image=self.photo)
+        self.photo.paste(Image.fromarray(strip))
+        self._draw_marker()
+
+    def _draw_marker(self):
+        if self.frame_count <= 0:
+            return
+        x = (self.current_frame + 0.5) / self.frame_count * max(1, self.canvas.winfo_width())
+        height = self.canvas.winfo_height()
+        if self.marker_item is None:
+            self.marker_item = self.canvas.create_line(x, 0, x, height, fill=MARKER_COLOR, width=2)
+        else:
+            self.canvas.coords(self.marker_item, x, 0, x, height)
+            self.canvas.tag_raise(self.marker_item)
+
+    def _on_click(self, event):
+        if self.frame_count <= 0:
+            return
+        width = max(1, self.canvas.winfo_width())
+        frame_index = int(min(max(event.x, 0), width - 1) / width * self.frame_count)
+        self.on_seek(frame_index)
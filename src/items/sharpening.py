@@ -1,14 +1,16 @@
 import tkinter as tk
 from tkinter import Toplevel, IntVar, HORIZONTAL
 from tkinter.ttk import Scale, Radiobutton, Label
-from PIL import ImageFilter, ImageEnhance
+from processing.base import API_VERSION
+from processing.sharpening import SharpeningProcessor, K_PRESET_RADIUS
 
 class SharpeningWindow:
+    api_version = API_VERSION
+
     def __init__(self, main_app):
         self.window = Toplevel()
         self.window.title("Sharpening Filter")
-        self.original_image = None
-        self.image = None
+        self.original_array = None
         self.main_app = main_app
 
         # 先鋭化のオン/オフを管理する変数
@@ -29,47 +31,62 @@ class SharpeningWindow:
         self.k_value_label = Label(self.window, text=self.scale.get())
         self.k_value_label.pack(fill=tk.X)
 
+        # アンシャープマスクの詳細パラメータ（k を動かすとプリセット値に揃う）
+        self.radius_value = tk.DoubleVar(value=K_PRESET_RADIUS)
+        self.amount_value = tk.DoubleVar(value=0.0)
+        self.threshold_value = tk.DoubleVar(value=0)
+        self.usm_labels = {}
+        for name, variable, from_, to in (("Radius", self.radius_value, 0.3, 10),
+                                          ("Amount", self.amount_value, -1, 5),
+                                          ("Threshold", self.threshold_value, 0, 50)):
+            label = Label(self.window, text=f"{name}: {variable.get():.2f}")
+            label.pack(fill=tk.X)
+            scale = Scale(self.window, from_=from_, to=to, orient=HORIZONTAL, variable=variable,
+                          command=self.func_usm_scale)
+            scale.pack(fill=tk.X)
+            self.usm_labels[name] = (label, variable)
+
         # UIの初期化
         #self.toggle_sharpen()
 
     def func_k_scale(self, k):
+        # k はアンシャープマスクのプリセット（半径固定、強さ k - 1、閾値なし）
+        preset = SharpeningProcessor.from_k(float(k))
+        self.radius_value.set(preset.radius)
+        self.amount_value.set(preset.amount)
+        self.threshold_value.set(preset.threshold)
         self.adjust_sharpen(k)
         self.show_k_value()
 
+    def func_usm_scale(self, value):
+        self.adjust_sharpen(value)
+        self.show_k_value()
+
     def show_k_value(self):
         self.k_value_label["text"] = self.scale.get()
+        for name, (label, variable) in self.usm_labels.items():
+            label["text"] = f"{name}: {variable.get():.2f}"
 
     def adjust_sharpen(self, k):
         if self.sharpen_var.get() == 1:
-            k = float(k)
-            self.image = self.apply_sharpen(k)
-            self.main_app.update_image(self.image)
+            # チェーン全体をメインアプリで再描画する
+            self.main_app.refresh_image()
 
     def toggle_sharpen(self):
-        if self.sharpen_var.get() == 1:
-            self.adjust_sharpen(self.scale.get())
-        else:
-            self.image = self.original_image.copy()
-            self.main_app.update_image(self.image)
+        if self.original_array is not None:
+            self.main_app.refresh_image()
 
-    def apply_sharpen(self, k):
-        enhancer = ImageEnhance.Sharpness(self.original_image)
-        sharpened_image = enhancer.enhance(k)
-        return sharpened_image
+    def get_frame_processor(self):
+        # 現在のパラメータをワーカープロセスへ渡せる形で固定する
+        return SharpeningProcessor(radius=self.radius_value.get(),
+                                   amount=self.amount_value.get(),
+                                   threshold=int(self.threshold_value.get()),
+                                   enabled=self.sharpen_var.get() == 1)
 
-    def set_image(self, image_pil):
-        self.original_image = image_pil.copy()
-        self.image = image_pil.copy()
+    def set_array(self, image):
+        # メインアプリの配列を参照するだけでコピーしない
+        self.original_array = image
 
     def preprocess(self):
         pass
 
-    def apply_process(self):
-        if self.sharpen_var.get() == 1:
-            k = float(self.scale.get())
-            self.image = self.apply_sharpen(k)
-        else:
-            self.image = self.original_image.copy()
-        return self.image
-
-
@@ -1,28 +1,34 @@
 import tkinter as tk
-from tkinter import Toplevel, filedialog, Canvas
+from tkinter import Toplevel, filedialog, Canvas, OptionMenu, StringVar, Listbox
 from tkinter.ttk import Button
 import os
 import numpy as np
-from PIL import Image
-import cv2
-import openpyxl
+from PIL import Image, ImageTk
+from processing.base import API_VERSION
+from processing.tonecurve import CHANNELS, DEFAULT_CURVE_POINTS, INTERPOLATIONS, TonecurveProcessor, generate_lut
+from processing.lut3d import bake_lut3d, write_cube, CUBE_EXTENSION, DEFAULT_LUT3D_SIZE
+from processing.presets import PresetLibrary, load_preset, save_preset, import_xlsx, PRESET_EXTENSION
+from processing.histogram import compute_histogram, remap_histogram, render_histogram
 
-CHANNELS = {"R": 0, "G": 1, "B": 2}
 PARAM_DIR = os.path.join(os.path.dirname(__file__), "tonecurve_params")
 
 class TonecurveWindow:
+    api_version = API_VERSION
+
     def __init__(self, root):
         self.root = root
         self.window = Toplevel()
         self.window.title("Tone Curve Adjustment")
 
         self.luts = [[] for _ in range(3)]
-        self.original_image = None
-
-        self.image_on_canvas = None
+        self.original_array = None
 
         self.hist_canvas = Canvas(self.window, width=768, height=150, bg="black")
         self.hist_canvas.pack(side=tk.TOP)
+        # ヒストグラムは1枚の画像として描き、同じ PhotoImage を書き換える
+        self.source_histogram = None
+        self.hist_photo = ImageTk.PhotoImage("RGB", (768, 150))
+        self.hist_canvas.create_image(0, 0, anchor=tk.NW, image=self.hist_photo)
 
         self.r_canvas = Canvas(self.window, width=256, height=256, bg="white",
                                   #takefocus = True,
@@ -38,6 +44,9 @@ class TonecurveWindow:
         self.g_canvas.pack(side=tk.LEFT)
         self.b_canvas.pack(side=tk.LEFT)
 
+        # 制御点の補間方法（各チャンネル共通）
+        self.interpolation_var = StringVar(value=INTERPOLATIONS[0])
+
         self.tone_curve_adjusters = {
             "R": ToneCurveAdjuster(self, self.r_canvas, "R", "red"),
             "G": ToneCurveAdjuster(self, self.g_canvas, "G", "green"),
@@ -55,100 +64,126 @@ class TonecurveWindow:
         self.load_button = Button(self.window, text="Load", command=self.load_curves)
         self.load_button.pack(side=tk.TOP)
 
+        # 他のソフトで使えるように、今のカーブを3D LUTとして書き出す
+        self.export_cube_button = Button(self.window, text="Export .cube", command=self.export_cube)
+        self.export_cube_button.pack(side=tk.TOP)
+
+        self.interpolation_menu = OptionMenu(self.window, self.interpolation_var, *INTERPOLATIONS,
+                                             command=self.change_interpolation)
+        self.interpolation_menu.pack(side=tk.TOP)
+
         if not os.path.exists(PARAM_DIR):
             os.makedirs(PARAM_DIR)
 
-    def set_image(self, image_pil):
-        self.original_image = np.array(image_pil, dtype=np.uint8)
+        # プリセットは起動時に一度だけ読み込み、選ぶだけで計算済みのLUTを適用する
+        self.preset_library = PresetLibrary(PARAM_DIR)
+        self.preset_list = Listbox(self.window, height=6, exportselection=False)
+        self.preset_list.pack(side=tk.TOP, fill=tk.X)
+        self.preset_list.bind("<<ListboxSelect>>", self.select_preset)
+        self.update_preset_list()
+
+    def set_array(self, image):
+        # メインアプリの配列を参照するだけでコピーしない
+        self.original_array = image
     
     def preprocess(self):
-        self.display_image(self.original_image)
+        # 元画像のヒストグラムは画像が変わったときだけ数える（以降はLUTで写すだけ）
+        self.source_histogram = compute_histogram(self.root.get_preview_array())
         self.draw_histogram()
 
-    def apply_process(self):
-        channels = list(cv2.split(self.original_image))
-        for idx in CHANNELS.values():
-            channels[idx] = cv2.LUT(channels[idx], self.luts[idx])
-        adjusted_image = cv2.merge(channels)
-        return Image.fromarray(adjusted_image)
-
-    def display_image(self, image):
-        self.image_on_canvas = Image.fromarray(image)
-        self.root.update_image(self.image_on_canvas)
+    def get_frame_processor(self):
+        # 現在のLUTをワーカープロセスへ渡せる形で固定する
+        curve_points = {channel: list(adjuster.curve_points)
+                        for channel, adjuster in self.tone_curve_adjusters.items()}
+        return TonecurveProcessor(self.luts, curve_points, self.interpolation_var.get())
 
     def update_lut(self, lut, channel_idx):
         self.luts[channel_idx] = lut
 
     def apply_tone_curve(self, lut, channel_name):
-        if self.original_image is not None:
-            channels = list(cv2.split(self.original_image))
-            channel_idx = CHANNELS[channel_name]
-            self.update_lut(lut, channel_idx)
-            for idx in CHANNELS.values():
-                channels[idx] = cv2.LUT(channels[idx], self.luts[idx])
-            adjusted_image = cv2.merge(channels)
-            self.display_image(adjusted_image)
-            self.draw_histogram(adjusted_image)
+        self.update_lut(lut, CHANNELS[channel_name])
+        if self.original_array is not None:
+            # チェーン全体の再描画はメインアプリに任せ、ここではヒストグラムだけ更新する
+            self.root.refresh_image()
+            self.draw_histogram()
+
+    def change_interpolation(self, interpolation=None):
+        for adjuster in self.tone_curve_adjusters.values():
+            adjuster.update_image()
 
     def reset_curves(self):
         for adjuster in self.tone_curve_adjusters.values():
             adjuster.reset_curve()
-        if self.original_image is not None:
-            self.display_image(self.original_image)
-            self.draw_histogram()
-
-    def draw_histogram(self, image=None):
-        self.hist_canvas.delete("histogram")
-        if image is None:
-            image = self.original_image
-
-        # ヒストグラムを計算
-        hist_r = cv2.calcHist([image], [CHANNELS["R"]], None, [256], [0, 256])
-        hist_g = cv2.calcHist([image], [CHANNELS["G"]], None, [256], [0, 256])
-        hist_b = cv2.calcHist([image], [CHANNELS["B"]], None, [256], [0, 256])
-
-        max_value = max(hist_r.max(), hist_g.max(), hist_b.max())
-        for i in range(256):
-            r_value = int(hist_r[i][0] * 150 / max_value)
-            g_value = int(hist_g[i][0] * 150 / max_value)
-            b_value = int(hist_b[i][0] * 150 / max_value)
 
-            self.hist_canvas.create_line(i*3, 150, i*3, 150-r_value, fill="red", tags="histogram")
-            self.hist_canvas.create_line(i*3+1, 150, i*3+1, 150-g_value, fill="green", tags="histogram")
-            self.hist_canvas.create_line(i*3+2, 150, i*3+2, 150-b_value, fill="blue", tags="histogram")
+    def draw_histogram(self):
+        if self.source_histogram is None:
+            return
+        histogram = remap_histogram(self.source_histogram, self.luts)
+        self.hist_photo.paste(Image.fromarray(render_histogram(histogram, height=150)))
 
     def save_curves(self):
         file_path = filedialog.asksaveasfilename(
                                                 initialdir=PARAM_DIR,
                                                 initialfile="curve_points",
-                                                defaultextension=".xlsx",  # デフォルトの拡張子
-                                                filetypes=[("Parameter Files", "*.xlsx")],
+                                                defaultextension=PRESET_EXTENSION,  # デフォルトの拡張子
+                                                filetypes=[("Preset Files", "*" + PRESET_EXTENSION)],
         )
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.append(["channel", "x", "y"])
-        for channel, adjuster in self.tone_curve_adjusters.items():
-            for points in adjuster.curve_points:
-                ws.append([channel, *points])
-        wb.save(file_path)
+        if not file_path:
+            return
+        processor = self.get_frame_processor()
+        name, _ = os.path.splitext(os.path.basename(file_path))
+        if os.path.abspath(os.path.dirname(file_path)) == os.path.abspath(PARAM_DIR):
+            self.preset_library.save(name, processor)
+            self.update_preset_list()
+        else:
+            save_preset(file_path, processor, name)
+
+    def export_cube(self):
+        file_path = filedialog.asksaveasfilename(initialdir=PARAM_DIR, initialfile="curve_points",
+                                                 defaultextension=CUBE_EXTENSION,
+                                                 filetypes=[("3D LUT Files", "*" + CUBE_EXTENSION)])
+        if not file_path:
+            return
+        write_cube(file_path, bake_lut3d(self.get_frame_processor(), DEFAULT_LUT3D_SIZE))
 
     def load_curves(self):
-        file_path = filedialog.askopenfilename(filetypes=[("Parameter Files", "*.xlsx")],
+        file_path = filedialog.askopenfilename(filetypes=[("Preset Files", "*" + PRESET_EXTENSION),
+                                                          ("Parameter Files", "*.xlsx")],
                                                initialdir=PARAM_DIR)
-        wb = openpyxl.load_workbook(file_path)
-        ws = wb.worksheets[0]
-
-        # set curve points in each adjusters
-        for adjuster in self.tone_curve_adjusters.values():
-            adjuster.curve_points = []
-        for param in ws.iter_rows(min_row=2, values_only=True):
-            channel, x, y = param
-            self.tone_curve_adjusters[channel].curve_points.append([x, y])
-            
-        # make tonecurves
-        for adjuster in self.tone_curve_adjusters.values():
+        if not file_path:
+            return
+        if file_path.lower().endswith(".xlsx"):
+            # 旧形式は制御点から曲線を計算し直す
+            processor = import_xlsx(file_path, self.interpolation_var.get())
+        else:
+            processor = load_preset(file_path)
+        self.apply_preset(processor)
+
+    def update_preset_list(self):
+        self.preset_list.delete(0, tk.END)
+        for name in self.preset_library.names():
+            self.preset_list.insert(tk.END, name)
+
+    def select_preset(self, event=None):
+        selection = self.preset_list.curselection()
+        if selection:
+            self.apply_preset(self.preset_library.get(self.preset_list.get(selection[0])))
+
+    def apply_preset(self, processor):
+        # 保存済みのLUTをそのまま使い、再描画はまとめて1回だけ行う
+        if processor.interpolation in INTERPOLATIONS:
+            self.interpolation_var.set(processor.interpolation)
+        for channel_name, adjuster in self.tone_curve_adjusters.items():
+            idx = CHANNELS[channel_name]
+            points = (processor.curve_points or {}).get(channel_name, DEFAULT_CURVE_POINTS)
+            adjuster.curve_points = [tuple(p) for p in points]
+            adjuster.selected_point = None
+            adjuster.lut = processor.luts[idx].copy()
             adjuster.draw_curve()
-            adjuster.update_image()
+            self.update_lut(adjuster.lut, idx)
+        if self.original_array is not None:
+            self.root.refresh_image()
+            self.draw_histogram()
 
 class ToneCurveAdjuster:
     def __init__(self, parent, canvas, channel_name, color):
@@ -156,7 +191,7 @@ class ToneCurveAdjuster:
         self.canvas = canvas
         self.channel_name = channel_name
         self.color = color
-        self.curve_points = [(0, 255), (255, 0)]
+        self.curve_points = list(DEFAULT_CURVE_POINTS)
         self.selected_point = None
 
         self.canvas.bind("<Button-3>", self.add_point)
@@ -166,36 +201,37 @@ class ToneCurveAdjuster:
         self.canvas.bind("<ButtonRelease-1>", self.update_image)
         self.canvas.bind("<Button-2>", self.delete_selected_point)
         self.canvas.bind("<Double-Button-1>", self.delete_selected_point)
-        self.draw_curve()
         self.lut = self.generate_lut()
+        self.draw_grid()
+        self.draw_curve()
 
     def draw_curve(self):
+        # グリッドは最初に一度だけ描くので、ここでは曲線と制御点だけを描き直す
         self.canvas.delete("curve")
-        self.draw_grid()
+        coords = np.empty((256, 2), dtype=np.int32)
+        coords[:, 0] = np.arange(256)
+        coords[:, 1] = 255 - self.lut
+        self.canvas.create_line(*coords.ravel().tolist(), fill=self.color, tags="curve")
         for i, point in enumerate(self.curve_points):
             x, y = point
             if i == self.selected_point:
                 self.canvas.create_oval(x-4, y-4, x+4, y+4, outline=self.color, fill="white", width=2, tags="curve")
             else:
                 self.canvas.create_oval(x-3, y-3, x+3, y+3, fill=self.color, tags="curve")
-        for i in range(len(self.curve_points) - 1):
-            x1, y1 = self.curve_points[i]
-            x2, y2 = self.curve_points[i + 1]
-            self.canvas.create_line(x1, y1, x2, y2, fill=self.color, tags="curve")
 
     def draw_grid(self):
-        self.canvas.create_rectangle(0, 0, 256, 256, fill="darkgray", tags="curve")
+        self.canvas.create_rectangle(0, 0, 256, 256, fill="darkgray", tags="grid")
         for i in range(0, 256, 10):
             color = "white" if i % 50 == 0 else "lightgray"
-            self.canvas.create_line(i, 0, i, 256, fill=color, tags="curve")
-            self.canvas.create_line(0, i, 256, i, fill=color, tags="curve")
+            self.canvas.create_line(i, 0, i, 256, fill=color, tags="grid")
+            self.canvas.create_line(0, i, 256, i, fill=color, tags="grid")
         for i in range(0, 256, 50):
-            self.canvas.create_text(i, 245, text=str(i), fill="white", tags="curve")
-            self.canvas.create_text(15, 255-i, text=str(i), fill="white", tags="curve")
+            self.canvas.create_text(i, 245, text=str(i), fill="white", tags="grid")
+            self.canvas.create_text(15, 255-i, text=str(i), fill="white", tags="grid")
 
     def add_point(self, event):
         x = max(0, min(255, event.x))
-        y = self.calculate_lut_value(x)
+        y = 255 - int(self.lut[x]) # 現在の曲線上に置く（キャンバス座標）
         self.curve_points.append((x, y))
         self.curve_points.sort()
         self.selected_point = self.curve_points.index((x, y))
@@ -207,11 +243,13 @@ class ToneCurveAdjuster:
             max_x = self.curve_points[self.selected_point + 1][0]
             x = max(min_x, min(max_x, event.x))
             if event.state & 0x4: # Ctrlで分岐
-                y = 255 - self.lut[x]
+                # 動かしている点を除いた曲線の上に乗せる
+                others = self.curve_points[:self.selected_point] + self.curve_points[self.selected_point + 1:]
+                y = 255 - int(generate_lut(others, self.parent.interpolation_var.get())[x])
             else:
                 y = max(0, min(255, event.y))
             self.curve_points[self.selected_point] = (x, y)
-            self.draw_curve()
+            self.update_image()
 
     def move_existing_point(self, event):
         if len(self.curve_points) > 2:
@@ -223,7 +261,7 @@ class ToneCurveAdjuster:
 
             y = max(0, min(255, event.y))
             self.curve_points[self.selected_point] = (x, y)
-            self.draw_curve()
+            self.update_image()
 
     def get_nearest_point(self, x, y):
         min_dist = float('inf')
@@ -237,36 +275,23 @@ class ToneCurveAdjuster:
         return nearest_point
 
     def update_image(self, event=None):
+        # ドラッグ中も毎回LUTを作り直して曲線と画像を更新する
         self.lut = self.generate_lut()
+        self.draw_curve()
         self.parent.apply_tone_curve(self.lut, self.channel_name)
 
     def generate_lut(self):
-        lut = np.zeros(256, dtype=np.uint8)
-        for i in range(256):
-            lut[i] = self.calculate_lut_value(i)
-        return lut
-
-    def calculate_lut_value(self, x):
-        for i in range(len(self.curve_points) - 1):
-            x1, y1 = self.curve_points[i]
-            x2, y2 = self.curve_points[i + 1]
-            y1, y2 = 255 - y1, 255 - y2 # x=yに対して対称
-            if x1 <= x <= x2:
-                t = (x - x1) / (x2 - x1)
-                return int(y1 * (1 - t) + y2 * t)
-        return 0
+        return generate_lut(self.curve_points, self.parent.interpolation_var.get())
 
     def reset_curve(self):
-        self.curve_points = [(0, 255), (255, 0)]
-        self.draw_curve()
+        self.curve_points = list(DEFAULT_CURVE_POINTS)
         self.update_image()
 
     def delete_selected_point(self, event):
         if self.selected_point is not None:
             self.curve_points.pop(self.selected_point)
-            self.draw_curve()
-            self.update_image()
             self.selected_point = None
+            self.update_image()
 
 if __name__ == "__main__":
     # Main application
@@ -1,36 +1,105 @@
+import logging
+import time
+# 起動から最初のウィンドウが出るまでの時間を測る
+START_TIME = time.perf_counter()
+
 from threading import Thread
 import tkinter as tk
-from tkinter import ttk, filedialog, HORIZONTAL, OptionMenu, StringVar, Canvas
-from tkinter.ttk import Frame, Button, Scale
-from PIL import Image, ImageTk
+from tkinter import ttk, filedialog, HORIZONTAL, OptionMenu, StringVar, BooleanVar, Canvas
+from tkinter.ttk import Frame, Button, Scale, Checkbutton
+from PIL import Image
 import cv2
 import os
-import time
+import json
+import shutil
+import tempfile
 import numpy as np
-from moviepy.editor import VideoFileClip
-from moviepy.video.io.VideoFileClip import VideoFileClip
-from moviepy.video.io.ffmpeg_tools import ffmpeg_merge_video_audio
 from ttkthemes import ThemedTk
+from processing import save_recipe
+from processing.base import API_VERSION, LegacyProcessorAdapter
+from processing.chain import ProcessingChain
+from processing.lut3d import Lut3DProcessor, CUBE_EXTENSION
+from processing.tiling import (open_image_source, image_pixels, make_preview, process_tiled,
+                               DEFAULT_MEMORY_BUDGET, DEFAULT_PREVIEW_SIZE, TILED_THRESHOLD_PIXELS,
+                               TILED_OUTPUT_EXTENSIONS)
+from video.playback import PlaybackEngine
+from video.frame_cache import FrameCache, FramePrefetcher, DEFAULT_CACHE_BYTES, DECODED, PROCESSED
+from video.ffmpeg_writer import (FFmpegWriter, CODECS, PRESETS, DEFAULT_CODEC, DEFAULT_CRF, DEFAULT_PRESET,
+                                 DEFAULT_THREADS)
+from plugins import PluginRegistry
+from display import DisplayEngine, make_proxy, proxy_size
+from profiling import FrameProfiler, NULL_PROFILER
+from render_scheduler import RenderScheduler
+from progress import ProgressChannel, DEFAULT_POLL_INTERVAL_MS
+from video.pipeline import ParallelFramePipeline, DEFAULT_WORKERS, DEFAULT_QUEUE_DEPTH, DEFAULT_BATCH_SIZE
+from video.segments import SegmentedExporter
+from video.memo import FrameMemo
+from video.index import VideoIndexer
+from video.checkpoint import ExportCheckpoint, ChunkedWriter, export_params
+from filmstrip import Filmstrip, FILMSTRIP_HEIGHT
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
 IMAGE_DIR = os.path.join(ROOT, "images")
 
+logger = logging.getLogger(__name__)
+
+# 動画の索引ができたかを見に行く間隔
+INDEX_POLL_INTERVAL_MS = 100
+
 class ImageProcessingApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Image and Video Processing Tool")
-        self.processor = None
+        # 有効な処理モジュール（チェーンの順）と、一度開いたモジュールのウィンドウ（閉じても状態を残す）
+        self.processors = {}
+        self.module_windows = {}
+        # チェーンの最後に掛ける .cube の3D LUT（前の色の変換と1枚にまとめられる）
+        self.lut3d_processor = None
+        self.plugins = PluginRegistry(os.path.join(os.path.dirname(__file__), "items"))
         self.original_image = None
+        self.original_array = None
+        # 表示中の処理済み画像（RGB の ndarray）
+        self.image = None
+
+        # 巨大な静止画は縮小画像で編集し、保存時に元ファイルから帯ごとに処理する
+        self.tiled_source = None
+        self.tile_memory_budget = DEFAULT_MEMORY_BUDGET
+
+        # キャンバス解像度に縮小したプレビュー用の元画像（元画像・キャンバスサイズ・ズームが変わるまで使い回す）
+        self.preview_source = None
+        self.preview_key = None
+        self.profiler = NULL_PROFILER
+        self.preview_array = None
+        # プレビューの処理はワーカースレッドで行い、最新の要求だけを表示する
+        self.render_scheduler = RenderScheduler(self.root)
         self.create_widget()
         self.video_capture = None
+        self.playback = None
+        # スクラブ用のデコード済み・処理済みフレームのキャッシュ
+        self.frame_cache_bytes = DEFAULT_CACHE_BYTES
+        self.frame_cache = None
+        self.prefetcher = None
+        # キーフレームの索引と縮小画像（バックグラウンドで作り、動画の横に保存する）
+        self.video_indexer = None
+        self.render_params_key = None
         self.current_frame = 0
         self.playing = False
+        # 再生開始時刻と開始フレーム（壁時計からその時点で表示すべきフレームを決める）
+        self.play_start_time = None
+        self.play_start_frame = 0
         self.zoom_level = 1.0
 
         self.progress_window = None
         self.progress_var = None
         self.progress_bar = None
 
+        # 並列書き出しの設定
+        self.export_workers = DEFAULT_WORKERS
+        self.export_queue_depth = DEFAULT_QUEUE_DEPTH
+        self.export_batch_size = DEFAULT_BATCH_SIZE
+        # ffmpeg のエンコードスレッド数（0 は自動）
+        self.export_threads = DEFAULT_THREADS
+
     def create_widget(self):
         # 左側の編集フレームを作成
         self.edit_frame = Frame(self.root, width=200, height=600)
@@ -43,6 +112,8 @@ class ImageProcessingApp:
         # 画像・映像表示用のキャンバスを作成
         self.canvas = Canvas(self.display_frame, width=600, height=600, bg='black')
         self.canvas.pack(fill=tk.BOTH, expand=True)
+        # キャンバスへの描画（PhotoImage と画像アイテムは使い回す）
+        self.display_engine = DisplayEngine(self.canvas)
 
         # 入力ボタンを編集フレームに追加
         input_button = Button(self.edit_frame, text="入力", command=self.load_image_video)
@@ -56,20 +127,102 @@ class ImageProcessingApp:
         self.fps_var = StringVar(value="30")
         self.fps_menu = OptionMenu(self.edit_frame, self.fps_var, "15", "30", "60")
 
+        # スライダーの上に並べる縮小画像の帯（デフォルトでは非表示）
+        self.filmstrip_canvas = Canvas(self.display_frame, height=FILMSTRIP_HEIGHT, bg='black', highlightthickness=0)
+        self.filmstrip = Filmstrip(self.filmstrip_canvas, self.seek_to_frame)
+
         # フレーム選択用のスライダーを追加（デフォルトでは非表示）
         self.frame_slider = Scale(self.display_frame, from_=0, to=100, orient=HORIZONTAL, command=self.update_frame)
 
+        # フレームキャッシュのヒット率（動画時のみ表示）
+        self.cache_stats_label = tk.Label(self.edit_frame, text="")
+
+        # 操作してから画面に反映されるまでの時間
+        self.render_stats_label = tk.Label(self.edit_frame, text="")
+        self.render_stats_label.pack(side=tk.BOTTOM, pady=5)
+
         # src/items/ディレクトリのスクリプトからボタンを動的に追加
         self.add_processing_buttons()
 
         self.save_as_button = Button(self.edit_frame, text="save as", command=self.save_as)
         self.save_as_button.pack()
 
+        # 現在の処理パラメータをバッチ処理用のレシピとして保存
+        self.save_recipe_button = Button(self.edit_frame, text="save recipe", command=self.save_processing_recipe)
+        self.save_recipe_button.pack(pady=5)
+
+        # .cube の3D LUTを読み込む（キャンセルすると外す）
+        self.lut3d_button = Button(self.edit_frame, text="3D LUT", command=self.load_lut3d)
+        self.lut3d_button.pack(pady=5)
+
+        # 編集中はキャンバス解像度のプロキシで処理する（保存・書き出しは常にフル解像度）
+        self.preview_var = BooleanVar(value=True)
+        self.preview_check = Checkbutton(self.edit_frame, text="プレビュー縮小", variable=self.preview_var,
+                                         command=self.refresh_image)
+        self.preview_check.pack(pady=5)
+
+        # 動画の並列書き出しの切り替え
+        self.parallel_export_var = BooleanVar(value=True)
+        self.parallel_export_check = Checkbutton(self.edit_frame, text="並列書き出し", variable=self.parallel_export_var)
+        self.parallel_export_check.pack(pady=5)
+
+        # キーフレームで区切った区間ごとにエンコードまで並列で行い、最後にストリームコピーでつなぐ（ffmpeg のみ）
+        self.segmented_export_var = BooleanVar(value=False)
+        self.segmented_export_check = Checkbutton(self.edit_frame, text="区間並列書き出し",
+                                                  variable=self.segmented_export_var)
+        self.segmented_export_check.pack(pady=5)
+
+        # 数秒ごとのチャンクに分けて書き、中止や異常終了の後に同じ出力先へ書き出すと続きから再開する（ffmpeg のみ）。
+        # 出力先の横に作業フォルダを作るので、既定は一時ファイルなしの1回の書き出しのままにする
+        self.resumable_export_var = BooleanVar(value=False)
+        self.resumable_export_check = Checkbutton(self.edit_frame, text="再開できる書き出し",
+                                                  variable=self.resumable_export_var)
+        self.resumable_export_check.pack(pady=5)
+
+        # 書き出し・プレビューの各段の時間を記録する（書き出し後にトレースを出力先の横へ保存）
+        self.profile_var = BooleanVar(value=False)
+        self.profile_check = Checkbutton(self.edit_frame, text="プロファイル", variable=self.profile_var,
+                                         command=self.toggle_profiling)
+        self.profile_check.pack(pady=5)
+        # プロファイルに各ステージのメモリのピークも含める（tracemalloc を使うので遅くなる）。
+        # 値が正しいのは直列の書き出しだけで、並列書き出しやプレビューでは他のスレッドの分も入る
+        self.trace_memory_var = BooleanVar(value=False)
+        self.trace_memory_check = Checkbutton(self.edit_frame, text="メモリも計測", variable=self.trace_memory_var)
+        self.trace_memory_check.pack(pady=5)
+
+        # 動画の書き出し設定（ffmpeg: 1回のエンコードで音声はコピー、opencv: 従来の mp4v + 音声の再エンコード）
+        self.export_frame = Frame(self.edit_frame)
+        self.export_frame.pack(pady=5)
+        self.export_backend_var = StringVar(value="ffmpeg")
+        self.export_codec_var = StringVar(value=DEFAULT_CODEC)
+        self.export_preset_var = StringVar(value=DEFAULT_PRESET)
+        self.export_crf_var = tk.IntVar(value=DEFAULT_CRF)
+        tk.Label(self.export_frame, text="Backend").grid(row=0, column=0, sticky=tk.W)
+        OptionMenu(self.export_frame, self.export_backend_var, "ffmpeg", "opencv").grid(row=0, column=1, sticky=tk.EW)
+        tk.Label(self.export_frame, text="Codec").grid(row=1, column=0, sticky=tk.W)
+        OptionMenu(self.export_frame, self.export_codec_var, *CODECS).grid(row=1, column=1, sticky=tk.EW)
+        tk.Label(self.export_frame, text="Preset").grid(row=2, column=0, sticky=tk.W)
+        OptionMenu(self.export_frame, self.export_preset_var, *PRESETS).grid(row=2, column=1, sticky=tk.EW)
+        tk.Label(self.export_frame, text="CRF").grid(row=3, column=0, sticky=tk.W)
+        tk.Spinbox(self.export_frame, from_=0, to=51, width=5, textvariable=self.export_crf_var).grid(row=3, column=1,
+                                                                                                  sticky=tk.W)
+        # 同じフレームが続く動画（画面収録・監視カメラ）では前の処理結果を使い回す。
+        # 差の許容値（平均絶対差）が 0 なら完全に同じフレームだけを使い回すので、出力は変わらない
+        self.memo_var = BooleanVar(value=False)
+        self.memo_threshold_var = tk.DoubleVar(value=0.0)
+        Checkbutton(self.export_frame, text="重複フレームを使い回す", variable=self.memo_var).grid(row=4, column=0,
+                                                                                          columnspan=2, sticky=tk.W)
+        tk.Label(self.export_frame, text="Diff").grid(row=5, column=0, sticky=tk.W)
+        tk.Spinbox(self.export_frame, from_=0, to=32, increment=0.5, width=5,
+                   textvariable=self.memo_threshold_var).grid(row=5, column=1, sticky=tk.W)
+
         # マウスホイールでズーム機能
         self.canvas.bind("<MouseWheel>", self.zoom)
+        self.canvas.bind("<Configure>", self.on_canvas_resize)
 
     def load_image_video(self):
-        self.file_path = filedialog.askopenfilename(filetypes=[("Image and Video Files", "*.jpg *.jpeg *.png *.mp4 *.avi")],
+        self.file_path = filedialog.askopenfilename(filetypes=[("Image and Video Files",
+                                                                 "*.jpg *.jpeg *.png *.tif *.tiff *.bmp *.ppm *.mp4 *.avi")],
                                                initialdir=IMAGE_DIR)
         if not self.file_path:
             return
@@ -80,6 +233,8 @@ class ImageProcessingApp:
             self.play_button.pack(pady=10)
             self.stop_button.pack(pady=10)
             self.fps_menu.pack(pady=10)
+            self.cache_stats_label.pack(pady=5)
+            self.filmstrip_canvas.pack(fill=tk.X)
             self.frame_slider.pack(fill=tk.X, pady=10)
         else:
             self.load_image(self.file_path)
@@ -87,123 +242,363 @@ class ImageProcessingApp:
             self.play_button.pack_forget()
             self.stop_button.pack_forget()
             self.fps_menu.pack_forget()
+            self.cache_stats_label.pack_forget()
+            self.filmstrip_canvas.pack_forget()
             self.frame_slider.pack_forget()
 
     def load_image(self, file_path):
-        self.original_image = Image.open(file_path)
-        if self.processor is not None:
-            self.processor.set_image(self.original_image)
-            self.processor.preprocess()
-        self.display_image(self.original_image)
+        self.close_video()
+        if image_pixels(file_path) > TILED_THRESHOLD_PIXELS:
+            self.tiled_source = open_image_source(file_path)
+            self.original_array = make_preview(self.tiled_source, DEFAULT_PREVIEW_SIZE)
+            self.original_image = None
+        else:
+            self.tiled_source = None
+            image = Image.open(file_path)
+            if image.mode not in ("RGB", "RGBA"):
+                # グレースケールやパレットの画像は RGB にそろえる（大きな画像の読み込みと同じ扱い）
+                image = image.convert("RGB")
+            self.original_image = image
+            self.original_array = np.asarray(image)
+        self.set_processor_images()
+        self.refresh_image()
 
     def load_video(self, file_path):
+        self.close_video()
         self.video_capture = cv2.VideoCapture(file_path)
         self.frame_count = int(self.video_capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.playback = PlaybackEngine(file_path)
+        self.frame_cache = FrameCache(self.frame_cache_bytes)
+        self.prefetcher = FramePrefetcher(file_path, self.frame_cache)
         self.frame_slider.config(to=self.frame_count-1)
         self.current_frame = 0
+        self.frame_slider.set(0)
+        self.filmstrip.set_index(None)
+        self.filmstrip.set_frame(0)
         self.show_frame()
+        # 索引ができるまでは従来どおり OpenCV のシークを使う
+        self.video_indexer = VideoIndexer(file_path)
+        self.root.after(INDEX_POLL_INTERVAL_MS, self.poll_video_index)
+
+    def poll_video_index(self):
+        indexer = self.video_indexer
+        if indexer is None:
+            return
+        if not indexer.done:
+            self.root.after(INDEX_POLL_INTERVAL_MS, self.poll_video_index)
+            return
+        self.video_indexer = None
+        if indexer.error is not None:
+            logger.warning(f"Cannot index video: {indexer.error}")
+            return
+        index = indexer.result
+        if index is None or self.playback is None:
+            return
+        self.playback.set_index(index)
+        self.prefetcher.set_index(index)
+        self.filmstrip.set_index(index)
+
+    def seek_to_frame(self, frame_index):
+        # 縮小画像の帯から。スライダーを動かせば update_frame が呼ばれる
+        self.frame_slider.set(frame_index)
+
+    def close_video(self):
+        self.stop_video()
+        if self.video_indexer is not None:
+            self.video_indexer.cancel()
+            self.video_indexer = None
+        if self.playback is not None:
+            self.playback.close()
+            self.playback = None
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
+        self.frame_cache = None
+        self.render_params_key = None
 
     def display_image(self, image):
-        # キャンバスに収まるように画像をリサイズ（アスペクト比を維持）
-        canvas_width = self.canvas.winfo_width()
-        canvas_height = self.canvas.winfo_height()
-        image_width, image_height = image.size
-
-        # アスペクト比を維持してサイズを調整
-        scale = min(canvas_width / image_width, canvas_height / image_height)
-        new_width = int(image_width * scale * self.zoom_level)
-        new_height = int(image_height * scale * self.zoom_level)
-
-        # 中心に配置するためのオフセット計算
-        x_offset = (canvas_width - new_width) // 2
-        y_offset = (canvas_height - new_height) // 2
-
-        self.image = image.resize((new_width, new_height), Image.LANCZOS)
-        self.tk_image = ImageTk.PhotoImage(self.image)
-
-        # キャンバスをクリアし、背景を黒に設定
-        self.canvas.delete("all")
-        self.canvas.create_rectangle(0, 0, canvas_width, canvas_height, fill='black')
-
-        # 画像をキャンバスの中心に配置
-        self.canvas.create_image(x_offset, y_offset, anchor=tk.NW, image=self.tk_image)
-
-    def show_frame(self):
-        if self.video_capture is not None:
-            self.video_capture.set(cv2.CAP_PROP_POS_FRAMES, self.current_frame)
-            ret, frame = self.video_capture.read()
-            if ret:
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                self.original_image = Image.fromarray(frame)
-                if self.processor is not None:
-                    self.processor.set_image(self.original_image)
-                    self.processor.preprocess()
-                    self.image = self.processor.apply_process()
-                else:
-                    self.image = self.original_image.copy()
-                self.display_image(self.image)
+        # 旧来のモジュールは PIL 画像を渡してくる
+        if isinstance(image, Image.Image):
+            image = np.asarray(image.convert("RGB"))
+        self.display_engine.render(image, self.zoom_level)
+
+    def show_frame(self, frame=None):
+        if self.playback is not None:
+            if frame is None:
+                frame = self.frame_cache.get((DECODED, self.current_frame))
+            if frame is None:
+                # 直前のフレームからの続きなら順に読むだけで、シークはデコーダが必要なときにだけ行う
+                frame = self.playback.get_frame(self.current_frame, timeout=1.0)
+            if frame is not None:
+                self.frame_cache.put((DECODED, self.current_frame), frame)
+                self.original_array = frame
+                # PIL 画像は旧来の処理モジュールが必要とするときにだけ作る
+                self.original_image = None
+                self.set_processor_images()
+                self.refresh_image()
+                self.update_cache_stats()
+
+    def update_cache_stats(self):
+        stats = self.get_cache_stats()
+        if stats is not None:
+            self.cache_stats_label.config(text=f"Cache: {stats['hit_rate'] * 100:.0f}% hit "
+                                               f"({stats['bytes'] / 1024 ** 2:.0f} MB)")
+
+    def get_cache_stats(self):
+        if self.frame_cache is None:
+            return None
+        return self.frame_cache.stats()
 
     def update_frame(self, event=None):
-        if not self.playing:
-            self.current_frame = self.frame_slider.get()
+        frame_index = int(float(self.frame_slider.get()))
+        if frame_index == self.current_frame:
+            # update_video からの set() による呼び出し
+            return
+        self.current_frame = frame_index
+        self.filmstrip.set_frame(frame_index)
+        if self.playing:
+            # 再生中にスライダーを動かしたらその位置から再生し直す
+            self.playback.seek(frame_index)
+            self.play_start_time = time.perf_counter()
+            self.play_start_frame = frame_index
+        else:
             self.show_frame()
+            self.prefetcher.update(frame_index)
 
     def play_video(self):
-        if not self.playing:
+        if not self.playing and self.playback is not None:
             self.playing = True
+            self.play_start_time = time.perf_counter()
+            self.play_start_frame = self.current_frame
             self.update_video()
 
     def stop_video(self):
         self.playing = False
+        if self.prefetcher is not None:
+            self.prefetcher.update(self.current_frame)
 
     def update_video(self):
-        if self.playing and self.video_capture is not None:
-            self.show_frame()
-            self.current_frame += 1
-            if self.current_frame >= self.frame_count:
-                self.current_frame = 0
-            self.frame_slider.set(self.current_frame)
-            fps = int(self.fps_var.get())
-            delay = int(1000 / fps)
-            self.root.after(delay, self.update_video)
+        if not self.playing or self.playback is None:
+            return
+        fps = int(self.fps_var.get())
+        elapsed = time.perf_counter() - self.play_start_time
+        target_frame = self.play_start_frame + int(elapsed * fps)
+        if target_frame >= self.frame_count:
+            # 末尾まで来たら先頭に戻って時計を合わせ直す
+            target_frame = 0
+            self.play_start_time = time.perf_counter()
+            self.play_start_frame = 0
+
+        # 処理が間に合わないときは遅れたフレームを飛ばす（ずれを溜めない）
+        next_deadline = self.play_start_time + (target_frame - self.play_start_frame + 1) / fps
+        if target_frame != self.current_frame or self.image is None:
+            wait = max(0.0, next_deadline - time.perf_counter())
+            frame = self.playback.get_frame(target_frame, timeout=wait)
+            if frame is not None:
+                self.current_frame = target_frame
+                self.filmstrip.set_frame(target_frame)
+                self.show_frame(frame)
+                self.frame_slider.set(self.current_frame)
+
+        delay = max(1, int((next_deadline - time.perf_counter()) * 1000))
+        self.root.after(delay, self.update_video)
 
     def zoom(self, event):
         if event.delta > 0:
             self.zoom_level *= 1.1
         else:
             self.zoom_level *= 0.9
-        if self.image:
+        self.update_display()
+
+    def on_canvas_resize(self, event):
+        self.update_display()
+
+    def update_display(self):
+        # プロキシの解像度が変わるときだけ処理し直し、それ以外は表示だけを描き直す
+        if self.image is None:
+            return
+        if self.preview_var.get() and self.preview_key != self.get_preview_key():
+            self.refresh_image()
+        else:
             self.display_image(self.image)
 
     def add_processing_buttons(self):
-        items_dir = os.path.join(os.path.dirname(__file__), "items")
-        if not os.path.exists(items_dir):
+        # ボタンはマニフェストから作り、モジュールの import は最初に開くときまで遅らせる
+        for plugin in self.plugins:
+            button = Button(self.edit_frame, text=plugin.label, command=lambda m=plugin.module: self.load_processing_module(m))
+            button.pack(pady=5)
+
+    def load_processing_module(self, module_name):
+        # 既に開いているモジュールはウィンドウを前面に出すだけにする
+        if module_name in self.processors:
+            self.processors[module_name].window.lift()
+            return
+        processor = self.module_windows.get(module_name)
+        if processor is None:
+            module_class = self.plugins.get_class(module_name)
+            processor = module_class(self)  # 処理モジュールのクラスを初期化
+            processor.window.protocol("WM_DELETE_WINDOW", lambda m=module_name: self.unload_processing_module(m))
+            self.module_windows[module_name] = processor
+        else:
+            # 閉じたときのパラメータのまま再表示する
+            processor.window.deiconify()
+            processor.window.lift()
+        self.processors[module_name] = processor
+        if self.original_array is not None:
+            self.set_module_image(processor)
+            self.refresh_image()
+
+    def unload_processing_module(self, module_name):
+        # ウィンドウは破棄せずに隠し、チェーンからだけ外す
+        processor = self.processors.pop(module_name, None)
+        if processor is not None:
+            processor.window.withdraw()
+            self.refresh_image()
+
+    def set_processor_images(self):
+        for processor in self.processors.values():
+            self.set_module_image(processor)
+
+    def set_module_image(self, module):
+        # 新しいモジュールには配列をそのまま渡し、旧来のモジュールにだけ PIL 画像を渡す
+        if getattr(module, "api_version", 1) >= API_VERSION:
+            module.set_array(self.original_array)
+        else:
+            module.set_image(self.get_original_image())
+        module.preprocess()
+
+    def get_original_image(self):
+        if self.original_image is None and self.original_array is not None:
+            self.original_image = Image.fromarray(self.original_array)
+        return self.original_image
+
+    def build_chain(self, channel_order="RGB"):
+        # 各モジュールの現在のパラメータからチェーンを組み立てる（LUTは1枚にまとめられる）
+        stages = []
+        for module in self.processors.values():
+            if getattr(module, "api_version", 1) >= API_VERSION:
+                stages.append(module.get_frame_processor())
+            else:
+                stages.append(LegacyProcessorAdapter(module))
+        if self.lut3d_processor is not None:
+            stages.append(self.lut3d_processor)
+        return ProcessingChain(stages, channel_order=channel_order)
+
+    def get_preview_array(self):
+        # 表示サイズより大きい元画像は表示に必要な解像度まで縮小したプロキシを返す
+        image = self.original_array
+        if image is None or not self.preview_var.get():
+            return image
+        key = self.get_preview_key()
+        if self.preview_source is not image or self.preview_key != key:
+            canvas_width = max(1, self.canvas.winfo_width())
+            canvas_height = max(1, self.canvas.winfo_height())
+            self.preview_array = make_proxy(image, canvas_width, canvas_height, self.zoom_level)
+            self.preview_source = image
+            self.preview_key = key
+        if self.preview_array is None:
+            return image
+        return self.preview_array
+
+    def get_preview_key(self):
+        # プロキシのサイズ（2のべき乗単位）。これが変わらない限りズームしても処理し直さない
+        if self.original_array is None:
+            return None
+        image_height, image_width = self.original_array.shape[:2]
+        return proxy_size(image_width, image_height, max(1, self.canvas.winfo_width()),
+                          max(1, self.canvas.winfo_height()), self.zoom_level)
+
+    def refresh_image(self):
+        # プレビュー（またはフル解像度の元画像）にチェーン全体を適用して表示する
+        if self.original_array is None:
+            return
+        chain = self.build_chain()
+        profiler = self.profiler
+        with profiler.stage("preview"):
+            source = self.get_preview_array()
+
+        cache_key = None
+        if self.frame_cache is not None and chain.portable:
+            # 処理パラメータが変わったときだけ処理済みフレームを捨てる
+            params_key = json.dumps(chain.get_params(), sort_keys=True)
+            if params_key != self.render_params_key:
+                self.frame_cache.invalidate_processed()
+                self.render_params_key = params_key
+            cache_key = (PROCESSED, self.current_frame, params_key, source.shape)
+            processed = self.frame_cache.get(cache_key)
+            if processed is not None:
+                self.render_scheduler.cancel()
+                self.show_processed(processed)
+                return
+
+        if not chain.portable:
+            # 旧来のモジュールは Tk のウィンドウに触るのでメインスレッドで処理する
+            self.render_scheduler.cancel()
+            with profiler.stage("process"):
+                processed = chain.apply(source, profiler=profiler)
+            self.show_processed(processed)
             return
 
-        for module_name in os.listdir(items_dir):
-            if module_name.endswith(".py") and module_name != "__init__.py":
-                button_name = module_name.replace(".py", "")
-                button = Button(self.edit_frame, text=button_name.capitalize(), command=lambda m=button_name: self.load_processing_module(m))
-                button.pack(pady=5)
+        # チェーンと入力はここで確定させ、処理だけをワーカースレッドで行う
+        frame_index = self.current_frame
 
-    def load_processing_module(self, module_name):
-        module = __import__(f"items.{module_name}", fromlist=[module_name.capitalize()])
-        module_class = getattr(module, module_name.capitalize() + "Window")
-        self.processor = module_class(self)  # 処理モジュールのクラスを初期化
-        if self.original_image is not None:
-            self.processor.set_image(self.original_image)
-            self.processor.preprocess()
+        def render():
+            with profiler.stage("process", frame_index):
+                return chain.apply(source, profiler=profiler, frame=frame_index)
+
+        self.render_scheduler.submit(render, lambda processed: self.show_processed(processed, cache_key))
+
+    def show_processed(self, processed, cache_key=None):
+        if cache_key is not None and self.frame_cache is not None:
+            self.frame_cache.put(cache_key, processed)
+        self.image = processed
+        with self.profiler.stage("display"):
+            self.display_image(self.image)
+        self.update_render_stats()
+
+    def update_render_stats(self):
+        stats = self.render_scheduler.stats()
+        if stats["last_latency_ms"] is not None:
+            self.render_stats_label.config(text=f"Latency: {stats['last_latency_ms']:.0f} ms "
+                                                f"(avg {stats['average_latency_ms']:.0f} ms)")
 
     def update_image(self, updated_image):
         self.display_image(updated_image)
 
+    def load_lut3d(self):
+        file_path = filedialog.askopenfilename(filetypes=[("3D LUT Files", "*" + CUBE_EXTENSION)],
+                                               initialdir=IMAGE_DIR)
+        try:
+            self.lut3d_processor = Lut3DProcessor.from_cube(file_path) if file_path else None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cannot load 3D LUT {file_path}: {e}")
+            self.lut3d_processor = None
+        self.lut3d_button.config(text=f"3D LUT: {os.path.basename(file_path)}" if self.lut3d_processor else "3D LUT")
+        if self.original_array is not None:
+            self.refresh_image()
+
     def save_as(self):
-        if self.processor:
+        if self.processors or self.lut3d_processor is not None:
             if self.file_path.lower().endswith(('.mp4', '.avi')):
                 self.save_video_as()
             else:
                 self.save_image_as()
 
+    def save_processing_recipe(self):
+        if not self.processors and self.lut3d_processor is None:
+            return
+        chain = self.build_chain()
+        if not chain.portable:
+            logger.warning("Recipes cannot include legacy (PIL) processing modules")
+            return
+        recipe_path = filedialog.asksaveasfilename(initialdir=IMAGE_DIR,
+                                                   initialfile="recipe",
+                                                   defaultextension=".json",
+                                                   filetypes=[("Recipe files", "*.json")],
+            )
+        if recipe_path:
+            save_recipe(recipe_path, chain)
+
     def save_video_as(self):
         output_video_path = filedialog.asksaveasfilename(initialdir=IMAGE_DIR,
                                                             initialfile=f"{os.path.splitext(os.path.basename(self.file_path))[0]}_processed",
@@ -216,59 +611,238 @@ class ImageProcessingApp:
                                                             ]
             )
         if output_video_path:
-            # プログレスバーのウィンドウを作成
-            self.progress_window = ProgressWindow(self.root)
+            # 進捗はチャンネル経由で受け渡し、ウィンドウ側が root.after で定期的に読みに行く
+            progress = ProgressChannel()
+            self.progress_window = ProgressWindow(self.root, progress)
+
+            # 処理パラメータはメインスレッドで確定させてから渡す
+            # cv2 から読んだBGRのフレームを色変換せずにそのまま処理する
+            frame_processor = self.build_chain(channel_order="BGR")
+            # 旧来のモジュールは Tk のウィンドウを抱えていてワーカーへ渡せない
+            parallel = self.parallel_export_var.get() and frame_processor.portable
+            export_settings = self.get_export_settings()
+            export_settings["segmented"] = export_settings["segmented"] and frame_processor.portable
+            # 再開の判定に処理のパラメータを使うので、旧来のモジュールを含むときは1回で書き出す
+            export_settings["resumable"] = export_settings["resumable"] and frame_processor.portable
 
             # 別スレッドで動画処理を実行
-            processing_thread = Thread(target=self._process_on_frames, args=(output_video_path, ))
+            processing_thread = Thread(target=self._process_on_frames,
+                                       args=(output_video_path, frame_processor, parallel, export_settings,
+                                             progress))
             processing_thread.start()
         
-
-    def _process_on_frames(self, output_video_path):
-        # 元の動画を読み込み
-        clip = VideoFileClip(self.file_path)
-        audio = clip.audio  # 音声を保存
-        # 音声を一時ファイルに保存
-        temp_audio_path = os.path.join(IMAGE_DIR, "temp_audio.mp3")
-        audio.write_audiofile(temp_audio_path)
+    def get_export_settings(self):
+        return {
+            "backend": self.export_backend_var.get(),
+            "codec": self.export_codec_var.get(),
+            "crf": self.export_crf_var.get(),
+            "preset": self.export_preset_var.get(),
+            "threads": self.export_threads,
+            "profile": self.profile_var.get(),
+            "trace_memory": self.trace_memory_var.get(),
+            "segmented": self.segmented_export_var.get(),
+            "resumable": self.resumable_export_var.get(),
+            "memo_threshold": self.memo_threshold_var.get() if self.memo_var.get() else None,
+        }
+
+    def toggle_profiling(self):
+        # プレビュー側のプロファイラ。オフに戻したときに集計を表示する
+        if self.profile_var.get():
+            self.profiler = FrameProfiler(trace_memory=self.trace_memory_var.get())
+        else:
+            self.profiler.close()
+            logger.info(self.profiler.format_summary())
+            self.profiler = NULL_PROFILER
+
+    def _process_on_frames(self, output_video_path, frame_processor, parallel=False, export_settings=None,
+                           progress=None):
+        # このメソッドは書き出しスレッドで動くので Tk には触らず、結果は progress に書き込むだけにする
+        if progress is None:
+            progress = ProgressChannel()
+        profile = export_settings is not None and export_settings.get("profile")
+        profiler = FrameProfiler(trace_memory=export_settings.get("trace_memory", False)) if profile else NULL_PROFILER
+        error = None
+        try:
+            self._export_frames(output_video_path, frame_processor, parallel, export_settings, progress, profiler)
+        except Exception as e:
+            error = e
+
+        profiler.close()
+        summary = None
+        if profiler.enabled:
+            # 途中で止まった場合もそこまでの記録は残す
+            trace_path = os.path.splitext(output_video_path)[0] + ".trace.json"
+            profiler.export_chrome_trace(trace_path)
+            summary = profiler.format_summary()
+            logger.info(summary)
+            logger.info(f"Trace saved to {trace_path}")
+        progress.finish(error=error, summary=summary)
+
+    def _export_frames(self, output_video_path, frame_processor, parallel, export_settings, progress, profiler):
+        if export_settings is None:
+            export_settings = {"backend": "ffmpeg", "codec": DEFAULT_CODEC, "crf": DEFAULT_CRF,
+                               "preset": DEFAULT_PRESET, "threads": DEFAULT_THREADS}
+        encoder_options = {"codec": export_settings["codec"], "crf": export_settings["crf"],
+                           "preset": export_settings["preset"], "threads": export_settings["threads"]}
 
         # 動画のプロパティを取得
         width = int(self.video_capture.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(self.video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
         fps = self.video_capture.get(cv2.CAP_PROP_FPS)
         total_frames = int(self.video_capture.get(cv2.CAP_PROP_FRAME_COUNT))
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # 出力フォーマットを指定
 
-        # 動画の書き込み準備
-        temp_output_path = os.path.join(IMAGE_DIR, "temp_output.mp4")
-        out = cv2.VideoWriter(temp_output_path, fourcc, fps, (width, height), isColor=True)
-        
-        self.progress_window.start_timer()
-        
-        for i in range(total_frames):
-            ret, frame = self.video_capture.read()
-            if not ret:
-                break
+        if export_settings.get("segmented") and export_settings["backend"] == "ffmpeg":
+            # 区間ごとに別プロセスでデコードからエンコードまで行う（プロファイルは記録しない）
+            exporter = SegmentedExporter(frame_processor, workers=self.export_workers,
+                                         encoder_options=encoder_options,
+                                         memo_threshold=export_settings.get("memo_threshold"))
+            progress.add_cancel_callback(exporter.cancel)
+            exporter.run(self.file_path, output_video_path, progress=progress)
+            return
 
-            # フレームに画像処理を施す
-            self.processor.set_image(Image.fromarray(frame))
-            processed_frame = np.array(self.processor.apply_process())
-            # 処理後のフレームを出力動画に書き込み
-            out.write(processed_frame)
+        if export_settings.get("resumable") and export_settings["backend"] == "ffmpeg":
+            self._export_checkpointed(output_video_path, frame_processor, parallel, export_settings,
+                                      encoder_options, progress, profiler)
+            return
 
-            # プログレスバーの更新
-            self.progress_window.update_progress(i + 1, total_frames)
+        work_dir = None
+        if export_settings["backend"] == "ffmpeg":
+            # 処理済みフレームを ffmpeg へ直接流し、元の音声は再エンコードせずにコピーする（一時ファイルなし）
+            out = FFmpegWriter(output_video_path, width, height, fps, audio_source=self.file_path, **encoder_options)
+        else:
+            # moviepy は読み込みが重いので、このバックエンドを使うときにだけ import する
+            from moviepy.video.io.VideoFileClip import VideoFileClip
+            # 一時ファイルは書き出しごとの作業フォルダに置く（同時に書き出しても衝突しない）
+            work_dir = tempfile.mkdtemp(prefix=".export_", dir=os.path.dirname(os.path.abspath(output_video_path)))
+            # 元の動画を読み込み
+            clip = VideoFileClip(self.file_path)
+            audio = clip.audio  # 音声を保存
+            # 音声を一時ファイルに保存
+            temp_audio_path = os.path.join(work_dir, "temp_audio.mp3")
+            audio.write_audiofile(temp_audio_path)
+
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # 出力フォーマットを指定
+
+            # 動画の書き込み準備
+            temp_output_path = os.path.join(work_dir, "temp_output.mp4")
+            out = cv2.VideoWriter(temp_output_path, fourcc, fps, (width, height), isColor=True)
+
+        # 再生中のキャプチャとは別に、先頭から読み込むキャプチャを開く
+        capture = cv2.VideoCapture(self.file_path)
+
+        progress.start(total_frames)
+
+        try:
+            self._encode_frames(capture, out, total_frames, frame_processor, parallel, export_settings, progress,
+                                profiler)
+        except BaseException:
+            self._discard_export(out, export_settings, work_dir)
+            raise
+        finally:
+            # リソースを解放
+            capture.release()
+
+        if progress.cancelled:
+            # 中止したときは途中までの出力と一時ファイルを残さない
+            self._discard_export(out, export_settings, work_dir)
+            return
 
-        # リソースを解放
-        #self.video_capture.release()
         out.release()
 
-        # 音声と映像をマージ
-        ffmpeg_merge_video_audio(temp_output_path, temp_audio_path, output_video_path)
-        os.remove(temp_output_path) # 一時ファイルを削除
-        os.remove(temp_audio_path) # 一時ファイルを削除
+        if export_settings["backend"] != "ffmpeg":
+            # 音声と映像をマージ
+            from moviepy.video.io.ffmpeg_tools import ffmpeg_merge_video_audio
+            try:
+                ffmpeg_merge_video_audio(temp_output_path, temp_audio_path, output_video_path)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True) # 一時ファイルを削除
+
+    def _export_checkpointed(self, output_video_path, frame_processor, parallel, export_settings, encoder_options,
+                             progress, profiler):
+        # 数秒ごとのチャンクに分けて書き、閉じたチャンクから作業フォルダの manifest に記録する。
+        # 中止・異常終了しても、同じ設定で同じ出力先へ書き出し直せば終わったチャンクを飛ばして続きから再開する
+        checkpoint = ExportCheckpoint.open(self.file_path, output_video_path,
+                                           export_params(frame_processor, encoder_options,
+                                                         export_settings.get("memo_threshold")))
+        progress.advance(checkpoint.frames_done())
+        progress.start(checkpoint.frame_count)
+
+        capture = cv2.VideoCapture(self.file_path)
+        try:
+            for first, last in checkpoint.pending_runs():
+                start = checkpoint.chunks[first][0]
+                end = checkpoint.chunks[last][1]
+                if start != int(capture.get(cv2.CAP_PROP_POS_FRAMES)):
+                    # チャンクはキーフレームから始まるので、シーク先は正確に決まる
+                    capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+                out = ChunkedWriter(checkpoint, first, last, encoder_options)
+                try:
+                    self._encode_frames(capture, out, end - start, frame_processor, parallel, export_settings,
+                                        progress, profiler)
+                except BaseException:
+                    out.abort()
+                    raise
+                if progress.cancelled:
+                    # 書きかけのチャンクだけを捨て、終わったチャンクは次回のために残す
+                    out.abort()
+                    return
+                out.release()
+        finally:
+            capture.release()
+
+        checkpoint.finalize(output_video_path, audio_source=self.file_path)
+
+    def _encode_frames(self, capture, out, frame_count, frame_processor, parallel, export_settings, progress,
+                       profiler):
+        # capture から frame_count フレームを読み、処理して out へ書く（中止されたらそこで戻る）
+        if parallel:
+            pipeline = ParallelFramePipeline(frame_processor,
+                                             workers=self.export_workers,
+                                             queue_depth=self.export_queue_depth,
+                                             batch_size=self.export_batch_size,
+                                             memo_threshold=export_settings.get("memo_threshold"))
+            progress.add_cancel_callback(pipeline.cancel)
+            pipeline.run(capture, out, frame_count, progress=progress, profiler=profiler)
+            return
+
+        memo = None
+        if export_settings.get("memo_threshold") is not None:
+            memo = FrameMemo(frame_processor, export_settings["memo_threshold"])
+        for i in range(frame_count):
+            if progress.cancelled:
+                break
+            start = time.perf_counter()
+            with profiler.stage("decode", i):
+                ret, frame = capture.read()
+            if not ret:
+                break
+            decoded = time.perf_counter()
 
-        self.progress_window.show_complete()
+            # フレームに画像処理を施す
+            with profiler.stage("process", i):
+                if memo is not None:
+                    processed_frame = memo.apply(frame, profiler=profiler, frame=i)
+                else:
+                    processed_frame = frame_processor.apply(frame, profiler=profiler, frame=i)
+            processed = time.perf_counter()
+            # 処理後のフレームを出力動画に書き込み
+            with profiler.stage("encode", i):
+                out.write(processed_frame)
+
+            progress.add_stage_time("decode", decoded - start)
+            progress.add_stage_time("process", processed - decoded)
+            progress.add_stage_time("encode", time.perf_counter() - processed)
+            if memo is not None:
+                progress.add_memo_stats(*memo.drain())
+            progress.advance()
+
+    def _discard_export(self, out, export_settings, work_dir=None):
+        if export_settings["backend"] == "ffmpeg":
+            out.abort()
+            return
+        out.release()
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
 
     def save_image_as(self):
         output_image_path = filedialog.asksaveasfilename(initialdir=IMAGE_DIR,
@@ -281,18 +855,36 @@ class ImageProcessingApp:
                                                             ("All files", "*.*"),
                                                         ],
             )
-        processed_image = np.array(self.processor.apply_process())
-        processed_image = cv2.cvtColor(processed_image, cv2.COLOR_RGB2BGR)
+        if not output_image_path:
+            return
+        chain = self.build_chain()
+        if self.tiled_source is not None:
+            # 旧来のモジュールは近傍の幅がわからないので帯ごとには処理しない
+            if output_image_path.lower().endswith(TILED_OUTPUT_EXTENSIONS) and chain.portable:
+                # 帯ごとに読み・処理・書き出しをして、メモリ使用量を予算内に抑える
+                process_tiled(self.tiled_source, output_image_path, chain, self.tile_memory_budget)
+                return
+            # 帯ごとに書けない形式や旧来のモジュールでは全体を読んで処理する（メモリの予算は守れない）
+            source_array = self.tiled_source.read_rows(0, self.tiled_source.height)
+        else:
+            source_array = self.original_array
+        processed_image = chain.apply(source_array)
+        # RGBA の画像はアルファも残す（JPEG は cv2 がアルファを落として書く）
+        conversion = cv2.COLOR_RGBA2BGRA if processed_image.ndim == 3 and processed_image.shape[2] == 4             else cv2.COLOR_RGB2BGR
+        processed_image = cv2.cvtColor(processed_image, conversion)
         cv2.imwrite(output_image_path, processed_image)
 
 class ProgressWindow:
-    def __init__(self, root, title="Processing Progress"):
+    # ProgressChannel を一定間隔で読んで表示を更新する。Tk の操作はすべてメインスレッドの after から行う
+    def __init__(self, root, progress, title="Processing Progress", interval_ms=DEFAULT_POLL_INTERVAL_MS):
         self.root = root
-        self.start_time = None
+        self.progress = progress
+        self.interval_ms = interval_ms
 
         # 新しいウィンドウを作成
         self.progress_window = tk.Toplevel(self.root)
         self.progress_window.title(title)
+        self.progress_window.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # プログレスバーを作成
         self.progress_var = tk.DoubleVar()
@@ -303,46 +895,94 @@ class ProgressWindow:
         self.elapsed_time_label = tk.Label(self.progress_window, text="Elapsed Time: 0s")
         self.elapsed_time_label.pack(pady=5)
 
-        self.estimated_time_label = tk.Label(self.progress_window, text="Estimated Remaining Time: 0s")
+        self.estimated_time_label = tk.Label(self.progress_window, text="Estimated Remaining Time: -")
         self.estimated_time_label.pack(pady=5)
 
         # 現在のフレーム番号とトータルフレーム数を表示するラベル
         self.current_frame_label = tk.Label(self.progress_window, text="Frame: 0/0")
         self.current_frame_label.pack(pady=5)
 
-        # 1フレーム当たりの平均処理時間を表示するラベル
-        self.avg_time_per_frame_label = tk.Label(self.progress_window, text="Avg. Time per Frame: 0s")
-        self.avg_time_per_frame_label.pack(pady=5)
+        # 直近の処理速度（指数移動平均）
+        self.fps_label = tk.Label(self.progress_window, text="Speed: 0.0 fps")
+        self.fps_label.pack(pady=5)
+
+        # デコード・処理・エンコードそれぞれの1フレーム当たりの時間
+        self.stage_time_label = tk.Label(self.progress_window, text="Decode: - / Process: - / Encode: -")
+        self.stage_time_label.pack(pady=5)
 
         # 終了を示すラベル
         self.complete_label = tk.Label(self.progress_window, text="")
         self.complete_label.pack(pady=5)
 
-    def start_timer(self):
-        self.start_time = time.time()
+        # プロファイルの集計（有効なときだけ）
+        self.summary_label = tk.Label(self.progress_window, text="", font=("Courier", 9), justify=tk.LEFT)
+        self.summary_label.pack(padx=10, pady=5)
+
+        self.cancel_button = ttk.Button(self.progress_window, text="Cancel", command=self.cancel)
+        self.cancel_button.pack(pady=5)
 
-    def update_progress(self, current_frame, total_frames):
-        elapsed_time = time.time() - self.start_time
-        avg_time_per_frame = elapsed_time / current_frame
-        remaining_time = avg_time_per_frame * (total_frames - current_frame)
+        self._after_id = self.progress_window.after(self.interval_ms, self.poll)
+
+    def poll(self):
+        self._after_id = None
+        state = self.progress.snapshot()
+        total_frames = state["total_frames"]
+        frames = state["frames"]
 
         # プログレスバーとラベルを更新
-        self.progress_var.set((current_frame / total_frames) * 100)
-        self.elapsed_time_label.config(text=f"Elapsed Time: {int(elapsed_time)}s")
-        self.estimated_time_label.config(text=f"Estimated Remaining Time: {int(remaining_time)}s")
-        self.current_frame_label.config(text=f"Frame: {current_frame}/{total_frames}")
-        self.avg_time_per_frame_label.config(text=f"Avg. Time per Frame: {avg_time_per_frame:.2f}s")
+        if total_frames:
+            self.progress_var.set(min(100, frames / total_frames * 100))
+        self.elapsed_time_label.config(text=f"Elapsed Time: {int(state['elapsed'])}s")
+        eta = state["eta"]
+        self.estimated_time_label.config(
+            text=f"Estimated Remaining Time: {'-' if eta is None else f'{int(eta)}s'}")
+        self.current_frame_label.config(text=f"Frame: {frames}/{total_frames}")
+        self.fps_label.config(text=f"Speed: {state['fps']:.1f} fps")
+        stage_ms = state["stage_ms"]
+        self.stage_time_label.config(text=f"Decode: {stage_ms['decode']:.1f}ms / "
+                                          f"Process: {stage_ms['process']:.1f}ms / "
+                                          f"Encode: {stage_ms['encode']:.1f}ms"
+                                          + ("" if state["memo_hit_rate"] is None
+                                             else f" / Reused: {state['memo_hit_rate'] * 100:.0f}%"))
+
+        if state["done"]:
+            self.show_complete(state)
+        else:
+            self._after_id = self.progress_window.after(self.interval_ms, self.poll)
 
-        self.root.update_idletasks()
+    def cancel(self):
+        self.progress.cancel()
+        self.cancel_button.config(state=tk.DISABLED)
+        self.complete_label.config(text="Cancelling...")
+
+    def on_close(self):
+        # 書き出し中に閉じられたら中止してから閉じる
+        if not self.progress.snapshot()["done"]:
+            self.progress.cancel()
+        self.close()
 
     def close(self):
+        if self._after_id is not None:
+            self.progress_window.after_cancel(self._after_id)
+            self._after_id = None
         self.progress_window.destroy()
 
-    def show_complete(self):
-        self.complete_label.config(text=f"Process complete")
+    def show_complete(self, state):
+        self.cancel_button.config(state=tk.DISABLED)
+        if state["error"] is not None:
+            self.complete_label.config(text=f"Error: {state['error']}")
+        elif state["cancelled"]:
+            self.complete_label.config(text="Cancelled")
+        else:
+            self.complete_label.config(text="Process complete")
+        if state["summary"]:
+            self.summary_label.config(text=state["summary"])
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     root = ThemedTk(theme="adapta")
     #root = tk.Tk()
     app = ImageProcessingApp(root)
+    # 最初のウィンドウが描画された後に起動時間を表示する
+    root.after_idle(lambda: logger.info(f"Startup: {(time.perf_counter() - START_TIME) * 1000:.0f} ms"))
     root.mainloop()
@@ -0,0 +1,56 @@
+import importlib
+import json
+import os
+
+MANIFEST_NAME = "manifest.json"
+
+
+class PluginInfo:
+    # マニフェストの1項目。モジュールを import せずにボタンの表示や並び順を決められる
+    def __init__(self, module, class_name=None, label=None, processor=None, api_version=1):
+        self.module = module
+        self.class_name = class_name or module.capitalize() + "Window"
+        self.label = label or module.capitalize()
+        # 対応する processing/ の処理名（レシピとワーカーで使う）
+        self.processor = processor
+        self.api_version = api_version
+
+
+class PluginRegistry:
+    # items/ の処理モジュールの一覧。クラスは初めて開くときにだけ import してキャッシュする
+    def __init__(self, items_dir, package="items"):
+        self.items_dir = items_dir
+        self.package = package
+        self.plugins = {}
+        self._classes = {}
+        self._discover()
+
+    def _discover(self):
+        if not os.path.isdir(self.items_dir):
+            return
+        manifest_path = os.path.join(self.items_dir, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            for entry in manifest.get("plugins", []):
+                plugin = PluginInfo(entry["module"], entry.get("class"), entry.get("label"), entry.get("processor"),
+                                    entry.get("api_version", 1))
+                self.plugins[plugin.module] = plugin
+        # マニフェストにないモジュールも従来どおりファイル名から見つける（中身は読まない）
+        for file_name in sorted(os.listdir(self.items_dir)):
+            module_name, ext = os.path.splitext(file_name)
+            if ext == ".py" and module_name != "__init__" and module_name not in self.plugins:
+                self.plugins[module_name] = PluginInfo(module_name)
+
+    def __iter__(self):
+        return iter(self.plugins.values())
+
+    def __contains__(self, module_name):
+        return module_name in self.plugins
+
+    def get_class(self, module_name):
+        if module_name not in self._classes:
+            plugin = self.plugins[module_name]
+            module = importlib.import_module(f"{self.package}.{plugin.module}")
+            self._classes[module_name] = getattr(module, plugin.class_name)
+        return self._classes[module_name]
@@ -0,0 +1,49 @@
+import json
+
+from processing.sharpening import SharpeningProcessor
+from processing.tonecurve import TonecurveProcessor
+from processing.chain import ProcessingChain
+from processing.lut3d import Lut3DProcessor, CUBE_EXTENSION
+from processing.presets import is_preset, preset_from_dict
+
+# items/ のモジュール名と同じキーで登録する
+PROCESSORS = {
+    SharpeningProcessor.name: SharpeningProcessor,
+    TonecurveProcessor.name: TonecurveProcessor,
+    ProcessingChain.name: ProcessingChain,
+    Lut3DProcessor.name: Lut3DProcessor,
+}
+
+RECIPE_VERSION = 1
+
+
+def create_processor(name, params):
+    if name not in PROCESSORS:
+        raise ValueError(f"Unknown processor: {name}")
+    return PROCESSORS[name].from_params(params)
+
+
+def save_recipe(file_path, processor):
+    if not processor.portable:
+        raise ValueError(f"Processor cannot be saved as a recipe: {processor.name}")
+    recipe = {
+        "version": RECIPE_VERSION,
+        "processor": processor.name,
+        "params": processor.get_params(),
+    }
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump(recipe, f, indent=2)
+
+
+def load_recipe(file_path):
+    # .cube はそのまま3D LUTの処理として読む
+    if file_path.lower().endswith(CUBE_EXTENSION):
+        return Lut3DProcessor.from_cube(file_path)
+    with open(file_path, encoding="utf-8") as f:
+        recipe = json.load(f)
+    # トーンカーブのプリセットは計算済みのLUTをそのまま使う
+    if is_preset(recipe):
+        return preset_from_dict(recipe)
+    if recipe.get("version", RECIPE_VERSION) > RECIPE_VERSION:
+        raise ValueError(f"Unsupported recipe version: {recipe['version']}")
+    return create_processor(recipe["processor"], recipe.get("params", {}))
@@ -0,0 +1,77 @@
+import numpy as np
+import cv2
+
+# 処理モジュールのインターフェースの版
+#   1: PIL 画像を受け渡す set_image / preprocess / apply_process（items/ の旧来のウィンドウ）
+#   2: NumPy 配列を受け取り NumPy 配列を返す Processor（out= とチャンネル順を指定できる）
+API_VERSION = 2
+
+
+class Processor:
+    # NumPy 配列で受け渡す処理の基底クラス。
+    # apply(image, out=None, channel_order="RGB") は uint8 の (H, W, 3) 配列を受け取り、
+    # out を渡されたらそこへ書いて返す（image と同じ配列でもよい）。変換は一切しない
+    name = None
+    api_version = API_VERSION
+    # 受け付けるチャンネル順。両方を受け付ける処理は cv2 から読んだBGRのフレームをそのまま処理できる
+    channel_orders = ("RGB", "BGR")
+    # パラメータだけで再現できる（レシピへの保存・ワーカーへの受け渡し・結果のキャッシュができる）
+    portable = True
+
+    @classmethod
+    def from_params(cls, params):
+        return cls(**params)
+
+    def get_params(self):
+        return {}
+
+    def halo(self):
+        # 1画素の計算に必要な周囲の幅（画素単位の処理なら0）
+        return 0
+
+    def is_identity(self):
+        return False
+
+    def get_luts(self):
+        # 画素単位の処理なら [R, G, B] の256段のLUTを返す（チェーンで1枚にまとめられる）
+        return None
+
+    def get_lut3d(self):
+        # チャンネルをまたぐ色の変換なら Lut3D を返す（前後のLUTと1枚の3D LUTにまとめられる）
+        return None
+
+    def apply(self, image, out=None, channel_order="RGB"):
+        raise NotImplementedError
+
+    def __call__(self, image):
+        return self.apply(image)
+
+
+class LegacyProcessorAdapter(Processor):
+    # PIL 画像で受け渡す旧来の処理モジュール（set_image / preprocess / apply_process）を
+    # Processor として使うためのラッパー。フレームごとに PIL との変換が入るので遅い
+    name = "legacy"
+    api_version = 1
+    channel_orders = ("RGB",)
+    # Tk のウィンドウを抱えているのでワーカーへ渡せず、パラメータもわからない
+    portable = False
+
+    def __init__(self, module):
+        self.module = module
+
+    def get_params(self):
+        return {"module": type(self.module).__name__}
+
+    def apply(self, image, out=None, channel_order="RGB"):
+        from PIL import Image
+
+        rgb = image if channel_order == "RGB" else cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        self.module.set_image(Image.fromarray(rgb))
+        self.module.preprocess()
+        result = np.asarray(self.module.apply_process().convert("RGB"))
+        if channel_order != "RGB":
+            result = cv2.cvtColor(result, cv2.COLOR_RGB2BGR)
+        if out is None:
+            return result
+        np.copyto(out, result)
+        return out
@@ -0,0 +1,151 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from processing.base import Processor
+from processing.lut3d import Lut3D, compose_lut3d
+from processing.tonecurve import LutTable, compose_luts
+from profiling import NULL_PROFILER
+
+
+class FusedLutStage(LutTable):
+    # 連続する画素単位のLUTステージを1枚のLUTにまとめたもの
+    name = "lut"
+
+
+class FusedLut3DStage(Lut3D):
+    # 3D LUTを含む連続した色の変換を1枚の3D LUTにまとめたもの。何段重ねても1画素1回の参照で済む
+    name = "lut3d"
+
+
+# 3D LUTが1つだけのときは元の Lut3D をそのまま使い、作り置きの表を使い回す
+COLOR_STAGES = (FusedLutStage, Lut3D)
+# まとめた3D LUTを覚えておく数。1つが作り置きの表をチャンネル順ごとに持つ（64MBずつ）ので少なくする
+FUSED_LUT3D_CACHE_SIZE = 2
+
+_fused_lut3d_cache = OrderedDict()
+_fused_lut3d_lock = threading.Lock()
+
+
+def _transform_digest(transform):
+    # 色の変換（1D LUT / Lut3D）の中身から作るキー
+    digest = hashlib.sha1()
+    if isinstance(transform, Lut3D):
+        digest.update(b"3d")
+        digest.update(transform.table.tobytes())
+    else:
+        digest.update(b"1d")
+        for lut in transform:
+            digest.update(np.ascontiguousarray(lut, dtype=np.uint8).tobytes())
+    return digest.digest()
+
+
+def _fuse_lut3d(first, second):
+    # チェーンはパラメータを変えるたびに作り直すので、同じ組み合わせなら前にまとめたものを返す。
+    # 作り置きの表もそのまま使えるので、色以外のステージを動かしてもプレビューが重くならない
+    key = (_transform_digest(first), _transform_digest(second))
+    with _fused_lut3d_lock:
+        stage = _fused_lut3d_cache.get(key)
+        if stage is not None:
+            _fused_lut3d_cache.move_to_end(key)
+            return stage
+    stage = FusedLut3DStage(compose_lut3d([first, second]).table)
+    with _fused_lut3d_lock:
+        _fused_lut3d_cache[key] = stage
+        while len(_fused_lut3d_cache) > FUSED_LUT3D_CACHE_SIZE:
+            _fused_lut3d_cache.popitem(last=False)
+    return stage
+
+
+def _fuse_color(previous, luts, lut3d):
+    # 直前のまとめたステージの後ろに色の変換を1つ足す
+    if isinstance(previous, FusedLutStage) and luts is not None:
+        return FusedLutStage(compose_luts(previous.luts, luts))
+    first = previous if isinstance(previous, Lut3D) else previous.luts
+    return _fuse_lut3d(first, lut3d if lut3d is not None else luts)
+
+
+class ProcessingChain(Processor):
+    # 処理ステージを順番に適用する。保存・読み込みは1つの処理として扱える
+    name = "chain"
+
+    def __init__(self, stages, channel_order="RGB"):
+        self.stages = list(stages)
+        # 入力フレームのチャンネル順（動画の書き出しでは cv2 のまま "BGR" で渡す）
+        self.channel_order = channel_order
+        self._plan = None
+
+    @classmethod
+    def from_params(cls, params):
+        from processing import create_processor
+        return cls([create_processor(stage["processor"], stage.get("params", {}))
+                    for stage in params.get("stages", [])])
+
+    def get_params(self):
+        return {"stages": [{"processor": stage.name, "params": stage.get_params()} for stage in self.stages]}
+
+    @property
+    def portable(self):
+        return all(stage.portable for stage in self.stages)
+
+    def halo(self):
+        # 近傍を参照するステージの半径の合計（帯ごとの処理で上下に足す行数）
+        return sum(stage.halo() for stage in self.compile() if not isinstance(stage, COLOR_STAGES))
+
+    def is_identity(self):
+        return not self.compile()
+
+    def get_luts(self):
+        # チェーン全体が画素単位ならまとめたLUTを返す
+        plan = self.compile()
+        if not plan:
+            return [np.arange(256, dtype=np.uint8) for _ in range(3)]
+        if len(plan) == 1 and isinstance(plan[0], FusedLutStage):
+            return plan[0].luts
+        return None
+
+    def get_lut3d(self):
+        plan = self.compile()
+        if len(plan) == 1 and isinstance(plan[0], Lut3D):
+            return plan[0]
+        return None
+
+    def compile(self):
+        # 恒等ステージを除き、隣り合う色の変換（1D/3D LUT）を1枚に合成する
+        if self._plan is None:
+            plan = []
+            for stage in self.stages:
+                if stage.is_identity():
+                    continue
+                luts = stage.get_luts()
+                lut3d = stage.get_lut3d() if luts is None else None
+                if luts is None and lut3d is None:
+                    plan.append(stage)
+                elif plan and isinstance(plan[-1], COLOR_STAGES):
+                    plan[-1] = _fuse_color(plan[-1], luts, lut3d)
+                elif luts is not None:
+                    plan.append(FusedLutStage(luts))
+                else:
+                    plan.append(lut3d)
+            self._plan = plan
+        return self._plan
+
+    def apply(self, image, out=None, channel_order=None, profiler=NULL_PROFILER, frame=None):
+        # 作業バッファは1枚だけ。最初のステージが out（なければ新規確保）へ書き、以降はその場で更新する
+        # profiler を渡すとステージごとに "process/<name>" として時間を記録する
+        if channel_order is None:
+            channel_order = self.channel_order
+        plan = self.compile()
+        if not plan:
+            if out is None:
+                return image
+            np.copyto(out, image)
+            return out
+        with profiler.stage(f"process/{plan[0].name}", frame):
+            buffer = plan[0].apply(image, out=out, channel_order=channel_order)
+        for stage in plan[1:]:
+            with profiler.stage(f"process/{stage.name}", frame):
+                stage.apply(buffer, out=buffer, channel_order=channel_order)
+        return buffer
@@ -0,0 +1,41 @@
+import numpy as np
+
+from processing.tonecurve import CHANNELS
+
+# 間引いてもヒストグラムの形が崩れない程度の画素数
+DEFAULT_MAX_PIXELS = 500_000
+
+# Tk の "red" / "green" / "blue" と同じ色
+HISTOGRAM_COLORS = np.array([[255, 0, 0], [0, 128, 0], [0, 0, 255]], dtype=np.uint8)
+
+
+def compute_histogram(image, max_pixels=DEFAULT_MAX_PIXELS, channel_order="RGB"):
+    # 3チャンネル分の256ビンを1回の bincount で数える。戻り値は R/G/B 順の (3, 256)
+    height, width = image.shape[:2]
+    if max_pixels and height * width > max_pixels:
+        step = int(np.ceil(np.sqrt(height * width / max_pixels)))
+        image = image[::step, ::step]
+    offsets = np.zeros(3, dtype=np.uint16)
+    for src_idx, channel in enumerate(channel_order):
+        offsets[src_idx] = CHANNELS[channel] * 256
+    indices = image[..., :3].astype(np.uint16) + offsets
+    return np.bincount(indices.ravel(), minlength=768).reshape(3, 256)
+
+
+def remap_histogram(histogram, luts):
+    # 元画像のヒストグラムをLUTで写す。画素を見ずに処理後のヒストグラムが求まる
+    return np.stack([np.bincount(luts[idx], weights=histogram[idx], minlength=256)
+                     for idx in range(3)])
+
+
+def render_histogram(histogram, height=150):
+    # R/G/Bを1列ずつ並べた棒グラフ（幅768）を1枚のRGB画像として描く
+    max_value = max(histogram.max(), 1)
+    bar_heights = (histogram * height / max_value).astype(np.int32)
+    bar_heights = bar_heights.T.ravel() # 列 i*3+c がチャンネル c
+    rows = np.arange(height)[:, None]
+    filled = rows >= height - bar_heights[None, :]
+    raster = np.zeros((height, bar_heights.size, 3), dtype=np.uint8)
+    colors = np.tile(HISTOGRAM_COLORS, (histogram.shape[1], 1))
+    raster[filled] = np.broadcast_to(colors, raster.shape)[filled]
+    return raster
@@ -0,0 +1,231 @@
+import os
+
+import cv2
+import numpy as np
+
+from processing.base import Processor
+
+DEFAULT_LUT3D_SIZE = 33
+CUBE_EXTENSION = ".cube"
+_DENSE_POSITIONS = np.arange(256, dtype=np.float32)
+
+
+def identity_table(size=DEFAULT_LUT3D_SIZE):
+    # table[r, g, b] = (r, g, b)。値は 0..1
+    grid = np.linspace(0, 1, size, dtype=np.float32)
+    return np.stack(np.meshgrid(grid, grid, grid, indexing="ij"), axis=-1)
+
+
+def _interp_weights(size):
+    # 0..255 の入力を格子へ線形補間する重み (256, size)。1軸ぶんの補間は行列の積で済む
+    positions = _DENSE_POSITIONS * (size - 1) / 255
+    lo = np.minimum(positions.astype(np.intp), size - 2)
+    frac = positions - lo
+    weights = np.zeros((256, size), dtype=np.float32)
+    weights[np.arange(256), lo] = 1 - frac
+    weights[np.arange(256), lo + 1] += frac
+    return weights, lo, frac
+
+
+class Lut3D:
+    # 3D LUT。table は (N, N, N, 3) の float32 で [r, g, b] の順に引く。
+    # uint8 の画像には全入力値の結果を詰めた表を作り置きし、1画素1回の参照で適用する
+    name = "lut3d"
+
+    def __init__(self, table, title=None):
+        table = np.asarray(table, dtype=np.float32)
+        if table.ndim != 4 or table.shape[3] != 3 or not table.shape[0] == table.shape[1] == table.shape[2]:
+            raise ValueError(f"Invalid 3D LUT shape: {table.shape}")
+        if table.shape[0] < 2:
+            raise ValueError(f"3D LUT size must be at least 2, got {table.shape[0]}")
+        self.table = table
+        self.title = title
+        self.tables = {}
+
+    @property
+    def size(self):
+        return self.table.shape[0]
+
+    def is_identity(self, tolerance=0.5 / 255):
+        return np.allclose(self.table, identity_table(self.size), atol=tolerance)
+
+    def sample(self, rgb):
+        # 0..1 の (…, 3) 配列を三線形補間で変換する（LUT同士の合成用。フレームには apply を使う）
+        rgb = np.asarray(rgb, dtype=np.float32)
+        positions = np.clip(rgb, 0, 1) * (self.size - 1)
+        lo = np.minimum(positions.astype(np.intp), self.size - 2)
+        frac = positions - lo
+        r, g, b = lo[..., 0], lo[..., 1], lo[..., 2]
+        fr, fg, fb = frac[..., 0:1], frac[..., 1:2], frac[..., 2:3]
+        t = self.table
+        c00 = t[r, g, b] + (t[r + 1, g, b] - t[r, g, b]) * fr
+        c01 = t[r, g, b + 1] + (t[r + 1, g, b + 1] - t[r, g, b + 1]) * fr
+        c10 = t[r, g + 1, b] + (t[r + 1, g + 1, b] - t[r, g + 1, b]) * fr
+        c11 = t[r, g + 1, b + 1] + (t[r + 1, g + 1, b + 1] - t[r, g + 1, b + 1]) * fr
+        c0 = c00 + (c10 - c00) * fg
+        c1 = c01 + (c11 - c01) * fg
+        return c0 + (c1 - c0) * fb
+
+    def dense_table(self, channel_order="RGB"):
+        # 入力 (c0 << 16 | c1 << 8 | c2) に対する出力を 1画素4バイトに詰めた表（c はフレームのチャンネル順、64MB）。
+        # 三線形補間は軸ごとに分けられるので、格子を1軸ずつ256段へ広げて作る
+        packed = self.tables.get(channel_order)
+        if packed is not None:
+            return packed
+        order = [{"R": 0, "G": 1, "B": 2}[channel] for channel in channel_order]
+        # フレームのチャンネル順の軸で引けるように並べ替える
+        table = self.table.transpose(order + [3])[..., order] * 255
+        weights, lo, frac = _interp_weights(self.size)
+        table = np.einsum("kc,abcd->abkd", weights, table, optimize=True)
+        table = np.ascontiguousarray(np.einsum("jb,abkd->ajkd", weights, table, optimize=True))
+        packed = np.empty((256, 256, 256), dtype=np.uint32)
+        view = packed.view(np.uint8).reshape(256, 256, 256, 4)
+        for idx in range(256):
+            # 残りの1軸は平面2枚の補間。丸めと 4バイトへの詰め直しも cv2 で行う
+            plane = cv2.addWeighted(table[lo[idx]], 1 - float(frac[idx]), table[lo[idx] + 1], float(frac[idx]), 0)
+            cv2.cvtColor(cv2.convertScaleAbs(plane).reshape(256, 256, 3), cv2.COLOR_RGB2RGBA, dst=view[idx])
+        self.tables[channel_order] = packed = packed.reshape(-1)
+        return packed
+
+    def apply(self, image, out=None, channel_order="RGB"):
+        # uint8 の (H, W, 3) 画像に適用する。out を渡すとそこへ書き込む（image と同じ配列でもよい）。
+        # (H, W, 4) ならアルファはそのまま残す（チャンネル順は channel_order + アルファ）
+        if image.ndim != 3 or image.shape[2] not in (3, 4):
+            raise ValueError(f"3D LUT needs a 3 or 4 channel image, got shape {image.shape}")
+        packed = self.dense_table(channel_order)
+        index = image[..., 0].astype(np.uint32)
+        index <<= 8
+        index |= image[..., 1]
+        index <<= 8
+        index |= image[..., 2]
+        packed.take(index, out=index)
+        # 4バイト目（未使用）を落とす。チャンネル順はそのままで、cv2 のほうがスライスのコピーより速い
+        result = index.view(np.uint8).reshape(image.shape[0], image.shape[1], 4)
+        if image.shape[2] == 4:
+            # 表の4バイト目にアルファを戻せば、そのまま4チャンネルの結果になる
+            result[..., 3] = image[..., 3]
+            if out is None:
+                return result
+            out[...] = result
+            return out
+        return cv2.cvtColor(result, cv2.COLOR_RGBA2RGB, dst=out)
+
+    def __getstate__(self):
+        # ワーカーへは格子だけを送り、大きな表は向こうで作り直す
+        state = self.__dict__.copy()
+        state["tables"] = {}
+        return state
+
+
+def transform_lattice(lattice, transform):
+    # 0..1 の格子点に色の変換を1つ適用する。transform は [R, G, B] の1D LUT か Lut3D
+    if isinstance(transform, Lut3D):
+        return transform.sample(lattice)
+    result = np.empty_like(lattice)
+    for idx in range(3):
+        result[..., idx] = np.interp(lattice[..., idx] * 255, _DENSE_POSITIONS,
+                                     np.asarray(transform[idx], dtype=np.float32)) / 255
+    return result
+
+
+def compose_lut3d(transforms, size=None):
+    # 色の変換（1D LUT / Lut3D）を順に適用したものを1枚の Lut3D にまとめる。
+    # 格子点ごとに順に変換するので、格子点の上では誤差が積み重ならない
+    if size is None:
+        sizes = [t.size for t in transforms if isinstance(t, Lut3D)]
+        size = max(sizes) if sizes else DEFAULT_LUT3D_SIZE
+    lattice = identity_table(size)
+    for transform in transforms:
+        lattice = transform_lattice(lattice, transform)
+    return Lut3D(lattice)
+
+
+def bake_lut3d(processor, size=DEFAULT_LUT3D_SIZE):
+    # 色だけを変える処理（トーンカーブやそのチェーン）を3D LUTに焼き込む
+    from processing.chain import ProcessingChain
+
+    plan = ProcessingChain([processor]).compile()
+    if not plan:
+        return Lut3D(identity_table(size))
+    if len(plan) > 1:
+        raise ValueError("Only color transforms can be baked into a 3D LUT")
+    stage = plan[0]
+    transform = stage if isinstance(stage, Lut3D) else getattr(stage, "luts", None)
+    if transform is None:
+        raise ValueError(f"Only color transforms can be baked into a 3D LUT: {stage.name}")
+    return compose_lut3d([transform], size)
+
+
+def read_cube(file_path):
+    # Adobe/Resolve の .cube（3D）を読む。入力の範囲は 0..1 のみ対応
+    title = None
+    size = None
+    rows = []
+    with open(file_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            keyword = line.split(None, 1)[0].upper()
+            if keyword == "TITLE":
+                title = line[len("TITLE"):].strip().strip('"')
+            elif keyword == "LUT_3D_SIZE":
+                size = int(line.split()[1])
+            elif keyword == "LUT_1D_SIZE":
+                raise ValueError(f"1D .cube files are not supported: {file_path}")
+            elif keyword in ("DOMAIN_MIN", "DOMAIN_MAX"):
+                expected = 0.0 if keyword == "DOMAIN_MIN" else 1.0
+                if any(float(v) != expected for v in line.split()[1:4]):
+                    raise ValueError(f"Unsupported {keyword} in {file_path}: {line}")
+            elif keyword[0].isalpha():
+                # LUT_3D_INPUT_RANGE など、結果に関係しない拡張キーワードは読み飛ばす
+                continue
+            else:
+                rows.append([float(v) for v in line.split()[:3]])
+    if size is None:
+        raise ValueError(f"Missing LUT_3D_SIZE: {file_path}")
+    if len(rows) != size ** 3:
+        raise ValueError(f"Expected {size ** 3} entries, got {len(rows)}: {file_path}")
+    # ファイルは R が最も速く変わる順（b, g, r）に並んでいる
+    table = np.array(rows, dtype=np.float32).reshape(size, size, size, 3).transpose(2, 1, 0, 3)
+    return Lut3D(table, title)
+
+
+def write_cube(file_path, lut, title=None):
+    title = title or lut.title or os.path.splitext(os.path.basename(file_path))[0]
+    rows = lut.table.transpose(2, 1, 0, 3).reshape(-1, 3)
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(f'TITLE "{title}"\n')
+        f.write(f"LUT_3D_SIZE {lut.size}\n")
+        np.savetxt(f, rows, fmt="%.6f")
+
+
+class Lut3DProcessor(Processor):
+    # .cube ファイルの3D LUTを適用する処理。レシピには .cube のパスを保存する
+    name = "lut3d"
+
+    def __init__(self, lut, path=None):
+        self.lut = lut
+        self.path = path
+
+    @classmethod
+    def from_cube(cls, file_path):
+        return cls(read_cube(file_path), file_path)
+
+    @classmethod
+    def from_params(cls, params):
+        return cls.from_cube(params["path"])
+
+    def get_params(self):
+        if self.path is None:
+            raise ValueError("3D LUT without a .cube file cannot be saved as a recipe")
+        return {"path": self.path}
+
+    def is_identity(self):
+        return self.lut.is_identity()
+
+    def get_lut3d(self):
+        return self.lut
+
+    def apply(self, image, out=None, channel_order="RGB"):
+        return self.lut.apply(image, out=out, channel_order=channel_order)
@@ -0,0 +1,144 @@
+import base64
+import json
+import os
+
+import numpy as np
+
+from processing.tonecurve import CHANNELS, TonecurveProcessor
+
+PRESET_VERSION = 1
+PRESET_TYPE = "tonecurve_preset"
+PRESET_EXTENSION = ".json"
+XLSX_EXTENSION = ".xlsx"
+
+
+def encode_luts(luts):
+    # R, G, B の順に 256 バイトずつ並べた 768 バイトを base64 にする
+    return base64.b64encode(np.stack([np.asarray(lut, dtype=np.uint8) for lut in luts]).tobytes()).decode("ascii")
+
+
+def decode_luts(data):
+    table = np.frombuffer(base64.b64decode(data), dtype=np.uint8)
+    if table.size != 256 * 3:
+        raise ValueError(f"Invalid LUT size: {table.size}")
+    return [lut.copy() for lut in table.reshape(3, 256)]
+
+
+def preset_to_dict(processor, name=None):
+    # 制御点（編集用）と計算済みのLUT（適用用）を両方持たせる
+    preset = {
+        "version": PRESET_VERSION,
+        "type": PRESET_TYPE,
+        "name": name,
+        "interpolation": processor.interpolation,
+        "lut": encode_luts(processor.luts),
+    }
+    if processor.curve_points is not None:
+        preset["curve_points"] = {channel: [list(p) for p in points]
+                                  for channel, points in processor.curve_points.items()}
+    return preset
+
+
+def preset_from_dict(preset):
+    # 保存済みのLUTをそのまま使い、曲線は計算しない
+    if preset.get("version", PRESET_VERSION) > PRESET_VERSION:
+        raise ValueError(f"Unsupported preset version: {preset['version']}")
+    curve_points = preset.get("curve_points")
+    if curve_points is not None:
+        curve_points = {channel: [tuple(p) for p in points] for channel, points in curve_points.items()}
+    return TonecurveProcessor(decode_luts(preset["lut"]), curve_points, preset.get("interpolation", "linear"))
+
+
+def is_preset(data):
+    return isinstance(data, dict) and data.get("type") == PRESET_TYPE
+
+
+def save_preset(file_path, processor, name=None):
+    if name is None:
+        name = os.path.splitext(os.path.basename(file_path))[0]
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump(preset_to_dict(processor, name), f, indent=2)
+
+
+def load_preset(file_path):
+    with open(file_path, encoding="utf-8") as f:
+        preset = json.load(f)
+    if not is_preset(preset):
+        raise ValueError(f"Not a tone curve preset: {file_path}")
+    return preset_from_dict(preset)
+
+
+def import_xlsx(file_path, interpolation="linear"):
+    # 旧形式（channel, x, y の行が並んだ xlsx）を読み込む。openpyxl はここでだけ import する
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(file_path, read_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        curve_points = {channel: [] for channel in CHANNELS}
+        for row in sheet.iter_rows(min_row=2, values_only=True):
+            if not row or row[0] is None:
+                continue
+            channel, x, y = row[:3]
+            curve_points[channel].append((int(x), int(y)))
+    finally:
+        workbook.close()
+    curve_points = {channel: points for channel, points in curve_points.items() if points}
+    return TonecurveProcessor.from_curve_points(curve_points, interpolation)
+
+
+class PresetLibrary:
+    # プリセットフォルダの一覧をメモリに持ち、切り替えのたびにファイルを読まないようにする。
+    # 変換済みの JSON がない xlsx は最初の索引作成時に一度だけ JSON へ変換する
+    def __init__(self, directory):
+        self.directory = directory
+        self._paths = {}
+        self._presets = {}
+        self.refresh()
+
+    def refresh(self):
+        self._paths = {}
+        self._presets = {}
+        if not os.path.isdir(self.directory):
+            return
+        file_names = sorted(os.listdir(self.directory))
+        for file_name in file_names:
+            name, ext = os.path.splitext(file_name)
+            path = os.path.join(self.directory, file_name)
+            if ext == PRESET_EXTENSION:
+                self._load(name, path)
+        for file_name in file_names:
+            name, ext = os.path.splitext(file_name)
+            if ext == XLSX_EXTENSION and name not in self._paths:
+                path = os.path.join(self.directory, name + PRESET_EXTENSION)
+                try:
+                    save_preset(path, import_xlsx(os.path.join(self.directory, file_name)), name)
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Skipping preset {file_name}: {e}")
+                    continue
+                self._load(name, path)
+
+    def _load(self, name, path):
+        try:
+            self._presets[name] = load_preset(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Skipping preset {os.path.basename(path)}: {e}")
+            return
+        self._paths[name] = path
+
+    def names(self):
+        return sorted(self._presets)
+
+    def get(self, name):
+        return self._presets[name]
+
+    def __contains__(self, name):
+        return name in self._presets
+
+    def save(self, name, processor):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name + PRESET_EXTENSION)
+        save_preset(path, processor, name)
+        self._paths[name] = path
+        self._presets[name] = processor
+        return path
@@ -0,0 +1,85 @@
+import numpy as np
+import cv2
+
+from processing.base import Processor
+
+# k スライダー（ImageEnhance.Sharpness 相当）のプリセットで使う半径。
+# σ=0.65 のガウシアンが PIL の SMOOTH カーネル（中心5/13、周囲1/13）に最も近い
+K_PRESET_RADIUS = 0.65
+
+
+class SharpeningProcessor(Processor):
+    # アンシャープマスクによる先鋭化（Tkに依存しないのでワーカーから安く読み込める）
+    #   radius: ぼかしのσ（画素）、amount: 強さ（負ならぼかし）、threshold: これ以下の差は強調しない
+    name = "sharpening"
+
+    def __init__(self, radius=K_PRESET_RADIUS, amount=0.0, threshold=0, enabled=False):
+        self.radius = float(radius)
+        self.amount = float(amount)
+        self.threshold = int(threshold)
+        self.enabled = bool(enabled)
+        # 作業用バッファ（同じサイズのフレームが続く間は使い回す）
+        self._buffers = None
+
+    @classmethod
+    def from_k(cls, k, enabled=True):
+        # 従来の k 値: 1 で元画像のまま、k > 1 で先鋭化、k < 1 でぼかし
+        return cls(radius=K_PRESET_RADIUS, amount=float(k) - 1.0, threshold=0, enabled=enabled)
+
+    @classmethod
+    def from_params(cls, params):
+        if "k" in params:
+            return cls.from_k(params["k"], enabled=params.get("enabled", False))
+        return cls(radius=params.get("radius", K_PRESET_RADIUS), amount=params.get("amount", 0.0),
+                   threshold=params.get("threshold", 0), enabled=params.get("enabled", False))
+
+    def get_params(self):
+        return {"radius": self.radius, "amount": self.amount, "threshold": self.threshold,
+                "enabled": self.enabled}
+
+    def halo(self):
+        # 1画素の計算に必要な周囲の幅（ガウシアンのカーネル半径）
+        if self.is_identity():
+            return 0
+        # cv2.GaussianBlur が σ から決めるカーネルサイズと同じ計算
+        ksize = int(np.rint(self.radius * 6 + 1)) | 1
+        return ksize // 2
+
+    def is_identity(self):
+        return not self.enabled or self.amount == 0.0 or self.radius <= 0.0
+
+    def get_luts(self):
+        # 近傍を参照するのでLUTには畳み込めない
+        return None
+
+    def apply(self, image, out=None, channel_order="RGB"):
+        # チャンネルごとに同じ処理なので channel_order には依らない。
+        # out を渡すとそこへ書き込む（image と同じ配列でもよい）
+        if self.is_identity():
+            # オフのときはコピーせずにそのまま返す
+            if out is None or out is image:
+                return image
+            np.copyto(out, image)
+            return out
+
+        blurred, diff, mask = self._get_buffers(image)
+        # σ から決まるサイズの分離可能なガウシアン（横・縦の1次元フィルタ2回）
+        cv2.GaussianBlur(image, (0, 0), self.radius, dst=blurred, borderType=cv2.BORDER_REPLICATE)
+        if self.threshold > 0:
+            # 差が閾値以下の画素はぼかし画像を元画像で置き換え、強調量を0にする
+            cv2.absdiff(image, blurred, dst=diff)
+            cv2.compare(diff, self.threshold, cv2.CMP_LE, dst=mask)
+            cv2.copyTo(image, mask, dst=blurred)
+        # image + amount * (image - blurred) を飽和演算で一度に計算する
+        return cv2.addWeighted(image, 1.0 + self.amount, blurred, -self.amount, 0, dst=out)
+
+    def _get_buffers(self, image):
+        if self._buffers is None or self._buffers[0].shape != image.shape:
+            self._buffers = (np.empty_like(image), np.empty_like(image), np.empty_like(image))
+        return self._buffers
+
+    def __getstate__(self):
+        # ワーカーへ送るときに作業用バッファは含めない
+        state = self.__dict__.copy()
+        state["_buffers"] = None
+        return state
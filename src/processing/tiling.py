@@ -0,0 +1,277 @@
+import os
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+# これより大きい静止画は帯ごとに処理する
+TILED_THRESHOLD_PIXELS = 40_000_000
+# 帯ごとに処理する画像の編集用縮小画像の長辺
+DEFAULT_PREVIEW_SIZE = 4096
+# 1行あたりに同時に持つ配列の数（入力の帯、出力、先鋭化の作業用バッファ3枚）
+WORKING_COPIES = 5
+TILED_OUTPUT_EXTENSIONS = (".tif", ".tiff", ".png")
+# 帯ごとに処理する画像を開くときだけ使う PIL の展開爆弾の上限（既定は約9000万画素で、その2倍を超えると開けない）。
+# 通常の読み込みは PIL の既定のまま
+MAX_IMAGE_PIXELS = 2_000_000_000
+
+_pixel_limit_lock = threading.Lock()
+
+
+class RawStripSource:
+    # 無圧縮の TIFF / BMP / PPM はファイルをメモリマップし、必要な行だけを読む
+    def __init__(self, file_path, image):
+        self.file_path = file_path
+        self.width, self.height = image.size
+        self.channels = 3
+        self.strips = []  # (y0, y1, 行の配列)
+        for tile in image.tile:
+            x0, y0, x1, y1 = tile[1]
+            rawmode, stride, orientation = _raw_args(tile[3])
+            rows = y1 - y0
+            row_bytes = stride or self.width * 3
+            data = np.memmap(file_path, dtype=np.uint8, mode="r", offset=tile[2], shape=(rows, row_bytes))
+            pixels = data[:, :self.width * 3].reshape(rows, self.width, 3)
+            if orientation < 0:
+                pixels = pixels[::-1] # BMP は下の行から並んでいる
+            if rawmode == "BGR":
+                pixels = pixels[..., ::-1]
+            self.strips.append((y0, y1, pixels))
+
+    @classmethod
+    def supports(cls, image):
+        if image.mode != "RGB" or not image.tile:
+            return False
+        for tile in image.tile:
+            if tile[0] != "raw" or tile[1][0] != 0 or tile[1][2] != image.size[0]:
+                return False
+            rawmode, _, _ = _raw_args(tile[3])
+            if rawmode not in ("RGB", "BGR"):
+                return False
+        return True
+
+    def read_rows(self, y0, y1):
+        out = np.empty((y1 - y0, self.width, 3), dtype=np.uint8)
+        for strip_y0, strip_y1, pixels in self.strips:
+            a, b = max(y0, strip_y0), min(y1, strip_y1)
+            if a < b:
+                out[a - y0:b - y0] = pixels[a - strip_y0:b - strip_y0]
+        return out
+
+    def sample(self, step):
+        # step 行・列ごとに間引いた画像（間引いた行だけがディスクから読まれる）
+        rows = []
+        for y in range(0, self.height, step):
+            rows.append(self.read_rows(y, y + 1)[0, ::step])
+        return np.stack(rows)
+
+
+class ArraySource:
+    # 展開済みの配列から帯を切り出す（追加のコピーはしない）。
+    # 圧縮された画像はファイル全体を一度だけ展開してこれで包む
+    def __init__(self, array):
+        self.array = array
+        self.height, self.width = self.array.shape[:2]
+        self.channels = self.array.shape[2]
+
+    def read_rows(self, y0, y1):
+        return self.array[y0:y1]
+
+    def sample(self, step):
+        return self.array[::step, ::step]
+
+
+def _raw_args(args):
+    if isinstance(args, str):
+        return args, 0, 1
+    rawmode = args[0]
+    stride = args[1] if len(args) > 1 else 0
+    orientation = args[2] if len(args) > 2 else 1
+    return rawmode, stride, orientation
+
+
+@contextmanager
+def _large_image_limit():
+    # PIL の上限はモジュール全体の設定なので、開く間だけ引き上げて元に戻す
+    with _pixel_limit_lock:
+        previous = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = max(previous or 0, MAX_IMAGE_PIXELS)
+        try:
+            yield
+        finally:
+            Image.MAX_IMAGE_PIXELS = previous
+
+
+def open_image_source(file_path):
+    # メモリの予算を守れるのは無圧縮の TIFF / BMP / PPM（RawStripSource）だけ。
+    # JPEG・PNG・圧縮 TIFF は帯ごとに展開できないので、ここで一度全体を展開する（画像1枚分のメモリを使う）
+    with _large_image_limit():
+        image = Image.open(file_path)
+    if RawStripSource.supports(image):
+        return RawStripSource(file_path, image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+    return ArraySource(np.asarray(image))
+
+
+def image_pixels(file_path):
+    # ヘッダーだけを読んで画素数を返す（大きな画像でも展開爆弾として拒まない）
+    with _large_image_limit():
+        with Image.open(file_path) as image:
+            width, height = image.size
+    return width * height
+
+
+def make_preview(source, max_size):
+    # 編集用の縮小画像。長辺が max_size 程度になるよう行・列を間引く
+    step = max(1, int(np.ceil(max(source.width, source.height) / max_size)))
+    return np.ascontiguousarray(source.sample(step))
+
+
+class TiffStripWriter:
+    # 無圧縮の RGB(A) TIFF を上から順に書き足していく。IFD は最後に書く
+    def __init__(self, file_path, width, height, channels=3, rows_per_strip=64):
+        self.file_path = file_path
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.rows_per_strip = rows_per_strip
+        self.rows_written = 0
+        if width * height * channels >= 2 ** 32 - 4096:
+            raise ValueError("Image too large for a classic TIFF")
+        self.file = open(file_path, "wb")
+        self.file.write(b"II*\x00\x00\x00\x00\x00") # IFD の位置は close() で書き込む
+        self.data_offset = self.file.tell()
+
+    def write(self, rows):
+        self.file.write(np.ascontiguousarray(rows, dtype=np.uint8).tobytes())
+        self.rows_written += rows.shape[0]
+
+    def abort(self):
+        # 途中で失敗したときは書きかけのファイルを残さない
+        self.file.close()
+        os.remove(self.file_path)
+
+    def close(self):
+        if self.rows_written != self.height:
+            self.file.close()
+            raise ValueError(f"Expected {self.height} rows, got {self.rows_written}")
+        row_bytes = self.width * self.channels
+        strip_count = (self.height + self.rows_per_strip - 1) // self.rows_per_strip
+        offsets = [self.data_offset + i * self.rows_per_strip * row_bytes for i in range(strip_count)]
+        counts = [min(self.rows_per_strip, self.height - i * self.rows_per_strip) * row_bytes
+                  for i in range(strip_count)]
+
+        if self.file.tell() % 2:
+            self.file.write(b"\x00")
+        extra = []  # IFD に収まらない値（後ろに続けて書く）
+        extra_offset = self.file.tell() + 2 + 10 * 12 + 4
+
+        def entry(tag, value_type, values):
+            nonlocal extra_offset
+            fmt = "H" if value_type == 3 else "I"
+            data = struct.pack(f"<{len(values)}{fmt}", *values)
+            if len(data) <= 4:
+                return struct.pack("<HHI", tag, value_type, len(values)) + data.ljust(4, b"\x00")
+            offset = extra_offset
+            extra.append(data)
+            extra_offset += len(data)
+            return struct.pack("<HHII", tag, value_type, len(values), offset)
+
+        entries = [
+            entry(256, 4, [self.width]),
+            entry(257, 4, [self.height]),
+            entry(258, 3, [8] * self.channels),
+            entry(259, 3, [1]), # 無圧縮
+            entry(262, 3, [2]), # RGB
+            entry(273, 4, offsets),
+            entry(277, 3, [self.channels]),
+            entry(278, 4, [self.rows_per_strip]),
+            entry(279, 4, counts),
+            entry(284, 3, [1]),
+        ]
+        ifd_offset = self.file.tell()
+        self.file.write(struct.pack("<H", len(entries)) + b"".join(entries) + struct.pack("<I", 0))
+        self.file.write(b"".join(extra))
+        self.file.seek(4)
+        self.file.write(struct.pack("<I", ifd_offset))
+        self.file.close()
+
+
+class PngStripWriter:
+    # PNG を上から順に圧縮しながら書き足していく
+    def __init__(self, file_path, width, height, channels=3, compression=6):
+        self.file_path = file_path
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.rows_written = 0
+        self.compressor = zlib.compressobj(compression)
+        self.file = open(file_path, "wb")
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        color_type = 6 if channels == 4 else 2
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+
+    def write(self, rows):
+        # 各行の先頭にフィルタ種別0（なし）を付けて圧縮する
+        scanlines = np.zeros((rows.shape[0], 1 + self.width * self.channels), dtype=np.uint8)
+        scanlines[:, 1:] = rows.reshape(rows.shape[0], -1)
+        data = self.compressor.compress(scanlines.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+        self.rows_written += rows.shape[0]
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.file_path)
+
+    def close(self):
+        self._chunk(b"IDAT", self.compressor.flush())
+        self._chunk(b"IEND", b"")
+        self.file.close()
+        if self.rows_written != self.height:
+            raise ValueError(f"Expected {self.height} rows, got {self.rows_written}")
+
+    def _chunk(self, chunk_type, data):
+        self.file.write(struct.pack(">I", len(data)) + chunk_type + data)
+        self.file.write(struct.pack(">I", zlib.crc32(chunk_type + data) & 0xffffffff))
+
+
+def open_strip_writer(file_path, width, height, channels=3):
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in (".tif", ".tiff"):
+        return TiffStripWriter(file_path, width, height, channels)
+    if ext == ".png":
+        return PngStripWriter(file_path, width, height, channels)
+    raise ValueError(f"Tiled output supports {', '.join(TILED_OUTPUT_EXTENSIONS)} only: {file_path}")
+
+
+def strip_rows(width, channels, halo, memory_budget):
+    # 上下の halo 行を含めた帯が予算に収まる行数
+    row_bytes = width * channels * WORKING_COPIES
+    return max(1, memory_budget // row_bytes - 2 * halo)
+
+
+def process_tiled(source, output_path, processor, memory_budget=DEFAULT_MEMORY_BUDGET, progress=None):
+    # source を帯ごとに読み、近傍フィルタに必要な halo 行を付けて処理し、出力へ順に書き足す
+    halo = processor.halo() if hasattr(processor, "halo") else 0
+    rows = strip_rows(source.width, source.channels, halo, memory_budget)
+    writer = open_strip_writer(output_path, source.width, source.height, source.channels)
+    try:
+        for y0 in range(0, source.height, rows):
+            y1 = min(source.height, y0 + rows)
+            top, bottom = max(0, y0 - halo), min(source.height, y1 + halo)
+            strip = source.read_rows(top, bottom)
+            processed = processor.apply(strip, channel_order="RGB")
+            writer.write(processed[y0 - top:y1 - top])
+            if progress is not None:
+                progress(y1, source.height)
+    except BaseException:
+        # 行数が足りないまま close() すると元の例外が隠れるので、書きかけのファイルを消すだけにする
+        writer.abort()
+        raise
+    writer.close()
@@ -0,0 +1,204 @@
+import numpy as np
+import cv2
+
+from processing.base import Processor
+
+CHANNELS = {"R": 0, "G": 1, "B": 2}
+DEFAULT_CURVE_POINTS = [(0, 255), (255, 0)]
+
+
+INTERPOLATIONS = ("linear", "monotone", "catmull-rom")
+
+
+def generate_lut(curve_points, interpolation="linear"):
+    # curve_points はキャンバス座標（yは上下反転）。256段のLUTを一度のNumPy演算で返す
+    points = np.array(sorted((tuple(p) for p in curve_points), key=lambda p: p[0]), dtype=np.float64)
+    xs = points[:, 0]
+    ys = 255 - points[:, 1] # x=yに対して対称
+    x = np.arange(256, dtype=np.float64)
+
+    if interpolation == "linear" or len(points) < 3:
+        values = _linear(xs, ys, x)
+    else:
+        # 同じxの点が重なると傾きが求まらないので先頭の点だけ残す
+        xs, first = np.unique(xs, return_index=True)
+        ys = ys[first]
+        if len(xs) < 3:
+            values = _linear(xs, ys, x)
+        elif interpolation == "monotone":
+            values = _hermite(xs, ys, _monotone_tangents(xs, ys), x)
+        elif interpolation == "catmull-rom":
+            values = _hermite(xs, ys, _catmull_rom_tangents(xs, ys), x)
+        else:
+            raise ValueError(f"Unknown interpolation: {interpolation}")
+
+    # 従来どおり int() と同じ切り捨てで整数にする
+    return np.floor(np.clip(values, 0, 255)).astype(np.uint8)
+
+
+def _linear(xs, ys, x):
+    # 各xを含む最初の区間 (x1 <= x <= x2) で y1 * (1 - t) + y2 * t を計算する（従来のループと同じ式）
+    idx = np.clip(np.searchsorted(xs, x, side="left") - 1, 0, len(xs) - 2)
+    x1, x2 = xs[idx], xs[idx + 1]
+    y1, y2 = ys[idx], ys[idx + 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(x2 > x1, (x - x1) / (x2 - x1), 1.0)
+    return y1 * (1 - t) + y2 * t
+
+
+def _monotone_tangents(xs, ys):
+    # Fritsch-Carlson 法。区間ごとの単調性を保つので、オーバーシュートしない
+    h = np.diff(xs)
+    delta = np.diff(ys) / h
+    tangents = np.empty_like(ys)
+    tangents[0] = delta[0]
+    tangents[-1] = delta[-1]
+    w1 = 2 * h[1:] + h[:-1]
+    w2 = h[1:] + 2 * h[:-1]
+    same_sign = delta[:-1] * delta[1:] > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        harmonic = (w1 + w2) / (w1 / delta[:-1] + w2 / delta[1:])
+    tangents[1:-1] = np.where(same_sign, harmonic, 0.0)
+    return tangents
+
+
+def _catmull_rom_tangents(xs, ys):
+    tangents = np.empty_like(ys)
+    tangents[1:-1] = (ys[2:] - ys[:-2]) / (xs[2:] - xs[:-2])
+    tangents[0] = (ys[1] - ys[0]) / (xs[1] - xs[0])
+    tangents[-1] = (ys[-1] - ys[-2]) / (xs[-1] - xs[-2])
+    return tangents
+
+
+def _hermite(xs, ys, tangents, x):
+    idx = np.clip(np.searchsorted(xs, x, side="right") - 1, 0, len(xs) - 2)
+    h = xs[idx + 1] - xs[idx]
+    t = np.clip((x - xs[idx]) / h, 0.0, 1.0)
+    t2 = t * t
+    t3 = t2 * t
+    return ((2 * t3 - 3 * t2 + 1) * ys[idx] + (t3 - 2 * t2 + t) * h * tangents[idx]
+            + (-2 * t3 + 3 * t2) * ys[idx + 1] + (t3 - t2) * h * tangents[idx + 1])
+
+
+def make_lut_table(luts, channel_order="RGB", channels=3):
+    # R/G/BのLUTを cv2.LUT に一度で渡せる 256x1xC の表にまとめる。
+    # channel_order="BGR" なら表の並びを入れ替えるだけで、フレームの色変換は要らない
+    if channels not in (3, 4):
+        raise ValueError(f"Tone curve needs a 3 or 4 channel image, got {channels} channel(s)")
+    table = np.empty((256, 1, channels), dtype=np.uint8)
+    for dst_idx, channel in enumerate(channel_order):
+        table[:, 0, dst_idx] = luts[CHANNELS[channel]]
+    if channels == 4:
+        table[:, 0, 3] = np.arange(256) # アルファはそのまま
+    return table
+
+
+class LutTable:
+    # チャンネル順・チャンネル数ごとに表を作り置きしてLUTを1回の cv2.LUT で適用する
+    def __init__(self, luts):
+        self.luts = luts
+        self.tables = {}
+
+    def apply(self, image, out=None, channel_order="RGB"):
+        # out を渡すとそこへ書き込む（image と同じ配列でもよい）
+        channels = image.shape[2] if image.ndim == 3 else 1
+        key = (channel_order, channels)
+        table = self.tables.get(key)
+        if table is None:
+            table = self.tables[key] = make_lut_table(self.luts, channel_order, channels)
+        return cv2.LUT(image, table, dst=out)
+
+
+def apply_luts(image, luts, out=None, channel_order="RGB"):
+    return LutTable(luts).apply(image, out=out, channel_order=channel_order)
+
+
+def compose_luts(first, second):
+    # first を適用してから second を適用するのと同じLUTを返す
+    return [second[idx][first[idx]] for idx in range(3)]
+
+
+def is_identity_lut(lut):
+    return np.array_equal(lut, np.arange(256, dtype=np.uint8))
+
+
+class TonecurveProcessor(Processor):
+    # トーンカーブの計算部分（Tkに依存しないのでワーカーから安く読み込める）
+    name = "tonecurve"
+
+    def __init__(self, luts, curve_points=None, interpolation="linear"):
+        self.luts = [np.array(lut, dtype=np.uint8) for lut in luts]
+        self.curve_points = curve_points
+        self.interpolation = interpolation
+        self.table = LutTable(self.luts)
+
+    @classmethod
+    def from_curve_points(cls, curve_points, interpolation="linear"):
+        curve_points = {channel: [tuple(p) for p in points] for channel, points in curve_points.items()}
+        luts = [None] * 3
+        for channel, idx in CHANNELS.items():
+            luts[idx] = generate_lut(curve_points.get(channel, DEFAULT_CURVE_POINTS), interpolation)
+        return cls(luts, curve_points, interpolation)
+
+    @classmethod
+    def from_params(cls, params):
+        if "curve_points" in params:
+            return cls.from_curve_points(params["curve_points"], params.get("interpolation", "linear"))
+        return cls(params["luts"])
+
+    def get_params(self):
+        if self.curve_points is not None:
+            return {"curve_points": {channel: [list(p) for p in points]
+                                     for channel, points in self.curve_points.items()},
+                    "interpolation": self.interpolation}
+        return {"luts": [lut.tolist() for lut in self.luts]}
+
+    def halo(self):
+        return 0
+
+    def is_identity(self):
+        return all(is_identity_lut(lut) for lut in self.luts)
+
+    def get_luts(self):
+        return self.luts
+
+    def apply(self, image, out=None, channel_order="RGB"):
+        return self.table.apply(image, out=out, channel_order=channel_order)
+
+
+if __name__ == "__main__":
+    # 従来の split → チャンネルごとの LUT → merge と、1回の cv2.LUT を比較する
+    import time
+
+    def apply_luts_split(image, luts):
+        channels = list(cv2.split(image))
+        for idx in CHANNELS.values():
+            channels[idx] = cv2.LUT(channels[idx], luts[idx])
+        return cv2.merge(channels)
+
+    def measure(func, repeat=50):
+        func()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - start) / repeat * 1000
+
+    rng = np.random.default_rng(0)
+    luts = [generate_lut([(0, 255), (64, 150), (192, 80), (255, 0)], interpolation)
+            for interpolation in ("linear", "monotone", "catmull-rom")]
+    table = LutTable(luts)
+    for label, (height, width) in {"1080p": (1080, 1920), "4K": (2160, 3840)}.items():
+        image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        bgr = np.ascontiguousarray(image[..., ::-1])
+        out = np.empty_like(image)
+
+        expected = apply_luts_split(image, luts)
+        assert np.array_equal(table.apply(image), expected)
+        assert np.array_equal(table.apply(bgr, channel_order="BGR"), np.ascontiguousarray(expected[..., ::-1]))
+
+        split_ms = measure(lambda: apply_luts_split(image, luts))
+        single_ms = measure(lambda: table.apply(image))
+        inplace_ms = measure(lambda: table.apply(image, out=out))
+        bgr_ms = measure(lambda: table.apply(bgr, out=out, channel_order="BGR"))
+        print(f"{label}: split/merge {split_ms:.2f} ms, single LUT {single_ms:.2f} ms, "
+              f"single LUT into out= {inplace_ms:.2f} ms, BGR into out= {bgr_ms:.2f} ms")
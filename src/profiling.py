@@ -0,0 +1,205 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from array import array
+from collections import deque
+
+import numpy as np
+
+# トレースに残すイベント数の上限（古いものから捨てる）。集計はすべてのイベントで行う
+DEFAULT_MAX_EVENTS = 200000
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "frame", "start", "memory", "peak")
+
+    def __init__(self, profiler, name, frame):
+        self.profiler = profiler
+        self.name = name
+        self.frame = frame
+
+    def __enter__(self):
+        if self.profiler.trace_memory:
+            stack = self.profiler._span_stack()
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                # 入れ子のステージでピークを測り直す前に、外側のステージのピークを引き継いでおく
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.memory = self.peak = current
+            stack.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        peak = 0
+        if self.profiler.trace_memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            stack = self.profiler._span_stack()
+            if stack and stack[-1] is self:
+                stack.pop()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+            peak = self.peak - self.memory
+        self.profiler.record(self.name, self.start, end - self.start, peak, self.frame)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullProfiler:
+    # 計測しないときの既定値。呼び出し側で分岐しなくてよいように同じメソッドを持つ
+    enabled = False
+    trace_memory = False
+
+    def stage(self, name, frame=None):
+        return _NULL_SPAN
+
+    def record(self, name, start_ns, duration_ns, memory=0, frame=None, pid=None, tid=None):
+        pass
+
+    def merge(self, events):
+        pass
+
+    def drain(self):
+        return []
+
+    def close(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class FrameProfiler:
+    # ステージごとの処理時間（perf_counter_ns）を記録する。
+    # 1回の記録はタプルの追加と数値の加算だけなので、書き出し中に常時有効にしておける。
+    # trace_memory=True にすると tracemalloc で各ステージの間のメモリのピーク（開始時からの増分、バイト）も記録する。
+    # NumPy の配列（cv2 が返すものも含む）も数えられ、確保してすぐ解放した作業用の配列もピークに出る。
+    # tracemalloc はプロセス全体で1つなので、値が正しいのは1つのスレッドだけが処理しているとき
+    # （直列の書き出しや並列書き出しのワーカー側）。プレビューの描画スレッドや並列書き出しの読み書きスレッドが
+    # 同時に動いていると、その分も入る。Python の確保がすべて遅くなるので必要なときだけ使う
+    enabled = True
+
+    def __init__(self, max_events=DEFAULT_MAX_EVENTS, trace_memory=False):
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=max_events)
+        self._durations = {}
+        self._memory = {}
+        self._origin = time.perf_counter_ns()
+        self._local = threading.local()
+        self.trace_memory = trace_memory
+        # 自分で始めた tracemalloc だけを close() で止める
+        self._started_tracemalloc = trace_memory and not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start()
+
+    def close(self):
+        # 計測を終える（集計とトレースはそのまま残る）
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        self.trace_memory = False
+
+    def stage(self, name, frame=None):
+        return _Span(self, name, frame)
+
+    def _span_stack(self):
+        # スレッドごとの、今計測中のステージの入れ子
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def record(self, name, start_ns, duration_ns, memory=0, frame=None, pid=None, tid=None):
+        if pid is None:
+            pid = os.getpid()
+        if tid is None:
+            tid = threading.get_ident()
+        with self._lock:
+            self._events.append((name, pid, tid, start_ns, duration_ns, memory, frame))
+            if name not in self._durations:
+                self._durations[name] = array("q")
+                self._memory[name] = 0
+            self._durations[name].append(duration_ns)
+            self._memory[name] += memory
+
+    def merge(self, events):
+        # 別プロセス（並列書き出しのワーカー）で記録したイベントを取り込む
+        for name, pid, tid, start_ns, duration_ns, memory, frame in events:
+            self.record(name, start_ns, duration_ns, memory, frame, pid, tid)
+
+    def drain(self):
+        # 記録済みのイベントを取り出して空にする（ワーカーからメインプロセスへ送る用）
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+            self._durations.clear()
+            self._memory.clear()
+        return events
+
+    def summary(self):
+        with self._lock:
+            stages = {name: (np.frombuffer(durations, dtype=np.int64) / 1e6, self._memory[name])
+                      for name, durations in self._durations.items()}
+        result = {}
+        for name, (durations_ms, memory) in stages.items():
+            if not len(durations_ms):
+                continue
+            result[name] = {
+                "count": len(durations_ms),
+                "total_ms": float(durations_ms.sum()),
+                "mean_ms": float(durations_ms.mean()),
+                "p50_ms": float(np.percentile(durations_ms, 50)),
+                "p95_ms": float(np.percentile(durations_ms, 95)),
+                "max_ms": float(durations_ms.max()),
+                "peak_kb_mean": memory / 1024 / len(durations_ms),
+            }
+        return result
+
+    def format_summary(self):
+        summary = self.summary()
+        if not summary:
+            return "No profile data"
+        # メモリを計測していないときは列を出さない
+        memory = self.trace_memory or any(stats["peak_kb_mean"] for stats in summary.values())
+        header = f"{'stage':<24}{'count':>8}{'total':>11}{'mean':>10}{'p95':>10}{'max':>10}"
+        lines = [header + (f"{'peak KB':>10}" if memory else "")]
+        for name, stats in sorted(summary.items(), key=lambda item: -item[1]["total_ms"]):
+            line = (f"{name:<24}{stats['count']:>8}{stats['total_ms']:>9.0f}ms{stats['mean_ms']:>8.2f}ms"
+                    f"{stats['p95_ms']:>8.2f}ms{stats['max_ms']:>8.2f}ms")
+            if memory:
+                line += f"{stats['peak_kb_mean']:>10.1f}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def export_chrome_trace(self, path):
+        # chrome://tracing や Perfetto で開ける形式（時間はマイクロ秒）
+        with self._lock:
+            events = list(self._events)
+        trace_events = []
+        for name, pid, tid, start_ns, duration_ns, memory, frame in events:
+            args = {}
+            if memory:
+                args["peak_bytes"] = memory
+            if frame is not None:
+                args["frame"] = frame
+            trace_events.append({"name": name, "cat": name.split("/")[0], "ph": "X", "pid": pid, "tid": tid,
+                                 "ts": (start_ns - self._origin) / 1000, "dur": duration_ns / 1000,
+                                 "args": args})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,126 @@
+import threading
+import time
+
+STAGES = ("decode", "process", "encode")
+DEFAULT_POLL_INTERVAL_MS = 200
+DEFAULT_EMA_ALPHA = 0.3
+
+
+class ProgressChannel:
+    # 書き出しスレッドとUIの間で進捗を受け渡す。
+    # ワーカー側は数値を足し込むだけで Tk には一切触らない。UI 側は root.after で snapshot() を定期的に読む
+    def __init__(self, total_frames=0, ema_alpha=DEFAULT_EMA_ALPHA):
+        self.total_frames = total_frames
+        self.ema_alpha = ema_alpha
+        self._lock = threading.Lock()
+        self._cancel_event = threading.Event()
+        self._cancel_callbacks = []
+        self._frames = 0
+        self._stage_seconds = dict.fromkeys(STAGES, 0.0)
+        self._stage_frames = dict.fromkeys(STAGES, 0)
+        # 重複フレームの使い回し（FrameMemo）の件数
+        self._memo_hits = 0
+        self._memo_lookups = 0
+        self._start_time = None
+        self._end_time = None
+        self._done = False
+        self._error = None
+        self._summary = None
+        # snapshot() の呼び出し間隔で求める fps の指数移動平均
+        self._fps = None
+        self._last_time = None
+        self._last_frames = 0
+
+    def start(self, total_frames=None):
+        with self._lock:
+            if total_frames is not None:
+                self.total_frames = total_frames
+            self._start_time = time.perf_counter()
+            self._last_time = self._start_time
+            # 再開した書き出しで済んでいた分は速度に含めない
+            self._last_frames = self._frames
+
+    def add_stage_time(self, stage, seconds, frames=1):
+        with self._lock:
+            self._stage_seconds[stage] += seconds
+            self._stage_frames[stage] += frames
+
+    def add_memo_stats(self, hits, lookups):
+        with self._lock:
+            self._memo_hits += hits
+            self._memo_lookups += lookups
+
+    def advance(self, frames=1):
+        with self._lock:
+            self._frames += frames
+
+    def finish(self, error=None, summary=None):
+        # summary はプロファイルの集計など、終了時に表示する文字列
+        with self._lock:
+            self._end_time = time.perf_counter()
+            self._error = error
+            self._summary = summary
+            self._done = True
+
+    def cancel(self):
+        self._cancel_event.set()
+        with self._lock:
+            callbacks = list(self._cancel_callbacks)
+        for callback in callbacks:
+            callback()
+
+    def add_cancel_callback(self, callback):
+        # パイプラインの停止などを登録する。すでに中止済みならすぐに呼ぶ
+        with self._lock:
+            self._cancel_callbacks.append(callback)
+        if self._cancel_event.is_set():
+            callback()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def snapshot(self):
+        now = time.perf_counter()
+        with self._lock:
+            frames = self._frames
+            total = self.total_frames
+            start = self._start_time
+            end = self._end_time
+            stage_ms = {stage: (self._stage_seconds[stage] / self._stage_frames[stage] * 1000
+                                if self._stage_frames[stage] else 0.0)
+                        for stage in STAGES}
+            done = self._done
+            error = self._error
+            summary = self._summary
+            memo_hit_rate = self._memo_hits / self._memo_lookups if self._memo_lookups else None
+
+            if start is not None and not done and now > self._last_time:
+                rate = (frames - self._last_frames) / (now - self._last_time)
+                if self._fps is None:
+                    self._fps = rate
+                else:
+                    self._fps += self.ema_alpha * (rate - self._fps)
+                self._last_time = now
+                self._last_frames = frames
+            fps = self._fps or 0.0
+
+        elapsed = 0.0 if start is None else (end or now) - start
+        if done:
+            fps = frames / elapsed if elapsed > 0 else 0.0
+            eta = 0.0
+        else:
+            eta = (total - frames) / fps if fps > 0 else None
+        return {
+            "frames": frames,
+            "total_frames": total,
+            "elapsed": elapsed,
+            "fps": fps,
+            "eta": eta,
+            "stage_ms": stage_ms,
+            "memo_hit_rate": memo_hit_rate,
+            "done": done,
+            "cancelled": self.cancelled,
+            "error": error,
+            "summary": summary,
+        }
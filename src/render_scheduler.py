@@ -0,0 +1,132 @@
+import queue
+import threading
+import time
+
+DEFAULT_POLL_INTERVAL_MS = 8
+DEFAULT_EMA_ALPHA = 0.2
+
+
+class RenderScheduler:
+    # プレビューの処理をワーカースレッドで行い、結果だけを root.after でメインスレッドへ戻す。
+    #   - submit() は待たずに戻る。まだ始まっていない要求は最新のものに置き換える（間の要求は捨てる）
+    #   - 結果は表示中のものより新しいときだけ表示する（ドラッグ中も途中経過が出る）。
+    #     cancel() より前の要求の結果は捨てる
+    #   - 入力（submit）から表示（on_done の完了）までの時間を記録する
+    def __init__(self, root, poll_interval_ms=DEFAULT_POLL_INTERVAL_MS, ema_alpha=DEFAULT_EMA_ALPHA):
+        self.root = root
+        self.poll_interval_ms = poll_interval_ms
+        self.ema_alpha = ema_alpha
+        self._condition = threading.Condition()
+        self._pending = None
+        self._generation = 0
+        self._displayed_generation = 0
+        self._min_generation = 0
+        self._busy = False
+        self._closed = False
+        self._results = queue.Queue()
+        self._poll_id = None
+        self.rendered = 0
+        self.discarded = 0
+        self.last_latency_ms = None
+        self.average_latency_ms = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, job, on_done):
+        # job はワーカーで呼ぶ関数（Tk に触らないこと）。on_done(result) はメインスレッドで呼ばれる
+        with self._condition:
+            self._generation += 1
+            if self._pending is not None:
+                self.discarded += 1
+            self._pending = (self._generation, job, on_done, time.perf_counter())
+            self._condition.notify()
+        self._schedule_poll()
+        return self._generation
+
+    def cancel(self):
+        # 待っている要求を捨て、処理中の結果も表示しないようにする（同期的に表示したときなど）
+        with self._condition:
+            self._generation += 1
+            self._min_generation = self._generation
+            if self._pending is not None:
+                self.discarded += 1
+            self._pending = None
+
+    def is_stale(self, generation):
+        return generation < self._min_generation or generation <= self._displayed_generation
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._pending = None
+            self._condition.notify()
+        if self._poll_id is not None:
+            self.root.after_cancel(self._poll_id)
+            self._poll_id = None
+
+    def stats(self):
+        return {
+            "rendered": self.rendered,
+            "discarded": self.discarded,
+            "last_latency_ms": self.last_latency_ms,
+            "average_latency_ms": self.average_latency_ms,
+        }
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                generation, job, on_done, submitted = self._pending
+                self._pending = None
+                self._busy = True
+            try:
+                result = job()
+                error = None
+            except Exception as e:
+                result = None
+                error = e
+            with self._condition:
+                self._busy = False
+            self._results.put((generation, result, error, on_done, submitted))
+
+    def _schedule_poll(self):
+        if self._poll_id is None and not self._closed:
+            self._poll_id = self.root.after(self.poll_interval_ms, self._poll)
+
+    def _poll(self):
+        self._poll_id = None
+        latest = None
+        while True:
+            try:
+                item = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if self.is_stale(item[0]):
+                self.discarded += 1
+            else:
+                if latest is not None:
+                    self.discarded += 1
+                latest = item
+
+        try:
+            if latest is not None:
+                generation, result, error, on_done, submitted = latest
+                self._displayed_generation = generation
+                if error is not None:
+                    raise error
+                on_done(result)
+                self.rendered += 1
+                self.last_latency_ms = (time.perf_counter() - submitted) * 1000
+                if self.average_latency_ms is None:
+                    self.average_latency_ms = self.last_latency_ms
+                else:
+                    self.average_latency_ms += self.ema_alpha * (self.last_latency_ms - self.average_latency_ms)
+        finally:
+            # 処理中・待ち中の要求があれば引き続き結果を見に行く
+            with self._condition:
+                waiting = self._pending is not None or self._busy
+            if waiting or not self._results.empty():
+                self._schedule_poll()
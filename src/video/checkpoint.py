@@ -0,0 +1,218 @@
+import bisect
+import json
+import math
+import os
+import shutil
+import threading
+
+from video.ffmpeg_writer import FFmpegWriter, concat_segments
+from video.index import file_signature
+from video.probe import probe_video, probe_keyframes
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+WORK_DIR_SUFFIX = ".export"
+# 中止・異常終了で失う作業はチャンク1つ分まで
+DEFAULT_CHUNK_SECONDS = 10.0
+# チャンクが短すぎるとエンコーダの立ち上げの割合が大きくなる
+MIN_CHUNK_SECONDS = 2.0
+
+
+def export_work_dir(output_path):
+    # 出力先ごとの作業フォルダ（出力先の横の隠しフォルダ）。同じ出力先への書き出し直しで再開に使う
+    directory, name = os.path.split(os.path.abspath(output_path))
+    return os.path.join(directory, "." + name + WORK_DIR_SUFFIX)
+
+
+def plan_segments(keyframes, frame_count, count, min_frames=1):
+    # 均等に割った位置に一番近いキーフレームで区切る。各区間はキーフレームから始まるので単独でデコードできる
+    candidates = sorted(k for k in keyframes if 0 < k < frame_count)
+    bounds = [0]
+    for i in range(1, count):
+        if not candidates:
+            break
+        target = frame_count * i / count
+        j = bisect.bisect_left(candidates, target)
+        nearest = min(candidates[max(0, j - 1):j + 1], key=lambda k: abs(k - target))
+        if nearest - bounds[-1] >= min_frames and frame_count - nearest >= min_frames:
+            bounds.append(nearest)
+    bounds.append(frame_count)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def plan_chunks(source_path, count=None, chunk_seconds=DEFAULT_CHUNK_SECONDS):
+    # count を省くと chunk_seconds 秒くらいずつに区切る
+    info = probe_video(source_path)
+    keyframes = probe_keyframes(source_path, info.fps)
+    if count is None:
+        count = max(1, math.ceil(info.frame_count / max(1.0, chunk_seconds * info.fps)))
+    min_frames = max(1, int(MIN_CHUNK_SECONDS * info.fps))
+    return info, plan_segments(keyframes, info.frame_count, count, min_frames)
+
+
+def export_params(processor, encoder_options, memo_threshold=None):
+    # 再開してよいかの判定に使う設定。処理のパラメータ、エンコード設定、処理結果の使い回し（None ならしない）の
+    # どれかが変わったら最初からやり直す
+    return {"processor": processor.name, "params": processor.get_params(), "encoder": dict(encoder_options),
+            "memo_threshold": memo_threshold}
+
+
+class ExportCheckpoint:
+    # 1回の書き出しの作業フォルダと manifest.json。
+    # チャンクは閉じてファイル名を確定させたものから manifest に記録するので、中止や異常終了の後に
+    # 同じ設定で同じ出力先へ書き出すと、終わったチャンクを飛ばして続きから再開できる。
+    # manifest は一時ファイルに書いてから置き換えるので、書きかけの manifest を読むことはない
+    def __init__(self, work_dir, manifest):
+        self.work_dir = work_dir
+        self.manifest = manifest
+        self.completed = set(manifest["completed"])
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, source_path, output_path, params, count=None, chunk_seconds=DEFAULT_CHUNK_SECONDS):
+        work_dir = export_work_dir(output_path)
+        source = {"path": os.path.abspath(source_path), "signature": file_signature(source_path).tolist()}
+        # JSON を通した形にそろえて比べる
+        params = json.loads(json.dumps(params))
+        manifest = _read_manifest(work_dir)
+        if manifest is not None and manifest.get("version") == MANIFEST_VERSION \
+                and manifest.get("source") == source and manifest.get("params") == params:
+            return cls(work_dir, manifest)
+
+        # 設定や元の動画が変わっていたら前回の作業は使えない
+        shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir)
+        info, chunks = plan_chunks(source_path, count, chunk_seconds)
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "source": source,
+            "params": params,
+            "width": info.width,
+            "height": info.height,
+            "fps": info.fps,
+            "frame_count": info.frame_count,
+            "chunks": [list(chunk) for chunk in chunks],
+            "completed": [],
+        }
+        checkpoint = cls(work_dir, manifest)
+        checkpoint._save()
+        return checkpoint
+
+    @property
+    def chunks(self):
+        return [tuple(chunk) for chunk in self.manifest["chunks"]]
+
+    @property
+    def frame_count(self):
+        return self.manifest["frame_count"]
+
+    def chunk_path(self, chunk):
+        return os.path.join(self.work_dir, f"chunk_{chunk:05d}.mp4")
+
+    def temp_chunk_path(self, chunk):
+        # 書きかけのチャンク。閉じてから chunk_path へ置き換える
+        return os.path.join(self.work_dir, f"chunk_{chunk:05d}.tmp.mp4")
+
+    def is_done(self, chunk):
+        return chunk in self.completed and os.path.exists(self.chunk_path(chunk))
+
+    def pending(self):
+        return [chunk for chunk in range(len(self.manifest["chunks"])) if not self.is_done(chunk)]
+
+    def pending_runs(self):
+        # 未完了のチャンクの連続した並び (first, last)。並びごとに1回だけシークすればよい
+        runs = []
+        for chunk in self.pending():
+            if runs and runs[-1][1] == chunk - 1:
+                runs[-1][1] = chunk
+            else:
+                runs.append([chunk, chunk])
+        return [tuple(run) for run in runs]
+
+    def frames_done(self):
+        return sum(end - start for chunk, (start, end) in enumerate(self.chunks) if self.is_done(chunk))
+
+    def mark_done(self, chunk):
+        # 書き込みスレッドやワーカーの完了通知から呼ばれる
+        with self._lock:
+            self.completed.add(chunk)
+            self.manifest["completed"] = sorted(self.completed)
+            self._save()
+
+    def finalize(self, output_path, audio_source=None, audio_codec="copy"):
+        # 全チャンクをストリームコピーでつなぎ、音声を付けてから作業フォルダを消す
+        pending = self.pending()
+        if pending:
+            raise RuntimeError(f"{len(pending)} chunk(s) are not finished")
+        paths = [self.chunk_path(chunk) for chunk in range(len(self.manifest["chunks"]))]
+        concat_segments(paths, output_path, audio_source=audio_source, audio_codec=audio_codec)
+        self.discard()
+
+    def discard(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _save(self):
+        path = os.path.join(self.work_dir, MANIFEST_NAME)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(temp_path, path)
+
+
+def _read_manifest(work_dir):
+    path = os.path.join(work_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring export manifest {path}: {e}")
+        return None
+
+
+class ChunkedWriter:
+    # FFmpegWriter と同じように使える書き出し。checkpoint のチャンク first..last を順に書き、
+    # チャンクの最後のフレームを書いたらその場で閉じて完了を記録する
+    def __init__(self, checkpoint, first, last, encoder_options=None):
+        self.checkpoint = checkpoint
+        self.chunk = first
+        self.last = last
+        self.encoder_options = encoder_options or {}
+        self.writer = None
+        self.remaining = 0
+
+    def write(self, frame):
+        if self.writer is None:
+            if self.chunk > self.last:
+                raise RuntimeError("More frames than planned chunks")
+            self._open_chunk()
+        self.writer.write(frame)
+        self.remaining -= 1
+        if self.remaining == 0:
+            self._close_chunk()
+
+    def release(self):
+        # 入力が予定より早く終わったときは、書いた分までで最後のチャンクを閉じる
+        if self.writer is not None:
+            self._close_chunk()
+
+    def abort(self):
+        # 書きかけのチャンクだけを捨てる（終わったチャンクは次回の再開に使う）
+        if self.writer is not None:
+            self.writer.abort()
+            self.writer = None
+
+    def _open_chunk(self):
+        manifest = self.checkpoint.manifest
+        start, end = self.checkpoint.chunks[self.chunk]
+        self.remaining = end - start
+        self.writer = FFmpegWriter(self.checkpoint.temp_chunk_path(self.chunk), manifest["width"],
+                                   manifest["height"], manifest["fps"], **self.encoder_options)
+
+    def _close_chunk(self):
+        self.writer.release()
+        self.writer = None
+        os.replace(self.checkpoint.temp_chunk_path(self.chunk), self.checkpoint.chunk_path(self.chunk))
+        self.checkpoint.mark_done(self.chunk)
+        self.chunk += 1
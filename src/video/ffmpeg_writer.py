@@ -0,0 +1,121 @@
+import os
+import shutil
+import subprocess
+import threading
+
+import numpy as np
+
+DEFAULT_CODEC = "libx264"
+DEFAULT_CRF = 18
+DEFAULT_PRESET = "medium"
+DEFAULT_THREADS = 0 # 0 は ffmpeg に任せる
+CODECS = ("libx264", "libx265", "mpeg4")
+PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow")
+# -crf / -preset を受け付けるエンコーダ
+CRF_CODECS = ("libx264", "libx265")
+# mpeg4 は CRF の代わりに固定量子化 -q:v（1..31、小さいほど高画質）で画質を決める。
+# 何も指定しないと 200kb/s の既定ビットレートになり、大きな画面では使えない画質になる
+QSCALE_CODECS = ("mpeg4",)
+# CRF と -q:v の対応（x264 の CRF 18 / 23 と見た目の画質がおおよそ同じ値）
+CRF_TO_QSCALE = ((0, 18, 23, 51), (1, 3, 5, 31))
+
+
+def get_ffmpeg_exe():
+    # moviepy が使う imageio-ffmpeg のバイナリを優先し、なければ PATH 上の ffmpeg を使う
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return shutil.which("ffmpeg") or "ffmpeg"
+
+
+def crf_to_qscale(crf):
+    return int(round(np.interp(crf, *CRF_TO_QSCALE)))
+
+
+class FFmpegWriter:
+    # 処理済みのBGRフレームを ffmpeg の標準入力へそのまま流し込んで1回でエンコードする。
+    # audio_source を渡すと、その音声を再エンコードせずにコピーする。
+    # cv2.VideoWriter と同じ write() / release() で使える
+    def __init__(self, output_path, width, height, fps, audio_source=None, codec=DEFAULT_CODEC,
+                 crf=DEFAULT_CRF, preset=DEFAULT_PRESET, threads=DEFAULT_THREADS, audio_codec="copy"):
+        self.output_path = output_path
+        self.frame_shape = (height, width, 3)
+        command = [get_ffmpeg_exe(), "-y", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps}",
+                   "-i", "-"]
+        if audio_source is not None:
+            # 音声がない動画でも失敗しないよう "1:a?" で任意にする
+            command += ["-i", audio_source, "-map", "0:v:0", "-map", "1:a?", "-c:a", audio_codec, "-shortest"]
+        command += ["-c:v", codec]
+        if codec in CRF_CODECS:
+            command += ["-crf", str(crf), "-preset", preset]
+        elif codec in QSCALE_CODECS:
+            command += ["-q:v", str(crf_to_qscale(crf))]
+        if width % 2 or height % 2:
+            # 4:2:0 は幅・高さが偶数でないとエンコードできないので、右と下に1画素ずつ黒を足す
+            # （4:4:4 はプレーヤーや mpeg4 が対応していないことがある）
+            command += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+        command += ["-pix_fmt", "yuv420p", "-threads", str(threads), output_path]
+
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        # エラー出力でパイプが詰まらないよう別スレッドで読み出しておく
+        self.stderr = []
+        self.stderr_thread = threading.Thread(target=self._read_stderr, daemon=True)
+        self.stderr_thread.start()
+
+    def write(self, frame):
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match {self.frame_shape}")
+        try:
+            # 連続した配列ならコピーせずにバッファをそのまま渡す
+            self.process.stdin.write(memoryview(np.ascontiguousarray(frame)).cast("B"))
+        except BrokenPipeError:
+            self.release()
+            raise
+
+    def release(self):
+        if self.process.stdin and not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        self.process.wait()
+        self.stderr_thread.join()
+        if self.process.returncode != 0:
+            message = b"".join(self.stderr).decode(errors="replace").strip()
+            raise RuntimeError(f"ffmpeg exited with code {self.process.returncode}: {message}")
+
+    def abort(self):
+        # 書き出しの中止用。ffmpeg を止めて途中までの出力ファイルを削除する
+        if self.process.stdin and not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        self.process.kill()
+        self.process.wait()
+        self.stderr_thread.join()
+        if os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+    def _read_stderr(self):
+        for line in self.process.stderr:
+            self.stderr.append(line)
+
+
+def concat_segments(segment_paths, output_path, audio_source=None, audio_codec="copy"):
+    # 同じ設定でエンコードした区間を再エンコードせずにつなぎ、元の音声を付ける
+    list_path = os.path.join(os.path.dirname(os.path.abspath(segment_paths[0])), "concat.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    command = [get_ffmpeg_exe(), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_source is not None:
+        command += ["-i", audio_source, "-map", "0:v:0", "-map", "1:a?", "-c:a", audio_codec, "-shortest"]
+    command += ["-c:v", "copy", output_path]
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        message = result.stderr.decode(errors="replace").strip()
+        raise RuntimeError(f"ffmpeg exited with code {result.returncode}: {message}")
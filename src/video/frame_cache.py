@@ -0,0 +1,148 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+
+from video.index import seek_capture
+
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+DEFAULT_PREFETCH_AHEAD = 30
+DEFAULT_PREFETCH_BEHIND = 10
+
+DECODED = "decoded"
+PROCESSED = "processed"
+
+
+class FrameCache:
+    # メモリ使用量で上限を決めるLRUキャッシュ。
+    # キーは (DECODED, フレーム番号) または (PROCESSED, フレーム番号, 処理パラメータ)
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            frame = self.entries.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return frame
+
+    def contains(self, key):
+        # 統計やLRUの順序には影響させない（先読み用）
+        with self.lock:
+            return key in self.entries
+
+    def put(self, key, frame):
+        if frame.nbytes > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old.nbytes
+            self.entries[key] = frame
+            self.bytes += frame.nbytes
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+
+    def invalidate_processed(self):
+        # 処理パラメータが変わったときは処理済みのフレームだけを捨てる
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == PROCESSED]:
+                self.bytes -= self.entries.pop(key).nbytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class FramePrefetcher:
+    # 再生位置の前後のフレームを別スレッドで順番にデコードしてキャッシュに入れる
+    def __init__(self, file_path, cache, ahead=DEFAULT_PREFETCH_AHEAD, behind=DEFAULT_PREFETCH_BEHIND, index=None):
+        self.cache = cache
+        # キーフレームの索引（あればシークは直前のキーフレームから読み進める）
+        self.index = index
+        self.ahead = ahead
+        self.behind = behind
+        self.capture = cv2.VideoCapture(file_path)
+        self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.position = 0  # capture が次に読むフレーム番号
+        self.playhead = None
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self._prefetch_loop, daemon=True)
+        self.thread.start()
+
+    def set_index(self, index):
+        self.index = index
+
+    def update(self, playhead):
+        with self.condition:
+            self.playhead = int(playhead)
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join()
+        self.capture.release()
+
+    def _window(self, playhead, frame_bytes):
+        # キャッシュの半分を超えない範囲で、前方を優先して先読みする
+        limit = max(1, self.cache.max_bytes // 2 // max(1, frame_bytes))
+        ahead = min(self.ahead, limit)
+        behind = min(self.behind, max(0, limit - ahead))
+        start = max(0, playhead - behind)
+        end = min(self.frame_count, playhead + ahead + 1)
+        return list(range(playhead, end)) + list(range(start, playhead))
+
+    def _prefetch_loop(self):
+        frame_bytes = 0
+        while True:
+            with self.condition:
+                while self.running and self.playhead is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                playhead = self.playhead
+                self.playhead = None
+
+            for index in self._window(playhead, frame_bytes):
+                if not self.running or self.playhead is not None:
+                    break  # 再生位置が変わったら窓を計算し直す
+                if self.cache.contains((DECODED, index)):
+                    continue
+                if index != self.position:
+                    position = None if self.position < 0 else self.position
+                    if seek_capture(self.capture, position, index, self.index) != index:
+                        self.position = -1
+                        continue
+                ret, frame = self.capture.read()
+                if not ret:
+                    self.position = -1
+                    continue
+                self.position = index + 1
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                frame_bytes = frame.nbytes
+                self.cache.put((DECODED, index), frame)
@@ -0,0 +1,169 @@
+import bisect
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from video.probe import probe_video, probe_keyframe_times, keyframe_indices
+
+INDEX_VERSION = 1
+SIDECAR_SUFFIX = ".index.npz"
+DEFAULT_THUMBNAIL_COUNT = 64
+DEFAULT_THUMBNAIL_HEIGHT = 54
+
+
+def sidecar_path(file_path):
+    # 動画と同じフォルダに隠しファイルとして置く
+    directory, name = os.path.split(os.path.abspath(file_path))
+    return os.path.join(directory, "." + name + SIDECAR_SUFFIX)
+
+
+def file_signature(file_path):
+    # 動画が置き換えられたらキャッシュを使わない
+    stat = os.stat(file_path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+class VideoIndex:
+    # キーフレームの位置と時刻、タイムライン用の縮小画像（RGB）をまとめたもの
+    def __init__(self, frame_count, fps, keyframes, keyframe_times, thumbnail_frames, thumbnails):
+        self.frame_count = int(frame_count)
+        self.fps = float(fps)
+        self.keyframes = [int(k) for k in keyframes] or [0]
+        self.keyframe_times = [float(t) for t in keyframe_times]
+        self.thumbnail_frames = [int(i) for i in thumbnail_frames]
+        self.thumbnails = thumbnails
+
+    def keyframe_before(self, frame_index):
+        # frame_index 以前で最も近いキーフレーム（そこから読み進めれば frame_index に着く）
+        position = bisect.bisect_right(self.keyframes, frame_index) - 1
+        return self.keyframes[max(0, position)]
+
+    def thumbnail_at(self, frame_index):
+        # frame_index 以前で最も近い縮小画像の番号
+        position = bisect.bisect_right(self.thumbnail_frames, frame_index) - 1
+        return max(0, position)
+
+    def save(self, file_path, signature):
+        # 書きかけのファイルを読まないように、一時ファイルに書いてから置き換える
+        temp_path = file_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(f, version=INDEX_VERSION, signature=signature,
+                     info=np.array([self.frame_count, self.fps]),
+                     keyframes=np.array(self.keyframes, dtype=np.int64),
+                     keyframe_times=np.array(self.keyframe_times, dtype=np.float64),
+                     thumbnail_frames=np.array(self.thumbnail_frames, dtype=np.int64),
+                     thumbnails=self.thumbnails)
+        os.replace(temp_path, file_path)
+
+    @classmethod
+    def load(cls, file_path, signature):
+        # 版や元の動画が違えば None
+        with np.load(file_path) as data:
+            if int(data["version"]) != INDEX_VERSION or not np.array_equal(data["signature"], signature):
+                return None
+            frame_count, fps = data["info"]
+            return cls(frame_count, fps, data["keyframes"].tolist(), data["keyframe_times"].tolist(),
+                       data["thumbnail_frames"].tolist(), data["thumbnails"])
+
+
+def build_video_index(file_path, thumbnail_count=DEFAULT_THUMBNAIL_COUNT, thumbnail_height=DEFAULT_THUMBNAIL_HEIGHT,
+                      cancelled=None):
+    # キーフレームだけを読んで索引を作る。縮小画像は等間隔の位置に一番近いキーフレームから作るので、
+    # 間のフレームはデコードしない
+    info = probe_video(file_path)
+    times = probe_keyframe_times(file_path)
+    keyframes = keyframe_indices(times, info.fps)
+
+    count = max(1, min(thumbnail_count, len(keyframes)))
+    targets = np.linspace(0, max(0, info.frame_count - 1), count)
+    thumbnail_frames = sorted({keyframes[max(0, bisect.bisect_right(keyframes, t) - 1)] for t in targets})
+    thumbnail_width = max(1, round(info.width * thumbnail_height / max(1, info.height)))
+    thumbnails = np.zeros((len(thumbnail_frames), thumbnail_height, thumbnail_width, 3), dtype=np.uint8)
+
+    capture = cv2.VideoCapture(file_path)
+    try:
+        for i, frame_index in enumerate(thumbnail_frames):
+            if cancelled is not None and cancelled():
+                return None
+            capture.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+            ret, frame = capture.read()
+            if not ret:
+                continue
+            small = cv2.resize(frame, (thumbnail_width, thumbnail_height), interpolation=cv2.INTER_AREA)
+            thumbnails[i] = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+    finally:
+        capture.release()
+    return VideoIndex(info.frame_count, info.fps, keyframes, times, thumbnail_frames, thumbnails)
+
+
+def load_or_build_index(file_path, cancelled=None, **kwargs):
+    # 保存済みの索引があればそれを使い、なければ作って保存する（保存できないフォルダなら保存しない）
+    signature = file_signature(file_path)
+    cache_path = sidecar_path(file_path)
+    if os.path.exists(cache_path):
+        try:
+            index = VideoIndex.load(cache_path, signature)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring video index {cache_path}: {e}")
+            index = None
+        if index is not None:
+            return index
+    index = build_video_index(file_path, cancelled=cancelled, **kwargs)
+    if index is not None:
+        try:
+            index.save(cache_path, signature)
+        except OSError as e:
+            print(f"Cannot save video index {cache_path}: {e}")
+    return index
+
+
+def seek_capture(capture, position, target, index=None, cancelled=None):
+    # 次の read() が target を返すように capture を動かし、その位置を返す（position は今の位置。不明なら None）。
+    # 索引があれば target 以前で最も近いキーフレームへシークし、そこから grab() で読み進める
+    # （フレーム番号でのシークはコンテナによってはずれるが、キーフレームの時刻なら正確に着く）。
+    # 今の位置が target と同じキーフレームの区間にあるなら、シークせずにそのまま読み進める。
+    # 索引がなければ OpenCV のシークに任せる。cancelled() が真になったら途中の位置で戻る
+    if index is None:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, target)
+        return target
+    keyframe = index.keyframe_before(target)
+    if position is None or not keyframe <= position <= target:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+        position = keyframe
+    while position < target:
+        if cancelled is not None and cancelled():
+            break
+        if not capture.grab():
+            break
+        position += 1
+    return position
+
+
+class VideoIndexer:
+    # 索引をバックグラウンドのスレッドで作る（保存済みならすぐに終わる）。
+    # 結果は result に入るので、UI 側は root.after で done を見に行く
+    def __init__(self, file_path, **kwargs):
+        self.file_path = file_path
+        self.result = None
+        self.error = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, kwargs=kwargs, daemon=True)
+        self._thread.start()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _run(self, **kwargs):
+        try:
+            self.result = load_or_build_index(self.file_path, cancelled=self._cancel.is_set, **kwargs)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._done.set()
@@ -0,0 +1,72 @@
+import json
+
+import cv2
+import numpy as np
+
+# 覚えておくフレーム数（処理前と処理後を1枚ずつ持つ）
+DEFAULT_MEMO_CAPACITY = 4
+# 候補探しの署名に使う間引き幅。一致したら全画素で確かめる
+SIGNATURE_STEP = 16
+
+
+class FrameMemo:
+    # 同じ（または差が threshold 以下の）フレームには前の処理結果をそのまま返す。
+    # 画面収録や監視カメラのように静止した区間が長い動画で、処理（と旧来モジュールの PIL 変換）を省く。
+    #   - threshold=0: 署名が一致したフレームを全画素で比べ、完全に同じときだけ使い回す（出力は処理した場合と同一）
+    #   - threshold>0: 直近に処理したフレームとの平均絶対差（0..255）が threshold 以下なら使い回す。
+    #     比べる相手は結果を作った元のフレームなので、ゆっくりした変化が積み重なって取り残されることはない
+    # キーには処理のパラメータも含めるので、パラメータの違う結果を取り違えない
+    def __init__(self, processor, threshold=0, capacity=DEFAULT_MEMO_CAPACITY):
+        self.processor = processor
+        self.threshold = float(threshold)
+        self.capacity = max(1, int(capacity))
+        self.params_key = json.dumps(processor.get_params(), sort_keys=True) if processor.portable else None
+        self._entries = []  # (キー, 処理前, 処理後)。新しいものが末尾
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def lookups(self):
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def apply(self, image, **kwargs):
+        # kwargs は処理するときだけ processor.apply へ渡す（profiler, frame など）
+        key = (self.params_key, image.shape, hash(image[::SIGNATURE_STEP, ::SIGNATURE_STEP].tobytes()))
+        entry = self._find(key, image)
+        if entry is not None:
+            self.hits += 1
+            return entry[2]
+        self.misses += 1
+        processed = self.processor.apply(image, **kwargs)
+        self._entries.append((key, image, processed))
+        if len(self._entries) > self.capacity:
+            del self._entries[0]
+        return processed
+
+    def __call__(self, image):
+        return self.apply(image)
+
+    def _find(self, key, frame):
+        for entry in reversed(self._entries):
+            if entry[0] == key and np.array_equal(entry[1], frame):
+                return entry
+        if self.threshold > 0 and self._entries:
+            latest = self._entries[-1]
+            if latest[0][:2] == key[:2] and _mean_difference(latest[1], frame) <= self.threshold:
+                return latest
+        return None
+
+    def drain(self):
+        # 前回から増えた (hits, lookups) を返して数え直す（ワーカーから進捗へ送る用）
+        counts = (self.hits, self.lookups)
+        self.hits = 0
+        self.misses = 0
+        return counts
+
+
+def _mean_difference(a, b):
+    return float(np.mean(cv2.mean(cv2.absdiff(a, b))[:a.shape[2] if a.ndim == 3 else 1]))
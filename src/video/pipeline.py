@@ -0,0 +1,192 @@
+import os
+import queue
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from processing.chain import ProcessingChain
+from profiling import FrameProfiler, NULL_PROFILER
+from video.memo import FrameMemo
+
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+DEFAULT_QUEUE_DEPTH = 4
+DEFAULT_BATCH_SIZE = 8
+
+# ワーカープロセスごとに一度だけ受け取る処理関数
+_frame_processor = None
+_profiler = NULL_PROFILER
+_memo = None
+
+
+def _init_worker(frame_processor, profile=False, memo_threshold=None, trace_memory=False):
+    global _frame_processor, _profiler, _memo
+    _frame_processor = frame_processor
+    _profiler = FrameProfiler(trace_memory=trace_memory) if profile else NULL_PROFILER
+    # memo_threshold が None でなければ重複フレームの処理結果を使い回す（ワーカーごと）
+    _memo = FrameMemo(frame_processor, memo_threshold) if memo_threshold is not None else None
+
+
+def _process_frame(frame, index):
+    kwargs = {}
+    if _profiler.enabled and isinstance(_frame_processor, ProcessingChain):
+        kwargs = {"profiler": _profiler, "frame": index}
+    if _memo is not None:
+        return _memo.apply(frame, **kwargs)
+    if kwargs:
+        return _frame_processor.apply(frame, **kwargs)
+    return _frame_processor(frame)
+
+
+def _process_batch(first_index, frames):
+    # 処理時間も一緒に返して、進捗表示で段ごとの時間を出せるようにする。
+    # プロファイル中はワーカー側で記録したイベントも、使い回しをしているときは (hits, lookups) も一緒に返す。
+    # 使い回した結果は同じ配列なので、プロセス間では1回しか送られない
+    start = time.perf_counter()
+    processed = []
+    for i, frame in enumerate(frames):
+        with _profiler.stage("process", first_index + i):
+            processed.append(_process_frame(frame, first_index + i))
+    memo_stats = _memo.drain() if _memo is not None else None
+    return processed, time.perf_counter() - start, _profiler.drain(), memo_stats
+
+
+class ParallelFramePipeline:
+    # デコード → プロセスプールでの処理 → 順序どおりの書き込み、の3段パイプライン
+    def __init__(self, frame_processor, workers=DEFAULT_WORKERS, queue_depth=DEFAULT_QUEUE_DEPTH,
+                 batch_size=DEFAULT_BATCH_SIZE, memo_threshold=None):
+        self.frame_processor = frame_processor
+        self.workers = max(1, int(workers))
+        self.queue_depth = max(1, int(queue_depth))
+        self.batch_size = max(1, int(batch_size))
+        self.memo_threshold = memo_threshold
+        self._stop = threading.Event()
+        self._errors = []
+
+    def run(self, video_capture, writer, total_frames, progress=None, profiler=NULL_PROFILER):
+        # progress は ProgressChannel。書き込みスレッドからバッチ単位で進捗を送る
+        # profiler を渡すとデコード・処理・エンコードをフレームごとに記録する
+        self._stop.clear()
+        self._errors = []
+        decoded = queue.Queue(maxsize=self.queue_depth)
+        pending = queue.Queue(maxsize=self.queue_depth)
+
+        decoder = _StageThread(target=self._decode, args=(video_capture, total_frames, decoded, progress, profiler),
+                               errors=self._errors, stop=self._stop)
+        encoder = _StageThread(target=self._write, args=(writer, total_frames, pending, progress, profiler),
+                               errors=self._errors, stop=self._stop)
+
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                 initializer=_init_worker,
+                                 initargs=(self.frame_processor, profiler.enabled, self.memo_threshold,
+                                           profiler.trace_memory)) as executor:
+            decoder.start()
+            encoder.start()
+            try:
+                while True:
+                    item = self._get(decoded)
+                    if item is None:
+                        break
+                    first_index, batch = item
+                    # pending が埋まっている間は投入を待つので、処理中のバッチ数は queue_depth で頭打ちになる
+                    self._put(pending, (first_index, executor.submit(_process_batch, first_index, batch)))
+            except BaseException as e:
+                self._errors.append(e)
+                self._stop.set()
+            finally:
+                self._put(pending, None, force=True)
+                decoder.join()
+                encoder.join()
+                if self._stop.is_set():
+                    executor.shutdown(wait=True, cancel_futures=True)
+
+        if self._errors:
+            raise self._errors[0]
+
+    def cancel(self):
+        self._stop.set()
+
+    def _decode(self, video_capture, total_frames, decoded, progress, profiler):
+        batch = []
+        first_index = 0
+        start = time.perf_counter()
+        for index in range(total_frames):
+            if self._stop.is_set():
+                break
+            with profiler.stage("decode", index):
+                ret, frame = video_capture.read()
+            if not ret:
+                break
+            batch.append(frame)
+            if len(batch) == self.batch_size:
+                if progress is not None:
+                    progress.add_stage_time("decode", time.perf_counter() - start, len(batch))
+                self._put(decoded, (first_index, batch))
+                first_index = index + 1
+                batch = []
+                start = time.perf_counter()
+        if batch:
+            if progress is not None:
+                progress.add_stage_time("decode", time.perf_counter() - start, len(batch))
+            self._put(decoded, (first_index, batch))
+        self._put(decoded, None, force=True)
+
+    def _write(self, writer, total_frames, pending, progress, profiler):
+        while True:
+            item = self._get(pending)
+            if item is None:
+                break
+            first_index, future = item
+            frames, process_seconds, events, memo_stats = future.result()
+            profiler.merge(events)
+            start = time.perf_counter()
+            for i, frame in enumerate(frames):
+                with profiler.stage("encode", first_index + i):
+                    writer.write(frame)
+            if progress is not None:
+                progress.add_stage_time("process", process_seconds, len(frames))
+                progress.add_stage_time("encode", time.perf_counter() - start, len(frames))
+                if memo_stats is not None:
+                    progress.add_memo_stats(*memo_stats)
+                progress.advance(len(frames))
+
+    def _get(self, q):
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return None
+
+    def _put(self, q, item, force=False):
+        # force=True は終端マーカー用。停止中でも空きができるまで古い要素を捨てて入れる
+        while True:
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if self._stop.is_set():
+                    if not force:
+                        return
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
+
+
+class _StageThread(threading.Thread):
+    # 例外を記録してパイプライン全体を止めるスレッド
+    def __init__(self, target, args, errors, stop):
+        super().__init__(daemon=True)
+        self._target_func = target
+        self._args = args
+        self._errors = errors
+        self._stop_event = stop
+
+    def run(self):
+        try:
+            self._target_func(*self._args)
+        except BaseException as e:
+            self._errors.append(e)
+            self._stop_event.set()
@@ -0,0 +1,122 @@
+import threading
+from collections import deque
+
+import cv2
+
+from video.index import seek_capture
+
+DEFAULT_BUFFER_SIZE = 32
+
+
+class PlaybackEngine:
+    # バックグラウンドのスレッドでフレームを順番にデコードし、リングバッファに溜める。
+    # シークは要求されたフレームがバッファの範囲外にあるときだけ行う。
+    # キーフレームの索引があれば、直前のキーフレームから必要な分だけ読み進める
+    def __init__(self, file_path, buffer_size=DEFAULT_BUFFER_SIZE, index=None):
+        self.file_path = file_path
+        self.buffer_size = max(1, int(buffer_size))
+        self.capture = cv2.VideoCapture(file_path)
+        self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.index = index
+        self.position = 0  # capture が次に読むフレーム番号（不明なら None）
+
+        self.buffer = deque()  # (フレーム番号, RGBのndarray)
+        self.condition = threading.Condition()
+        self.next_index = 0  # デコーダが次に読むフレーム番号
+        self.seek_request = None
+        self.end_of_stream = False
+        self.seek_count = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._decode_loop, daemon=True)
+        self.thread.start()
+
+    def set_index(self, index):
+        # 索引はバックグラウンドで作るので、できあがったら後から渡す
+        self.index = index
+
+    def seek(self, frame_index):
+        with self.condition:
+            self._request_seek(frame_index)
+
+    def get_frame(self, frame_index, timeout=None):
+        # frame_index より前のフレームは捨てる。timeout 内に届かなければ None を返す
+        with self.condition:
+            if self._needs_seek(frame_index):
+                self._request_seek(frame_index)
+            while True:
+                while self.buffer and self.buffer[0][0] < frame_index:
+                    self.buffer.popleft()
+                    self.condition.notify_all()
+                if self.buffer and self.buffer[0][0] == frame_index:
+                    return self.buffer[0][1]
+                if self.end_of_stream and self.seek_request is None and not self.buffer:
+                    return None
+                if not self.condition.wait(timeout):
+                    return None
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join()
+        self.capture.release()
+
+    def _needs_seek(self, frame_index):
+        if self.seek_request is not None:
+            return self.seek_request > frame_index
+        if self.buffer:
+            first = self.buffer[0][0]
+        else:
+            first = self.next_index
+        # 戻る場合と、順に読むより遠くへ飛ぶ場合だけシークする
+        return frame_index < first or frame_index >= self.next_index + self.buffer_size
+
+    def _request_seek(self, frame_index):
+        self.seek_request = max(0, min(int(frame_index), max(0, self.frame_count - 1)))
+        self.buffer.clear()
+        self.end_of_stream = False
+        self.condition.notify_all()
+
+    def _decode_loop(self):
+        while True:
+            with self.condition:
+                while self.running and self.seek_request is None and \
+                        (len(self.buffer) >= self.buffer_size or self.end_of_stream):
+                    self.condition.wait()
+                if not self.running:
+                    return
+                target = self.seek_request
+                if target is not None:
+                    self.next_index = target
+                    self.seek_request = None
+                    self.seek_count += 1
+                index = self.next_index
+
+            if target is not None:
+                # 読み進めている間もシークを受け付けられるよう、ロックの外で動かす
+                self.position = seek_capture(self.capture, self.position, target, self.index,
+                                             cancelled=lambda: self.seek_request is not None or not self.running)
+                if self.position != target:
+                    # 途中で次のシークが来たか、末尾を越えた
+                    with self.condition:
+                        if self.seek_request is None:
+                            self.end_of_stream = True
+                            self.condition.notify_all()
+                    continue
+
+            ret, frame = self.capture.read()
+            self.position = index + 1 if ret else None
+            if ret:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+            with self.condition:
+                # 読み込み中にシークが要求されたらこのフレームは捨てる
+                if self.seek_request is not None:
+                    continue
+                if ret:
+                    self.buffer.append((index, frame))
+                    self.next_index = index + 1
+                else:
+                    self.end_of_stream = True
+                self.condition.notify_all()
@@ -0,0 +1,67 @@
+import re
+import shutil
+import subprocess
+
+import cv2
+
+from video.ffmpeg_writer import get_ffmpeg_exe
+
+_PTS_TIME = re.compile(rb"pts_time:\s*(-?[0-9.]+)")
+
+
+class VideoInfo:
+    def __init__(self, width, height, fps, frame_count):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frame_count = frame_count
+
+
+def probe_video(file_path):
+    capture = cv2.VideoCapture(file_path)
+    if not capture.isOpened():
+        raise IOError(f"Cannot open video: {file_path}")
+    try:
+        return VideoInfo(int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                         capture.get(cv2.CAP_PROP_FPS), int(capture.get(cv2.CAP_PROP_FRAME_COUNT)))
+    finally:
+        capture.release()
+
+
+def probe_keyframe_times(file_path):
+    # キーフレームの表示時刻（秒）を返す。ffprobe があればそれを使い、なければ ffmpeg の showinfo で読む。
+    # どちらもキーフレーム以外はデコードしないので、動画全体を読むより十分速い
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe is not None:
+        command = [ffprobe, "-v", "error", "-select_streams", "v:0", "-skip_frame", "nokey",
+                   "-show_entries", "frame=pts_time", "-of", "csv=p=0", file_path]
+        result = subprocess.run(command, capture_output=True)
+        if result.returncode == 0:
+            times = []
+            for line in result.stdout.split():
+                try:
+                    times.append(float(line.strip(b",")))
+                except ValueError:
+                    continue
+            return sorted(times)
+
+    command = [get_ffmpeg_exe(), "-hide_banner", "-nostats", "-skip_frame", "nokey", "-i", file_path,
+               "-map", "0:v:0", "-vf", "showinfo", "-f", "null", "-"]
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Cannot read keyframes: {result.stderr.decode(errors='replace').strip()}")
+    return sorted(float(match) for match in _PTS_TIME.findall(result.stderr))
+
+
+def probe_keyframes(file_path, fps=None):
+    # キーフレームのフレーム番号（固定フレームレートとして時刻から換算する）
+    if fps is None:
+        fps = probe_video(file_path).fps
+    return keyframe_indices(probe_keyframe_times(file_path), fps)
+
+
+def keyframe_indices(times, fps):
+    if not times:
+        return [0]
+    start = times[0]
+    return sorted({int(round((t - start) * fps)) for t in times})
@@ -0,0 +1,167 @@
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_EXCEPTION
+
+import cv2
+
+from video.checkpoint import ExportCheckpoint, export_params
+from video.ffmpeg_writer import FFmpegWriter
+from video.memo import FrameMemo
+from video.pipeline import DEFAULT_WORKERS
+
+# ワーカー数より多めに区切って、長さの違う区間でも負荷が偏らないようにする
+DEFAULT_SEGMENTS_PER_WORKER = 4
+# ワーカーから進捗を送る間隔（フレーム数）
+REPORT_EVERY = 8
+
+# ワーカープロセスごとに一度だけ受け取るもの
+_frame_processor = None
+_cancel_event = None
+_progress_queue = None
+_memo = None
+
+
+def _init_worker(frame_processor, cancel_event, progress_queue, memo_threshold=None):
+    global _frame_processor, _cancel_event, _progress_queue, _memo
+    _frame_processor = frame_processor
+    _cancel_event = cancel_event
+    _progress_queue = progress_queue
+    _memo = FrameMemo(frame_processor, memo_threshold) if memo_threshold is not None else None
+
+
+def _report(report):
+    memo_stats = _memo.drain() if _memo is not None else None
+    _progress_queue.put(tuple(report) + (memo_stats,))
+
+
+def _export_segment(source_path, start, end, temp_path, segment_path, encoder_options):
+    # 1区間をデコード → 処理 → エンコードし、閉じてから segment_path へ置き換える。中止されたら None を返す
+    capture = cv2.VideoCapture(source_path)
+    if not capture.isOpened():
+        raise IOError(f"Cannot open video: {source_path}")
+    if start > 0:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+    width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    writer = FFmpegWriter(temp_path, width, height, fps, **encoder_options)
+
+    process = _memo.apply if _memo is not None else _frame_processor
+    written = 0
+    report = [0, 0.0, 0.0, 0.0]  # フレーム数, デコード, 処理, エンコード（秒）
+    try:
+        for _ in range(start, end):
+            if _cancel_event.is_set():
+                writer.abort()
+                return None
+            t0 = time.perf_counter()
+            ret, frame = capture.read()
+            if not ret:
+                break
+            t1 = time.perf_counter()
+            processed = process(frame)
+            t2 = time.perf_counter()
+            writer.write(processed)
+            t3 = time.perf_counter()
+            written += 1
+            report[0] += 1
+            report[1] += t1 - t0
+            report[2] += t2 - t1
+            report[3] += t3 - t2
+            if report[0] == REPORT_EVERY:
+                _report(report)
+                report = [0, 0.0, 0.0, 0.0]
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        capture.release()
+    if report[0]:
+        _report(report)
+    writer.release()
+    os.replace(temp_path, segment_path)
+    return written
+
+
+class SegmentedExporter:
+    # キーフレーム位置で動画を区間に分け、区間ごとにワーカープロセスでデコード・処理・エンコードする。
+    # 区間の計画と完了の記録は ExportCheckpoint（直列・並列の書き出しと共通）。
+    # 最後に区間をストリームコピーでつなぎ、元の音声を付ける（再エンコードなし）。
+    # エンコードも並列になるので、長い動画ではコア数にほぼ比例して速くなる
+    def __init__(self, frame_processor, workers=DEFAULT_WORKERS, segments_per_worker=DEFAULT_SEGMENTS_PER_WORKER,
+                 encoder_options=None, memo_threshold=None):
+        self.frame_processor = frame_processor
+        self.workers = max(1, int(workers))
+        self.segments_per_worker = max(1, int(segments_per_worker))
+        self.encoder_options = encoder_options or {}
+        self.memo_threshold = memo_threshold
+        self._context = multiprocessing.get_context("spawn")
+        self._cancel_event = self._context.Event()
+
+    def run(self, source_path, output_path, progress=None):
+        # 中止されたら False を返す（出力ファイルは作らない）。run より前に cancel されていても止まる。
+        # 終わった区間は出力先ごとの作業フォルダに残るので、同じ設定で書き出し直すと残りの区間だけを処理する
+        checkpoint = ExportCheckpoint.open(source_path, output_path,
+                                           export_params(self.frame_processor, self.encoder_options,
+                                                         self.memo_threshold),
+                                           count=self.workers * self.segments_per_worker)
+        if progress is not None:
+            progress.advance(checkpoint.frames_done())
+            progress.start(checkpoint.frame_count)
+
+        chunks = checkpoint.chunks
+        pending_chunks = checkpoint.pending()
+        progress_queue = self._context.Queue()
+        try:
+            if pending_chunks:
+                with ProcessPoolExecutor(max_workers=min(self.workers, len(pending_chunks)),
+                                         mp_context=self._context, initializer=_init_worker,
+                                         initargs=(self.frame_processor, self._cancel_event, progress_queue,
+                                                   self.memo_threshold)) as executor:
+                    futures = {executor.submit(_export_segment, source_path, *chunks[chunk],
+                                               checkpoint.temp_chunk_path(chunk), checkpoint.chunk_path(chunk),
+                                               self.encoder_options): chunk
+                               for chunk in pending_chunks}
+                    remaining = set(futures)
+                    try:
+                        while remaining:
+                            done, remaining = wait(remaining, timeout=0.1, return_when=FIRST_EXCEPTION)
+                            self._drain(progress_queue, progress)
+                            for future in done:
+                                if future.exception() is not None:
+                                    raise future.exception()
+                                if future.result() is not None:
+                                    checkpoint.mark_done(futures[future])
+                    finally:
+                        if remaining:
+                            # 失敗した区間があれば残りも止める
+                            self._cancel_event.set()
+                            for future in remaining:
+                                future.cancel()
+                self._drain(progress_queue, progress)
+
+            if self._cancel_event.is_set():
+                return False
+            checkpoint.finalize(output_path, audio_source=source_path)
+            return True
+        finally:
+            progress_queue.close()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def _drain(self, progress_queue, progress):
+        while True:
+            try:
+                frames, decode, process, encode, memo_stats = progress_queue.get_nowait()
+            except queue.Empty:
+                return
+            if progress is not None:
+                progress.add_stage_time("decode", decode, frames)
+                progress.add_stage_time("process", process, frames)
+                progress.add_stage_time("encode", encode, frames)
+                if memo_stats is not None:
+                    progress.add_memo_stats(*memo_stats)
+                progress.advance(frames)
@@ -0,0 +1,60 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+# アプリは src/ を作業フォルダにして起動する（パッケージ化していない）ので、同じように import できるようにする
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+class ListWriter:
+    # 書き出し先の代わり。書かれたフレームを溜めるだけ
+    def __init__(self):
+        self.frames = []
+
+    def write(self, frame):
+        self.frames.append(frame.copy())
+
+    def release(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+STATIC_FRAME_COUNT = 40
+STATIC_FPS = 10
+
+
+@pytest.fixture
+def static_video(tmp_path):
+    # 模様のある同じフレームが続く区間を2つ含む短い動画（画面収録のような素材）
+    path = str(tmp_path / "static.avi")
+    rng = np.random.default_rng(0)
+    patterns = [rng.integers(0, 256, (48, 64, 3), dtype=np.uint8) for _ in range(2)]
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), STATIC_FPS, (64, 48))
+    for i in range(STATIC_FRAME_COUNT):
+        writer.write(patterns[i * 2 // STATIC_FRAME_COUNT])
+    writer.release()
+    return path
+
+
+@pytest.fixture
+def processing_chain():
+    # 恒等でないトーンカーブと先鋭化（恒等のステージは compile() で消えて何も処理されない）
+    from processing.chain import ProcessingChain
+    from processing.sharpening import SharpeningProcessor
+    from processing.tonecurve import TonecurveProcessor
+
+    curve = np.clip((np.arange(256) / 255) ** 0.8 * 255 + 0.5, 0, 255).astype(np.uint8)
+    chain = ProcessingChain([TonecurveProcessor([curve] * 3),
+                             SharpeningProcessor(radius=2, amount=1.5, enabled=True)], channel_order="BGR")
+    assert len(chain.compile()) == 2
+    return chain
+
+
+@pytest.fixture
+def list_writer():
+    return ListWriter()
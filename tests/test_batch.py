@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+from batch import process_video
+
+from conftest import STATIC_FRAME_COUNT
+
+
+class FailingProcessor:
+    # 途中のフレームで失敗する処理
+    def __init__(self, fail_at):
+        self.fail_at = fail_at
+        self.calls = 0
+
+    def apply(self, image, out=None):
+        self.calls += 1
+        if self.calls == self.fail_at:
+            raise ValueError("processing failed")
+        return image
+
+
+def test_failed_video_keeps_error_and_removes_output(static_video, tmp_path):
+    output_path = str(tmp_path / "out.mp4")
+    with pytest.raises(ValueError, match="processing failed"):
+        process_video(FailingProcessor(STATIC_FRAME_COUNT // 2), static_video, output_path)
+    assert not os.path.exists(output_path)
+
+
+def test_video_is_written(static_video, processing_chain, tmp_path):
+    output_path = str(tmp_path / "out.mp4")
+    frames, _, hit_rate = process_video(processing_chain, static_video, output_path)
+    assert frames == STATIC_FRAME_COUNT
+    assert hit_rate is None
+    assert os.path.getsize(output_path) > 0
@@ -0,0 +1,18 @@
+import pytest
+
+import benchmark
+
+
+def report(version, fps):
+    return {"version": version, "results": [{"case": "display", "size": "1080p", "throughput_fps": fps}]}
+
+
+def test_compare_flags_regressions():
+    current = report(benchmark.BENCHMARK_VERSION, 80.0)
+    rows = benchmark.compare(report(benchmark.BENCHMARK_VERSION, 100.0), current, threshold=0.1)
+    assert rows[0]["regression"]
+
+
+def test_compare_refuses_other_versions():
+    with pytest.raises(ValueError):
+        benchmark.compare(report(benchmark.BENCHMARK_VERSION - 1, 100.0), report(benchmark.BENCHMARK_VERSION, 100.0))
@@ -0,0 +1,79 @@
+import cv2
+import numpy as np
+
+from video.checkpoint import ExportCheckpoint, ChunkedWriter, export_params
+
+from conftest import STATIC_FRAME_COUNT
+from test_memo import read_frames
+
+# threads=1 で同じ入力から同じビットストリームになるようにする
+ENCODER_OPTIONS = {"codec": "libx264", "crf": 18, "preset": "ultrafast", "threads": 1}
+CHUNK_SECONDS = 2.0
+
+
+def open_checkpoint(video, output, chain, memo_threshold=None):
+    params = export_params(chain, ENCODER_OPTIONS, memo_threshold)
+    return ExportCheckpoint.open(video, output, params, chunk_seconds=CHUNK_SECONDS)
+
+
+def export_runs(video, checkpoint, chain, stop_after=None):
+    # 未完了のチャンクを処理して書く。stop_after フレームで中止したのと同じように書きかけを捨てる
+    capture = cv2.VideoCapture(video)
+    written = 0
+    try:
+        for first, last in checkpoint.pending_runs():
+            start, end = checkpoint.chunks[first][0], checkpoint.chunks[last][1]
+            capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+            out = ChunkedWriter(checkpoint, first, last, ENCODER_OPTIONS)
+            for _ in range(end - start):
+                if stop_after is not None and written == stop_after:
+                    out.abort()
+                    return False
+                ret, frame = capture.read()
+                out.write(chain.apply(frame))
+                written += 1
+            out.release()
+    finally:
+        capture.release()
+    return True
+
+
+def test_resumed_export_matches_uninterrupted(static_video, processing_chain, tmp_path):
+    whole = str(tmp_path / "whole.mp4")
+    checkpoint = open_checkpoint(static_video, whole, processing_chain)
+    assert export_runs(static_video, checkpoint, processing_chain)
+    checkpoint.finalize(whole)
+
+    resumed = str(tmp_path / "resumed.mp4")
+    checkpoint = open_checkpoint(static_video, resumed, processing_chain)
+    assert len(checkpoint.chunks) == 2
+    first_chunk = checkpoint.chunks[0][1]
+    assert not export_runs(static_video, checkpoint, processing_chain, stop_after=first_chunk + 3)
+    checkpoint = open_checkpoint(static_video, resumed, processing_chain)
+    assert checkpoint.pending() == [1]
+    assert export_runs(static_video, checkpoint, processing_chain)
+    checkpoint.finalize(resumed)
+
+    expected = read_frames(whole)
+    result = read_frames(resumed)
+    assert len(result) == len(expected) == STATIC_FRAME_COUNT
+    assert all(np.array_equal(a, b) for a, b in zip(result, expected))
+    # 処理された映像であること（恒等のチェーンでは比べる意味がない）
+    source = read_frames(static_video)
+    assert np.abs(result[0].astype(int) - source[0].astype(int)).mean() > 5
+
+
+def test_resume_requires_same_memo_setting(static_video, processing_chain, tmp_path):
+    output = str(tmp_path / "out.mp4")
+    checkpoint = open_checkpoint(static_video, output, processing_chain)
+    checkpoint.mark_done(0)
+    open(checkpoint.chunk_path(0), "wb").close()
+
+    assert open_checkpoint(static_video, output, processing_chain).is_done(0)
+    # 使い回しの有無や許容値が違うチャンクはつなげない
+    assert not open_checkpoint(static_video, output, processing_chain, 2.0).is_done(0)
+    checkpoint = open_checkpoint(static_video, output, processing_chain, 2.0)
+    checkpoint.mark_done(0)
+    open(checkpoint.chunk_path(0), "wb").close()
+    assert not open_checkpoint(static_video, output, processing_chain, 0.0).is_done(0)
+    open_checkpoint(static_video, output, processing_chain, 0.0).discard()
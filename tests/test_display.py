@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+
+from display import DisplayEngine, FAST, QUALITY
+
+
+@pytest.mark.parametrize("shape", [(60, 80), (60, 80, 4)])
+@pytest.mark.parametrize("quality", [FAST, QUALITY])
+def test_compose_gray_and_rgba(shape, quality):
+    image = np.full(shape, 180, dtype=np.uint8)
+    engine = DisplayEngine()
+    engine.set_image(image)
+    buffer = engine.compose(100, 100, quality=quality)
+    assert buffer.shape == (100, 100, 3)
+    # 画像は中央に描かれる（黒のままではない）
+    assert (buffer[50, 50] == 180).all()
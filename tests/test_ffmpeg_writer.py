@@ -0,0 +1,61 @@
+import cv2
+import numpy as np
+import pytest
+
+from video.ffmpeg_writer import FFmpegWriter, crf_to_qscale
+
+from test_memo import read_frames
+
+
+def textured_frames(width, height, count=10):
+    # なめらかな模様が少しずつ動く（エンコーダに画質の差が出る程度の細かさ）
+    y, x = np.mgrid[0:height, 0:width]
+    frames = []
+    for i in range(count):
+        base = 128 + 100 * np.sin((x + 3 * i) / 7.0) * np.cos((y - 2 * i) / 11.0)
+        frame = np.stack([base, np.roll(base, 5, axis=1), 255 - base], axis=-1)
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+    return frames
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return 10 * np.log10(255 ** 2 / max(mse, 1e-10))
+
+
+def write_video(path, frames, codec, crf=18):
+    height, width = frames[0].shape[:2]
+    writer = FFmpegWriter(path, width, height, 30, codec=codec, crf=crf, preset="ultrafast")
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+
+
+def test_crf_to_qscale_is_monotonic():
+    values = [crf_to_qscale(crf) for crf in range(52)]
+    assert values[0] == 1 and values[-1] == 31
+    assert values == sorted(values)
+
+
+def test_mpeg4_uses_crf_for_quality(tmp_path):
+    frames = textured_frames(1280, 720)
+    high = str(tmp_path / "high.mp4")
+    low = str(tmp_path / "low.mp4")
+    write_video(high, frames, "mpeg4", crf=18)
+    write_video(low, frames, "mpeg4", crf=40)
+    high_psnr = np.mean([psnr(a, b) for a, b in zip(read_frames(high), frames)])
+    low_psnr = np.mean([psnr(a, b) for a, b in zip(read_frames(low), frames)])
+    assert high_psnr > low_psnr
+    # 既定の 200kb/s なら 720p で大きく崩れる
+    assert high_psnr > 30
+
+
+@pytest.mark.parametrize("codec", ["libx264", "mpeg4"])
+def test_odd_frame_size_is_padded_to_even(tmp_path, codec):
+    frames = textured_frames(63, 47, count=3)
+    path = str(tmp_path / "odd.mp4")
+    write_video(path, frames, codec)
+    decoded = read_frames(path)
+    assert len(decoded) == 3
+    assert decoded[0].shape == (48, 64, 3)
+    assert psnr(decoded[0][:47, :63], frames[0]) > 25
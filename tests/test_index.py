@@ -0,0 +1,56 @@
+import subprocess
+
+import cv2
+import numpy as np
+import pytest
+
+from video.ffmpeg_writer import get_ffmpeg_exe
+from video.index import build_video_index, seek_capture
+
+FRAME_COUNT = 60
+GOP = 12
+
+
+@pytest.fixture
+def gop_video(tmp_path):
+    # 12 フレームごとにキーフレームがある H.264。フレームごとに模様が違う
+    path = str(tmp_path / "gop.mp4")
+    command = [get_ffmpeg_exe(), "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "bgr24",
+               "-s", "64x48", "-r", "30", "-i", "-", "-c:v", "libx264", "-preset", "ultrafast",
+               "-g", str(GOP), "-keyint_min", str(GOP), "-sc_threshold", "0", "-pix_fmt", "yuv420p", path]
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 256, (FRAME_COUNT, 48, 64, 3), dtype=np.uint8)
+    subprocess.run(command, input=frames.tobytes(), check=True)
+    return path
+
+
+def decode_all(path):
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+def test_seek_reaches_non_keyframe_targets(gop_video):
+    index = build_video_index(gop_video, thumbnail_count=4)
+    assert index.keyframes[:3] == [0, GOP, 2 * GOP]
+    expected = decode_all(gop_video)
+    capture = cv2.VideoCapture(gop_video)
+    try:
+        position = None
+        # 飛ぶ・戻る・同じ区間で進む、のすべてを通す
+        for target in (37, 5, 7, 50, 29, 30):
+            assert target not in index.keyframes
+            position = seek_capture(capture, position, target, index)
+            assert position == target
+            ret, frame = capture.read()
+            assert ret
+            assert np.array_equal(frame, expected[target]), target
+            position += 1
+    finally:
+        capture.release()
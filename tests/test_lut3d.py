@@ -0,0 +1,56 @@
+import numpy as np
+
+from processing.chain import ProcessingChain
+from processing.lut3d import Lut3D, Lut3DProcessor, identity_table
+from processing.tonecurve import TonecurveProcessor
+
+
+def gamma_curve(gamma):
+    return [np.clip((np.arange(256) / 255) ** gamma * 255 + 0.5, 0, 255).astype(np.uint8)] * 3
+
+
+def test_dense_table_matches_trilinear_sample():
+    rng = np.random.default_rng(0)
+    lut = Lut3D(rng.random((17, 17, 17, 3), dtype=np.float32))
+    image = rng.integers(0, 256, (32, 32, 3), dtype=np.uint8)
+    expected = np.clip(lut.sample(image.astype(np.float32) / 255) * 255 + 0.5, 0, 255)
+    for channel_order in ("RGB", "BGR"):
+        source = image if channel_order == "RGB" else image[..., ::-1].copy()
+        result = lut.apply(source, channel_order=channel_order)
+        if channel_order == "BGR":
+            result = result[..., ::-1]
+        assert np.abs(result.astype(int) - expected.astype(int)).max() <= 1
+
+
+def test_rebuilt_chain_reuses_fused_lut3d():
+    lut = Lut3DProcessor(Lut3D(identity_table(9) ** 1.2))
+    first = ProcessingChain([TonecurveProcessor(gamma_curve(1.1)), lut]).compile()[0]
+    first.dense_table()
+    second = ProcessingChain([TonecurveProcessor(gamma_curve(1.1)), lut]).compile()[0]
+    assert second is first
+    assert "RGB" in second.tables
+    changed = ProcessingChain([TonecurveProcessor(gamma_curve(1.3)), lut]).compile()[0]
+    assert changed is not first
+
+
+def test_rgba_keeps_alpha():
+    rng = np.random.default_rng(1)
+    lut = Lut3D(rng.random((9, 9, 9, 3), dtype=np.float32))
+    image = rng.integers(0, 256, (16, 24, 4), dtype=np.uint8)
+    expected = lut.apply(np.ascontiguousarray(image[..., :3]))
+    in_place = image.copy()
+    for source, out in ((image, None), (image, np.empty_like(image)), (in_place, in_place)):
+        result = lut.apply(source, out=out)
+        assert result.shape == image.shape
+        assert np.array_equal(result[..., :3], expected)
+        assert np.array_equal(result[..., 3], image[..., 3])
+
+
+def test_chain_with_lut3d_accepts_rgba():
+    curve = gamma_curve(1.2)
+    lut = Lut3DProcessor(Lut3D(identity_table(9) ** 0.9))
+    image = np.random.default_rng(2).integers(0, 256, (8, 8, 4), dtype=np.uint8)
+    chain = ProcessingChain([TonecurveProcessor(curve), lut])
+    result = chain.apply(image)
+    assert np.array_equal(result[..., 3], image[..., 3])
+    assert not np.array_equal(result[..., :3], image[..., :3])
@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+import main
+from profiling import FrameProfiler, NULL_PROFILER
+from progress import ProgressChannel
+from video.pipeline import ParallelFramePipeline
+
+from conftest import STATIC_FRAME_COUNT
+
+
+def read_frames(path):
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+def serial_export(video, chain, memo_threshold, profiler=NULL_PROFILER, progress=None):
+    capture = cv2.VideoCapture(video)
+    frames = []
+    writer = SimpleNamespace(write=lambda frame: frames.append(frame.copy()))
+    try:
+        main.ImageProcessingApp._encode_frames(SimpleNamespace(), capture, writer, STATIC_FRAME_COUNT, chain, False,
+                                               {"memo_threshold": memo_threshold}, progress or ProgressChannel(),
+                                               profiler)
+    finally:
+        capture.release()
+    return frames
+
+
+def test_serial_export_with_memo(static_video, processing_chain):
+    progress = ProgressChannel()
+    progress.start(STATIC_FRAME_COUNT)
+    frames = serial_export(static_video, processing_chain, 0.0, FrameProfiler(), progress)
+    assert len(frames) == STATIC_FRAME_COUNT
+    assert progress.snapshot()["memo_hit_rate"] > 0
+    assert not np.array_equal(frames[0], read_frames(static_video)[0])
+
+
+def test_profiled_parallel_export_with_memo(static_video, processing_chain, list_writer):
+    capture = cv2.VideoCapture(static_video)
+    pipeline = ParallelFramePipeline(processing_chain, workers=2, batch_size=4, memo_threshold=0.0)
+    try:
+        pipeline.run(capture, list_writer, STATIC_FRAME_COUNT, progress=ProgressChannel(), profiler=FrameProfiler())
+    finally:
+        capture.release()
+    expected = [processing_chain.apply(frame) for frame in read_frames(static_video)]
+    assert len(list_writer.frames) == STATIC_FRAME_COUNT
+    assert all(np.array_equal(a, b) for a, b in zip(list_writer.frames, expected))
+
+
+def test_memo_matches_unmemoized_output(static_video, processing_chain):
+    source = read_frames(static_video)
+    memoized = serial_export(static_video, processing_chain, 0.0)
+    plain = serial_export(static_video, processing_chain, None)
+    assert len(memoized) == len(plain) == STATIC_FRAME_COUNT
+    assert all(np.array_equal(a, b) for a, b in zip(memoized, plain))
+    assert not any(np.array_equal(a, b) for a, b in zip(plain, source))
+
+
+def test_threshold_controls_reuse(static_video, processing_chain):
+    from video.memo import FrameMemo
+
+    frame = read_frames(static_video)[0]
+    nudged = frame.copy()
+    nudged[0, 0] ^= 1
+    exact = FrameMemo(processing_chain, 0.0)
+    first = exact.apply(frame)
+    assert not np.array_equal(first, frame)
+    # 1画素でも違えば処理し直す
+    assert np.array_equal(exact.apply(nudged), processing_chain.apply(nudged))
+    assert exact.hits == 0
+    loose = FrameMemo(processing_chain, 1.0)
+    loose.apply(frame)
+    assert loose.apply(nudged) is not None and loose.hits == 1
@@ -0,0 +1,53 @@
+import json
+import tracemalloc
+
+import numpy as np
+
+from profiling import FrameProfiler
+
+MB = 1024 * 1024
+
+
+def test_peak_includes_temporary_numpy_buffers():
+    profiler = FrameProfiler(trace_memory=True)
+    try:
+        with profiler.stage("temporary"):
+            # 確保してすぐ解放しても、ステージの間のピークには出る
+            np.ones(4 * MB, dtype=np.uint8).sum()
+        with profiler.stage("idle"):
+            pass
+    finally:
+        profiler.close()
+    assert not tracemalloc.is_tracing()
+    summary = profiler.summary()
+    assert summary["temporary"]["peak_kb_mean"] >= 4 * 1024
+    assert summary["idle"]["peak_kb_mean"] < 64
+    assert "peak KB" in profiler.format_summary()
+
+
+def test_nested_stage_keeps_outer_peak():
+    profiler = FrameProfiler(trace_memory=True)
+    try:
+        with profiler.stage("outer"):
+            np.ones(8 * MB, dtype=np.uint8).sum()
+            # 内側のステージでピークを測り直しても、外側のピークは失われない
+            with profiler.stage("inner"):
+                np.ones(2 * MB, dtype=np.uint8).sum()
+    finally:
+        profiler.close()
+    summary = profiler.summary()
+    assert summary["outer"]["peak_kb_mean"] >= 8 * 1024
+    assert 2 * 1024 <= summary["inner"]["peak_kb_mean"] < 8 * 1024
+
+
+def test_memory_column_is_omitted_without_tracing(tmp_path):
+    profiler = FrameProfiler()
+    with profiler.stage("decode", 0):
+        np.ones((256, 256), dtype=np.uint8)
+    assert profiler.summary()["decode"]["peak_kb_mean"] == 0
+    assert "peak KB" not in profiler.format_summary()
+    path = str(tmp_path / "trace.json")
+    profiler.export_chrome_trace(path)
+    with open(path) as f:
+        event = json.load(f)["traceEvents"][0]
+    assert event["args"] == {"frame": 0}
@@ -0,0 +1,84 @@
+import os
+import struct
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from processing.chain import ProcessingChain
+from processing.sharpening import SharpeningProcessor
+from processing.tiling import (open_image_source, image_pixels, process_tiled, RawStripSource, MAX_IMAGE_PIXELS,
+                              WORKING_COPIES)
+
+
+class FailingProcessor:
+    def __init__(self, fail_after):
+        self.calls = 0
+        self.fail_after = fail_after
+
+    def halo(self):
+        return 0
+
+    def apply(self, image, channel_order="RGB"):
+        self.calls += 1
+        if self.calls > self.fail_after:
+            raise RuntimeError("processing failed")
+        return image
+
+
+@pytest.fixture
+def bmp_path(tmp_path):
+    path = str(tmp_path / "input.bmp")
+    rng = np.random.default_rng(0)
+    Image.fromarray(rng.integers(0, 256, (120, 90, 3), dtype=np.uint8)).save(path)
+    return path
+
+
+def huge_bmp_header(path, width, height):
+    # 画素データを書かない（疎なファイルにする）BMP。メモリマップで開けるが、ディスクはほとんど使わない
+    row_bytes = (width * 3 + 3) // 4 * 4
+    with open(path, "wb") as f:
+        f.write(b"BM" + struct.pack("<IHHI", 54 + row_bytes * height, 0, 0, 54))
+        f.write(struct.pack("<IiiHHIIiiII", 40, width, height, 1, 24, 0, row_bytes * height, 0, 0, 0, 0))
+        f.truncate(54 + row_bytes * height)
+
+
+def test_pixel_limit_is_raised_only_for_tiled_open(tmp_path):
+    path = str(tmp_path / "huge.bmp")
+    huge_bmp_header(path, 20000, 10000)
+    default = Image.MAX_IMAGE_PIXELS
+    assert default < MAX_IMAGE_PIXELS
+    assert image_pixels(path) == 200_000_000
+    source = open_image_source(path)
+    assert isinstance(source, RawStripSource) and source.width == 20000
+    # 通常の読み込みでは PIL の展開爆弾の検査がそのまま効く
+    assert Image.MAX_IMAGE_PIXELS == default
+    with pytest.raises(Image.DecompressionBombError):
+        Image.open(path)
+
+
+@pytest.mark.parametrize("extension", [".tif", ".png"])
+def test_tiled_output_matches_whole_image(bmp_path, tmp_path, extension):
+    source = open_image_source(bmp_path)
+    assert isinstance(source, RawStripSource)
+    chain = ProcessingChain([SharpeningProcessor(radius=2, amount=1.5, enabled=True)])
+    halo = chain.halo()
+    assert halo > 0
+    # 帯が 29 行になる予算。120 行を割り切れないので、最後の帯は短くなる
+    rows = 29
+    assert source.height % rows
+    output = str(tmp_path / ("out" + extension))
+    process_tiled(source, output, chain, memory_budget=(rows + 2 * halo) * source.width * 3 * WORKING_COPIES)
+    original = np.asarray(Image.open(bmp_path))
+    expected = chain.apply(original)
+    assert not np.array_equal(expected, original)
+    assert np.array_equal(np.asarray(Image.open(output)), expected)
+
+
+@pytest.mark.parametrize("extension", [".tif", ".png"])
+def test_failed_tiled_export_keeps_error_and_removes_output(bmp_path, tmp_path, extension):
+    output = str(tmp_path / ("out" + extension))
+    with pytest.raises(RuntimeError, match="processing failed"):
+        process_tiled(open_image_source(bmp_path), output, FailingProcessor(fail_after=2),
+                      memory_budget=90 * 3 * 5 * 20)
+    assert not os.path.exists(output)